@@ -1,6 +1,7 @@
 """
 Base settings to build other settings files upon.
 """
+import os
 from pathlib import Path
 
 import environ
@@ -68,6 +69,7 @@ DJANGO_APPS = [
     'django.contrib.staticfiles',
     # 'django.contrib.humanize', # Handy template tags
     'django.contrib.admin',
+    'django.contrib.postgres',
 ]
 THIRD_PARTY_APPS = [
     'crispy_forms',
@@ -313,13 +315,19 @@ CELERY_BROKER_POOL_LIMIT = None
 CELERY_BROKER_CONNECTION_MAX_RETRIES = 10
 
 CELERY_IMPORTS = ('miseq_portal.analysis.tasks',
-                  'miseq_portal.sample_merge.tasks')
+                  'miseq_portal.sample_merge.tasks',
+                  'miseq_portal.miseq_viewer.tasks',
+                  'miseq_portal.miseq_uploader.tasks')
 
 # Assemblies and regular analysis tasks are split across two separate routes.
 # These routes must be specified in the .apply_async() method calls to @shared_task functions.
 CELERY_ROUTES = {
     'miseq_portal.analysis.tasks.submit_analysis_job': {'queue': 'analysis_queue'},
+    'miseq_portal.analysis.tasks.submit_analysis_sample_job': {'queue': 'analysis_queue'},
+    'miseq_portal.analysis.tasks.finalize_analysis_group': {'queue': 'analysis_queue'},
     'miseq_portal.analysis.tools.assemble_run.assemble_sample_instance': {'queue': 'assembly_queue'},
+    'miseq_portal.miseq_viewer.tasks.build_qaqc_report': {'queue': 'report_queue'},
+    'miseq_portal.miseq_uploader.tasks.ingest_miseq_run': {'queue': 'ingest_queue'},
 }
 
 # REST FRAMEWORK
@@ -344,10 +352,70 @@ REST_FRAMEWORK = {
 # Might help with huge uploads
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880 * 2  # 10 MB
 
-# to pass to tools with an Xmx option
+# to pass to tools with an Xmx option. This is the most memory any single JVM will request from the resource broker.
 JAVA_MAX_HEAP = "65g"
 
+# Node-level resource broker for external tools (see miseq_portal.analysis.tools.resources). The directory must be
+# local to each node so every worker process on that node shares the same reservation ledger.
+RESOURCE_BROKER_DIR = Path('/tmp/miseq_portal_resources')
+RESOURCE_BROKER_CPUS = os.cpu_count()
+RESOURCE_BROKER_MEMORY_GB = int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 3)
+
 # ASSEMBLY PIPELINE SETTINGS
+# Maximum number of independent assembly stages (e.g. quast, prodigal, confindr, mash) run at the same time
+ASSEMBLY_STAGE_MAX_WORKERS = 4
+# Stream repair.sh -> bbduk.sh -> bbduk.sh through pipes instead of writing compressed reads to disk after every step
+ASSEMBLY_STREAMING_PREPROCESSING = True
+
+# ANALYSIS RESULT CACHE SETTINGS (see miseq_portal.analysis.tools.result_cache)
+# Seconds between checks while waiting on an identical job that is already running
+RESULT_CACHE_POLL_INTERVAL = 10
+# A running cache entry that has not completed after this many hours is assumed to belong to a dead worker
+RESULT_CACHE_STALE_HOURS = 12
+# rMLST results come from a remote database that is updated independently of this portal
+RMLST_RESULT_CACHE_DAYS = 30
+
+# rMLST SETTINGS (see miseq_portal.analysis.tools.rmlst)
+# Point RMLST_URI at a local stand-in server (e.g. http://localhost:8081/sequence) to test or load-test offline
+RMLST_URI = env('RMLST_URI', default='https://rest.pubmlst.org/db/pubmlst_rmlst_seqdef_kiosk/schemes/1/sequence')
+# Maximum number of simultaneous requests made to RMLST_URI by a single rMLST job
+RMLST_MAX_CONCURRENCY = env.int('RMLST_MAX_CONCURRENCY', default=4)
+# Seconds to wait for a response; the kiosk can take several minutes on large assemblies
+RMLST_TIMEOUT = 600
+RMLST_MAX_RETRIES = 5
+# Responses are cached by assembly checksum and expire after RMLST_RESULT_CACHE_DAYS
+RMLST_CACHE_DIR = Path(MEDIA_ROOT) / 'resources' / 'rmlst_cache'
+
+# QA/QC REPORT SETTINGS (see miseq_portal.miseq_viewer.qaqc_report)
+# Number of samples fetched per query while writing a report
+QAQC_REPORT_BATCH_SIZE = 500
+# Selections larger than this are built by a Celery task instead of during the request
+QAQC_REPORT_ASYNC_THRESHOLD = 500
+# Seconds after which a report that has not been written is shown to the user as failed
+QAQC_REPORT_TIMEOUT = 60 * 60
+
+# PORTAL STATISTICS SETTINGS (see miseq_portal.miseq_viewer.statistics)
+# Seconds before the cached landing page statistics are recomputed from the database, which corrects any drift in the
+# incremental updates applied between recomputations
+PORTAL_STATISTICS_TIMEOUT = 60 * 60
+
+# PROJECT PERMISSION SETTINGS (see miseq_portal.miseq_viewer.permissions)
+# Seconds the permitted project PKs of a user stay cached; changes to UserProjectRelationship invalidate them sooner
+PROJECT_PERMISSION_CACHE_TIMEOUT = 60 * 60 * 24
+
+# SAMPLE SEARCH SETTINGS (see miseq_portal.sample_search.index)
+# Default and maximum number of results per page of the search API
+SAMPLE_SEARCH_PAGE_SIZE = 50
+SAMPLE_SEARCH_MAX_PAGE_SIZE = 500
+# Rows fetched per round trip from the server-side cursor behind the streaming sample JSON endpoint
+SAMPLE_SEARCH_STREAM_CHUNK_SIZE = 2000
+
+# INGEST TRANSFER SETTINGS (see miseq_portal.miseq_uploader.transfer)
+# Number of files copied into MEDIA_ROOT at the same time while a run is ingested
+INGEST_TRANSFER_WORKERS = env.int('INGEST_TRANSFER_WORKERS', default=4)
+# Seconds an ingest_miseq_run task may run for; the default task time limits above are far too short to copy a run
+RUN_INGEST_TIME_LIMIT = env.int('RUN_INGEST_TIME_LIMIT', default=6 * 60 * 60)
+
 MOB_SUITE_PATH = Path("home/forest/miniconda3/envs/mob_suite/bin/")
 CONFINDR_EXE = Path("/home/forest/miniconda3/envs/confindr_v2/bin/confindr")
 RGI_EXE = Path("/home/forest/miniconda3/envs/rgi/bin/rgi")
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import AnalysisSample, AnalysisGroup, \
+from .models import AnalysisSample, AnalysisGroup, AnalysisResultCache, \
     SendsketchResult, MobSuiteAnalysisGroup, \
     MobSuiteAnalysisPlasmid, RGIResult, RGIGroupResult, MashResult, \
     ConfindrGroupResult, ConfindrResult, ConfindrResultAssembly, \
@@ -9,6 +9,7 @@ from .models import AnalysisSample, AnalysisGroup, \
 # Register your models here.
 admin.site.register(AnalysisSample)
 admin.site.register(AnalysisGroup)
+admin.site.register(AnalysisResultCache)
 admin.site.register(SendsketchResult)
 admin.site.register(MashResult)
 admin.site.register(MobSuiteAnalysisGroup)
@@ -0,0 +1,179 @@
+"""
+Bulk ingestion of analysis results into the database.
+
+Each report is parsed once into an index keyed by sample (or plasmid) ID. The result rows for every member of the group
+are then built in memory and written with bulk_create inside a single transaction, instead of a create() and save()
+round-trip per row.
+"""
+import logging
+from pathlib import Path
+
+import pandas as pd
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from miseq_portal.analysis.models import AnalysisSample, ConfindrResult, StxSampleResult, StxGeneResult, \
+    MobSuiteAnalysisGroup, MobSuiteAnalysisPlasmid, upload_mobsuite_file
+from miseq_portal.analysis.tools.plasmid_report import MobTyperPlasmid
+from miseq_portal.miseq_viewer.models import Sample
+
+logger = logging.getLogger('django')
+
+CONFINDR_RESULT_FIELDS = ('genus', 'num_contam_snvs', 'contam_status', 'percent_contam', 'percent_contam_std_dev',
+                          'bases_examined', 'database_download_date')
+
+# Maps keys of the per-sample values reported by the stx pipeline to StxSampleResult fields
+STX_SAMPLE_VALUE_FIELDS = {
+    'HC-Protein Allele': 'hc_protein_allele', 'HC-Distance': 'hc_distance', 'HC-Motif': 'hc_motif',
+    'HC-Contig': 'hc_contig', 'HC-Location': 'hc_location', 'NCBI-Stx Type': 'ncbi_stx_type',
+    'NCBI-Identity': 'ncbi_identity', 'NCBI-Operon': 'ncbi_operon', 'NCBI-Contig': 'ncbi_contig',
+    'NCBI-Location': 'ncbi_location', 'KMA-Nucleotide Allele': 'kma_nucleotide_allele',
+    'KMA-Identity': 'kma_identity', 'KMA-Depth': 'kma_depth'
+}
+
+# Maps keys of the per-sample files reported by the stx pipeline to StxSampleResult fields
+STX_SAMPLE_FILE_FIELDS = {
+    'kma': 'kma_report', 'stxtyper': 'stxtyper_report', 'stx1blast': 'blast_processed_stx1',
+    'stx2blast': 'blast_processed_stx2'
+}
+
+
+def index_report(df: pd.DataFrame, key: str) -> dict:
+    """
+    Indexes the rows of a report by one of its columns. Only the first row is kept for duplicate keys.
+    :param df: DataFrame of the report
+    :param key: Name of the column to index by
+    :return: Dictionary of {key value: row dictionary}
+    """
+    index = {}
+    for row in df.to_dict(orient='records'):
+        index.setdefault(str(row[key]), row)
+    return index
+
+
+def index_confindr_report(report_path: Path) -> dict:
+    """
+    Reads a ConFindr report once and indexes it by sample ID
+    :param report_path: Path to confindr_report.csv
+    :return: Dictionary of {sample ID: report row}
+    """
+    df = pd.read_csv(report_path, dtype={'Sample': str})
+    return index_report(df, key='Sample')
+
+
+def parse_confindr_row(row: dict, sample_id: str = None) -> dict:
+    """
+    Converts a row of the ConFindr report to ConfindrResult field values. A malformed row results in every value
+    being None.
+    :param row: Row of the ConFindr report
+    :param sample_id: Sample ID, for logging
+    :return: Dictionary of {ConfindrResult field: value}
+    """
+    try:
+        percent_contam = row['PercentContam']
+        percent_contam_std_dev = row['PercentContamStandardDeviation']
+        if percent_contam == "ND":
+            percent_contam = "nan"
+            percent_contam_std_dev = "nan"
+        return {
+            'genus': str(row['Genus']),
+            'num_contam_snvs': int(row['NumContamSNVs']),
+            'contam_status': str(row['ContamStatus']),
+            'percent_contam': float(percent_contam),
+            'percent_contam_std_dev': float(percent_contam_std_dev),
+            'bases_examined': int(row['BasesExamined']),
+            'database_download_date': parse_date(row['DatabaseDownloadDate']),
+        }
+    except Exception as e:
+        logger.warning(f"Something is wrong with the Confindr report for {sample_id}")
+        logger.warning(e)
+        return {field: None for field in CONFINDR_RESULT_FIELDS}
+
+
+def ingest_confindr_results(analysis_samples: [AnalysisSample], report_path: Path, outdir: Path) -> [ConfindrResult]:
+    """
+    Creates a ConfindrResult for every AnalysisSample of a ConFindr group job
+    :param analysis_samples: AnalysisSample objects of the group, ideally with sample_id selected
+    :param report_path: Path to the ConFindr report of the group
+    :param outdir: ConFindr output directory containing the per-sample CSV files
+    :return: List of created ConfindrResult objects
+    """
+    report_index = index_confindr_report(report_path)
+    confindr_results = []
+    for analysis_sample in analysis_samples:
+        sample_id = str(analysis_sample.sample_id)
+        row = report_index.get(sample_id)
+        values = parse_confindr_row(row, sample_id=sample_id) if row is not None else {}
+        confindr_results.append(ConfindrResult(analysis_sample=analysis_sample,
+                                               contamination_csv=str(outdir / f"{sample_id}_contamination.csv"),
+                                               rmlst_csv=str(outdir / f"{sample_id}_rmlstcsv"),
+                                               **values))
+    with transaction.atomic():
+        return ConfindrResult.objects.bulk_create(confindr_results)
+
+
+def ingest_stx_results(analysis_samples: [AnalysisSample], nf_info: dict, analysis_dir: Path) -> tuple:
+    """
+    Creates the StxSampleResult and StxGeneResult objects for every AnalysisSample of an Stx group job
+    :param analysis_samples: AnalysisSample objects of the group, ideally with sample_id selected
+    :param nf_info: Dictionary returned by query_stx()
+    :param analysis_dir: Output directory of the group relative to MEDIA_ROOT
+    :return: tuple(list of StxSampleResult, list of StxGeneResult)
+    """
+    persample_results = nf_info.get('persample_results', {})
+    persample_result_vals = nf_info.get('persample_result_vals', {})
+    perstx_results = nf_info.get('perstx_results', {})
+
+    sample_results = []
+    gene_results = []
+    for analysis_sample in analysis_samples:
+        sample_id = str(analysis_sample.sample_id)
+        sample_vals = persample_result_vals.get(sample_id, {})
+        sample_files = persample_results.get(sample_id, {})
+        values = {field: sample_vals.get(key, "") for key, field in STX_SAMPLE_VALUE_FIELDS.items()}
+        values.update({field: str(analysis_dir / sample_files[key]) if key in sample_files else ""
+                       for key, field in STX_SAMPLE_FILE_FIELDS.items()})
+        sample_results.append(StxSampleResult(analysis_sample=analysis_sample, **values))
+
+        for geneinfo, gene_files in perstx_results.get(sample_id, {}).items():
+            gene, contigandloc = geneinfo.split("_", 1)
+            contig, loc = contigandloc.rsplit("_", 1)
+            gene_results.append(StxGeneResult(
+                analysis_sample=analysis_sample,
+                gene=gene,
+                contig=contig,
+                loc=loc,
+                motif=str(analysis_dir / gene_files['motif']) if 'motif' in gene_files else "",
+                tree=str(analysis_dir / gene_files['tree']) if 'tree' in gene_files else "",
+                alignment=str(analysis_dir / gene_files['alignment']) if 'alignment' in gene_files else "",
+            ))
+
+    with transaction.atomic():
+        return StxSampleResult.objects.bulk_create(sample_results), StxGeneResult.objects.bulk_create(gene_results)
+
+
+def ingest_mob_suite_plasmids(mob_suite_analysis_group: MobSuiteAnalysisGroup, plasmid_fasta_list: [Path],
+                              root_sample_instance: Sample, mobsuite_dir_name: str) -> [MobSuiteAnalysisPlasmid]:
+    """
+    Creates a MobSuiteAnalysisPlasmid for every plasmid reconstructed by mob_recon
+    :param mob_suite_analysis_group: MobSuiteAnalysisGroup the plasmids belong to
+    :param plasmid_fasta_list: List of paths to the plasmid FASTA files
+    :param root_sample_instance: Sample the plasmids were reconstructed from
+    :param mobsuite_dir_name: Name of the mob_recon output directory
+    :return: List of created MobSuiteAnalysisPlasmid objects
+    """
+    aggregate_report = mob_suite_analysis_group.get_aggregate_report()
+    plasmids = []
+    for plasmid_fasta in plasmid_fasta_list:
+        plasmid = aggregate_report.get(plasmid_fasta.name)
+        if plasmid is None:
+            logger.warning(f"{plasmid_fasta.name} is missing from the mob_typer aggregate report")
+            plasmid = MobTyperPlasmid(file_id=plasmid_fasta.name)
+        plasmids.append(MobSuiteAnalysisPlasmid(
+            sample_id=root_sample_instance,
+            group_id=mob_suite_analysis_group,
+            plasmid_fasta=upload_mobsuite_file(root_sample_instance, plasmid_fasta.name, mobsuite_dir_name),
+            **plasmid.model_values()
+        ))
+    with transaction.atomic():
+        return MobSuiteAnalysisPlasmid.objects.bulk_create(plasmids)
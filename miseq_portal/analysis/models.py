@@ -8,6 +8,9 @@ from django.utils.dateparse import parse_date
 
 from django.conf import settings
 from miseq_portal.analysis.tools.helpers import run_subprocess
+from miseq_portal.analysis.tools.plasmid_report import MOBTYPER_COLUMNS, MobTyperAggregateReport, \
+    read_mobtyper_aggregate_report
+from miseq_portal.analysis.tools.resources import reserve_resources, parse_memory_gb
 from miseq_portal.core.models import TimeStampedModel
 from miseq_portal.miseq_viewer.models import Sample
 from miseq_portal.users.models import User
@@ -104,6 +107,8 @@ class AnalysisSample(models.Model):
     sample_id = models.ForeignKey(Sample, on_delete=models.CASCADE)
     group_id = models.ForeignKey(AnalysisGroup, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Per-sample jobs run as individual Celery tasks; the group is finalized once every sample has finished
+    job_status = models.CharField(choices=AnalysisGroup.status_choices, max_length=50, blank=False, default='Queued')
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
@@ -115,6 +120,32 @@ class AnalysisSample(models.Model):
         verbose_name_plural = 'Analysis Samples'
 
 
+class AnalysisResultCache(TimeStampedModel):
+    """
+    Content-addressed index of per-sample analysis results. The cache_key is derived from a checksum of the tool input,
+    the tool version and its parameters; analysis_sample points to the AnalysisSample that owns the result rows and
+    files for that key. Entries are 'Working' while the owning job is running so identical jobs can wait on it.
+    """
+    status_choices = (
+        ('Working', 'Working'),
+        ('Complete', 'Complete'),
+        ('Failed', 'Failed'),
+    )
+    cache_key = models.CharField(max_length=64, unique=True)
+    tool = models.CharField(choices=AnalysisGroup.job_choices, max_length=50)
+    input_checksum = models.CharField(max_length=64, blank=True)
+    tool_version = models.TextField(blank=True)
+    analysis_sample = models.ForeignKey(AnalysisSample, on_delete=models.SET_NULL, blank=True, null=True)
+    status = models.CharField(choices=status_choices, max_length=50, default='Working')
+
+    def __str__(self):
+        return f"{self.tool} - {self.cache_key}"
+
+    class Meta:
+        verbose_name = 'Analysis Result Cache'
+        verbose_name_plural = 'Analysis Result Cache'
+
+
 class SendsketchResult(TimeStampedModel):
     """
     Model for storing Sendsketch results on an individual sample
@@ -147,9 +178,11 @@ class ProkkaResult(TimeStampedModel):
 
     @staticmethod
     def call_prokka(fasta_path: Path, sample_id: str, outdir: Path, n_cpu: int) -> Path:
-        cmd = f"{PROKKA_EXE} --centre PORTAL --compliant --kingdom Bacteria " \
-              f"--cpus {n_cpu} --prefix {sample_id} --locustag {sample_id} --force --outdir {outdir} {fasta_path}"
-        run_subprocess(cmd, get_stdout=False)
+        with reserve_resources('prokka', cpus=n_cpu, memory_gb=8, min_cpus=1) as grant:
+            cmd = f"{PROKKA_EXE} --centre PORTAL --compliant --kingdom Bacteria " \
+                  f"--cpus {grant.cpus} --prefix {sample_id} --locustag {sample_id} --force --outdir {outdir} " \
+                  f"{fasta_path}"
+            run_subprocess(cmd, get_stdout=False)
         return outdir
 
     def __str__(self):
@@ -167,6 +200,7 @@ class ConfindrGroupResult(TimeStampedModel):
     analysis_group = models.ForeignKey(AnalysisGroup, on_delete=models.CASCADE)
     confindr_report = models.FileField(upload_to=upload_group_analysis_file, blank=True)
     confindr_log = models.FileField(upload_to=upload_group_analysis_file, blank=True)
+    confindr_version = models.TextField(blank=True)
 
     @staticmethod
     def call_confindr(reads_dir: Path, outdir: Path, forward_id: str = "_R1", reverse_id: str = "_R2") -> tuple:
@@ -180,9 +214,11 @@ class ConfindrGroupResult(TimeStampedModel):
         :param reverse_id: ID for reverse reads. Uses sensible default for Portal .fastq.gz files.
         :return: Path to output file
         """
-        cmd = f"{CONFINDR_EXE.parent / 'python'} {CONFINDR_EXE} -i {reads_dir} -o {outdir} -d {CONFINDR_DB} " \
-              f"-fid {forward_id} -rid {reverse_id} -Xmx {JAVA_MAX_HEAP} -t 16 --verbosity debug"
-        run_subprocess(cmd, get_stdout=False)
+        with reserve_resources('confindr', cpus=16, memory_gb=parse_memory_gb(JAVA_MAX_HEAP), min_cpus=2,
+                               min_memory_gb=8) as grant:
+            cmd = f"{CONFINDR_EXE.parent / 'python'} {CONFINDR_EXE} -i {reads_dir} -o {outdir} -d {CONFINDR_DB} " \
+                  f"-fid {forward_id} -rid {reverse_id} -Xmx {grant.java_heap} -t {grant.cpus} --verbosity debug"
+            run_subprocess(cmd, get_stdout=False)
         logger.info(f"Calling confindr with following command:\n{cmd}")
 
         report = outdir / 'confindr_report.csv'
@@ -242,6 +278,7 @@ class ConfindrResultAssembly(TimeStampedModel):
 
     #output file
     contamination_csv = models.FileField(blank=True, max_length=1000)
+    confindr_version = models.TextField(blank=True)
     #
     # # Fields parsed from confindr_report.csv
     genus = models.CharField(max_length=256, blank=True, null=True)
@@ -257,8 +294,17 @@ class ConfindrResultAssembly(TimeStampedModel):
         reads_dir = assembly_path.parent
         outdir = assembly_path / "confindr"
 
-        confindr_result = None
         csvfile, logfile = ConfindrGroupResult.call_confindr(reads_dir=reads_dir, outdir=outdir)
+        confindr_result = self.parse_confindr_report(csvfile)
+        return confindr_result, csvfile
+
+    def parse_confindr_report(self, csvfile: Path):
+        """
+        Parses the first row of a confindr_report.csv file
+        :param csvfile: Path to confindr_report.csv
+        :return: Dictionary of values for this model, or None if the report could not be parsed
+        """
+        confindr_result = None
         # Populate ConfindrResultAssembly object
         if csvfile.exists():
             df = pd.read_csv(csvfile)
@@ -283,8 +329,7 @@ class ConfindrResultAssembly(TimeStampedModel):
                 logger.warning(f"It looks like the Confindr report for {self.sample_id} is empty.")
         else:
             logger.warning(f"Something has gone wrong. The Confindr report for {self.sample_id} does not exist.")
-
-        return confindr_result, csvfile
+        return confindr_result
 
 
     def __str__(self):
@@ -302,16 +347,18 @@ class MashResult(TimeStampedModel):
     sample_id = models.OneToOneField(Sample, on_delete=models.CASCADE, primary_key=True)
     mash_result_file = models.FileField(upload_to=upload_analysis_file, blank=True, max_length=1000)
 
-    top_hit = models.CharField(max_length=256, blank=True, null=True)
+    top_hit = models.CharField(max_length=256, blank=True, null=True, db_index=True)
     top_shared_hashes = models.CharField(max_length=32, blank=True, null=True)
     top_identity = models.FloatField(blank=True, null=True)
     top_query_id = models.CharField(max_length=128, blank=True, null=True)
+    mash_version = models.TextField(blank=True)
 
     @staticmethod
     def call_mash(assembly: Path, outdir: Path, n_cpu: int = 16, pct_identity: float = 0.80) -> Path:
         outfile = outdir / 'mash_refseq_results.tab'
-        cmd = f"mash screen -i {pct_identity} -p {n_cpu} {str(MASH_REFSEQ_DATABASE)} {assembly} > {outfile}"
-        run_subprocess(cmd)
+        with reserve_resources('mash', cpus=n_cpu, memory_gb=8, min_cpus=1, min_memory_gb=2) as grant:
+            cmd = f"mash screen -i {pct_identity} -p {grant.cpus} {str(MASH_REFSEQ_DATABASE)} {assembly} > {outfile}"
+            run_subprocess(cmd)
         return outfile
 
     @staticmethod
@@ -342,20 +389,25 @@ class MashResult(TimeStampedModel):
         """ Grabs the assembly for the parent Sample, calls Mash on it, and parses the result """
         assembly_path = self.sample_id.sampleassemblydata.get_assembly_path()
         mash_result_file = self.call_mash(assembly=assembly_path, outdir=assembly_path.parent)
+        top_mash_result = self.get_top_mash_result(mash_result_file=mash_result_file)
+        return top_mash_result, mash_result_file
 
+    @classmethod
+    def get_top_mash_result(cls, mash_result_file: Path):
+        """ Parses the top hit from an existing Mash result file. Returns None if the file is empty. """
         # Check if the file actually has any data in it
         if mash_result_file.stat().st_size > 1:
-            df = self.parse_mash_results(mash_result_file=mash_result_file)
+            df = cls.parse_mash_results(mash_result_file=mash_result_file)
             # df is sorted so we can use grab the data from the first row for the top result
             top_mash_result = {
-                'hit': self.parse_top_mash_hit(df['query-comment'][0]),
+                'hit': cls.parse_top_mash_hit(df['query-comment'][0]),
                 'shared_hashes': df['shared-hashes'][0],
                 'identity': float(df['identity'][0]),
                 'query_id': df['query-ID'][0]
             }
         else:
             top_mash_result = None
-        return top_mash_result, mash_result_file
+        return top_mash_result
 
     def __str__(self):
         return f"{self.sample_id} - {self.top_hit}"
@@ -373,6 +425,7 @@ class MobSuiteAnalysisGroup(TimeStampedModel):
     analysis_sample = models.OneToOneField(AnalysisSample, on_delete=models.CASCADE)
     contig_report = models.FileField(upload_to=upload_mobsuite_file, blank=True, max_length=1000)
     mobtyper_aggregate_report = models.FileField(upload_to=upload_mobsuite_file, blank=True, max_length=1000)
+    mob_suite_version = models.TextField(blank=True)
 
     def sample_id(self):
         return self.analysis_sample.sample_id
@@ -391,12 +444,16 @@ class MobSuiteAnalysisGroup(TimeStampedModel):
         if attribute not in valid_attributes:
             raise AttributeError(f"Attribute {attribute} is not valid. "
                                  f"List of acceptable attributes: {valid_attributes}")
-        df = self.read_aggregate_report(aggregate_report_path=aggregate_report_path)
-        if len(df) == 0:
+        plasmid = self.get_aggregate_report(aggregate_report_path=aggregate_report_path).get(plasmid_basename)
+        if plasmid is None:
             return None
-        else:
-            plasmid_row = df[df["file_id"] == plasmid_basename].reset_index()
-            return plasmid_row[attribute][0]
+        return getattr(plasmid, MOBTYPER_COLUMNS[attribute])
+
+    def get_aggregate_report(self, aggregate_report_path: Path = None) -> MobTyperAggregateReport:
+        """ Returns the parsed mob_typer aggregate report; the file is only read again if it changes """
+        if aggregate_report_path is None:
+            aggregate_report_path = self.get_aggregate_report_path()
+        return read_mobtyper_aggregate_report(aggregate_report_path)
 
     def read_aggregate_report(self, aggregate_report_path: Path = None) -> pd.DataFrame:
         if aggregate_report_path is None:
@@ -468,6 +525,7 @@ class RGIResult(TimeStampedModel):
     analysis_sample = models.OneToOneField(AnalysisSample, on_delete=models.CASCADE)
     rgi_main_text_results = models.FileField(upload_to=upload_analysis_file, blank=True, max_length=1000)
     rgi_main_json_results = models.FileField(upload_to=upload_analysis_file, blank=True, max_length=1000)
+    rgi_version = models.TextField(blank=True)
 
     def sample_id(self):
         return self.analysis_sample.sample_id
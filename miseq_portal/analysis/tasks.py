@@ -3,26 +3,32 @@ from __future__ import absolute_import, unicode_literals
 import logging
 import os
 import shutil
+from datetime import timedelta
 from pathlib import Path
 
 import pandas as pd
 from celery import shared_task
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.utils.dateparse import parse_date
+from django.db import transaction
 
 from config.settings.base import MEDIA_ROOT
 from miseq_portal.analysis.models import AnalysisGroup, AnalysisSample, \
     SendsketchResult, MobSuiteAnalysisGroup, MobSuiteAnalysisPlasmid, RGIResult, RGIGroupResult, MashResult, \
-    ConfindrGroupResult, ConfindrResult, ConfindrResultAssembly, upload_analysis_file, upload_analysis_file, upload_mobsuite_file, upload_group_analysis_file, \
-    rMLSTResult, StxGroupResult, StxSampleResult, StxGeneResult
-from miseq_portal.analysis.tools.assemble_run import assembly_pipeline, call_qualimap, \
-    extract_coverage_from_qualimap_results, assembly_cleanup, run_quast, get_quast_df, upload_sampleassembly_data, \
-    prodigal_pipeline
+    ConfindrGroupResult, ConfindrResultAssembly, upload_analysis_file, upload_analysis_file, upload_mobsuite_file, upload_group_analysis_file, \
+    rMLSTResult, StxGroupResult
+from miseq_portal.analysis.ingest import ingest_confindr_results, ingest_stx_results, ingest_mob_suite_plasmids
+from miseq_portal.analysis.tools.assemble_run import get_quast_df, upload_sampleassembly_data, \
+    get_assembly_stage_graph, get_assembly_initial_state, EmptyAssemblyError
 from miseq_portal.analysis.tools.plasmid_report import call_mob_recon
+from miseq_portal.analysis.tools.helpers import file_checksum
+from miseq_portal.analysis.tools.result_cache import run_cached, clone_result_object, result_object_values, \
+    result_files_exist
 from miseq_portal.analysis.tools.rgi import call_rgi_main, call_rgi_heatmap
 from miseq_portal.analysis.tools.sendsketch import run_sendsketch, get_top_sendsketch_hit
-from miseq_portal.analysis.tools.rmlst import query_rmlst
+from miseq_portal.analysis.tools.rmlst import query_rmlst, get_rmlst_client, RMLSTClient, RMLSTError
 from miseq_portal.analysis.tools.stx import query_stx
+from miseq_portal.analysis.tools.versions import get_tool_version
 from miseq_portal.miseq_viewer.models import Sample, SampleAssemblyData
 
 MEDIA_ROOT = Path(MEDIA_ROOT)
@@ -30,12 +36,18 @@ MEDIA_ROOT = Path(MEDIA_ROOT)
 logger = logging.getLogger('django')
 
 
+# Job types that are run independently per AnalysisSample, each as its own Celery task. rMLST is a remote query and is
+# batched at the group level instead (see submit_rmlst_group_job).
+PER_SAMPLE_JOB_TYPES = ('SendSketch', 'MobRecon', 'RGI')
+
+
 @shared_task(serializer='json')
 def submit_analysis_job(analysis_group: AnalysisGroup):
     """
-    Given an AnalysisGroup, retrieves all AnalysisSample members and runs an asynchronous call to the specified job_type
+    Given an AnalysisGroup, retrieves all AnalysisSample members and runs an asynchronous call to the specified job_type.
+    Per-sample job types are fanned out as one submit_analysis_sample_job task per AnalysisSample; the group is
+    finalized by finalize_analysis_group once the last of those tasks finishes.
     :param analysis_group: Instance of AnalysisGroup object
-    :return: Instance of AnalysisGroup updated by this method
     """
     analysis_group = AnalysisGroup.objects.get(id=analysis_group)
     job_type = analysis_group.job_type
@@ -49,29 +61,114 @@ def submit_analysis_job(analysis_group: AnalysisGroup):
 
     logger.info(f"Starting {job_type} job for user '{user}' for samples in group ID {group_id}")
 
-    # TODO: Implement handling for failed jobs so they actually switch over to 'FAILED' instead of 'Working' forever
-
-    # Iterate over each sample instance and pass them to according method depending on job type
-    if job_type == 'SendSketch':
-        [submit_sendsketch_job(sample_instance) for sample_instance in analysis_samples]
-    elif job_type == 'MobRecon':
-        [submit_mob_recon_job(sample_instance) for sample_instance in analysis_samples]
-    elif job_type == 'rMLST':
-        [submit_rmlst_job(sample_instance) for sample_instance in analysis_samples]
-    elif job_type == 'Confindr':
-        submit_confindr_job(analysis_group=analysis_group)
-    elif job_type == 'RGI':
-        rgi_sample_list = [submit_rgi_job(sample_instance) for sample_instance in analysis_samples]
+    if job_type in PER_SAMPLE_JOB_TYPES:
+        sample_ids = list(analysis_samples.values_list('id', flat=True))
+        if len(sample_ids) == 0:
+            finalize_analysis_group.apply_async(kwargs={'analysis_group': group_id}, queue='analysis_queue')
+            return
+        for sample_id in sample_ids:
+            submit_analysis_sample_job.apply_async(kwargs={'analysis_sample': sample_id}, queue='analysis_queue')
+        logger.info(f"Dispatched {len(sample_ids)} {job_type} sample jobs for Group {analysis_group}")
+        return
+
+    if job_type == 'rMLST':
+        # The group must always be finalized, otherwise it and its samples are left Working/Queued forever
+        try:
+            submit_rmlst_group_job(analysis_group=analysis_group)
+        except Exception as e:
+            logger.exception(f"rMLST analysis failed for Group {analysis_group}: {e}")
+            analysis_samples.exclude(job_status__in=['Complete', 'Failed']).update(job_status='Failed')
+        finally:
+            finalize_analysis_group(analysis_group=group_id)
+        return
+
+    # Confindr and Stx run at the AnalysisGroup level (generates one summary report)
+    try:
+        if job_type == 'Confindr':
+            submit_confindr_job(analysis_group=analysis_group)
+        elif job_type == 'Stx':
+            submit_stx_job(analysis_group=analysis_group)
+    except Exception as e:
+        logger.exception(f"{job_type} analysis failed for Group {analysis_group}: {e}")
+        analysis_group.job_status = 'Failed'
+    else:
+        logger.info(f'Analysis for Group {analysis_group} completed')
+        analysis_group.job_status = 'Complete'
+    analysis_group.save()
+
+
+@shared_task(serializer='json')
+def submit_analysis_sample_job(analysis_sample: int):
+    """
+    Runs the job_type of the parent AnalysisGroup against a single AnalysisSample. The last sample task of a group to
+    finish queues finalize_analysis_group.
+    :param analysis_sample: Primary key of an AnalysisSample object
+    """
+    sample_instance = AnalysisSample.objects.select_related('group_id').get(id=analysis_sample)
+    analysis_group = sample_instance.group_id
+    job_type = analysis_group.job_type
+
+    sample_instance.job_status = 'Working'
+    sample_instance.save(update_fields=['job_status', 'modified'])
+
+    try:
+        if job_type == 'SendSketch':
+            submit_sendsketch_job(sample_instance)
+        elif job_type == 'MobRecon':
+            submit_mob_recon_job(sample_instance)
+        elif job_type == 'RGI':
+            submit_rgi_job(sample_instance)
+        job_status = 'Complete'
+    except Exception as e:
+        logger.exception(f"{job_type} job failed for {sample_instance}: {e}")
+        job_status = 'Failed'
+
+    if record_analysis_sample_status(sample_instance=sample_instance, job_status=job_status):
+        finalize_analysis_group.apply_async(kwargs={'analysis_group': analysis_group.id}, queue='analysis_queue')
+
+
+def record_analysis_sample_status(sample_instance: AnalysisSample, job_status: str) -> bool:
+    """
+    Stores the final job_status of an AnalysisSample while holding a row lock on its AnalysisGroup, which serializes
+    concurrent sample tasks so exactly one of them observes that the whole group has finished.
+    :param sample_instance: Instance of AnalysisSample object
+    :param job_status: Final status for the sample, either 'Complete' or 'Failed'
+    :return: True if this was the last unfinished sample in the group
+    """
+    with transaction.atomic():
+        AnalysisGroup.objects.select_for_update().get(id=sample_instance.group_id_id)
+        sample_instance.job_status = job_status
+        sample_instance.save(update_fields=['job_status', 'modified'])
+        unfinished = AnalysisSample.objects.filter(group_id=sample_instance.group_id_id) \
+            .exclude(job_status__in=['Complete', 'Failed'])
+        return not unfinished.exists()
+
+
+@shared_task(serializer='json')
+def finalize_analysis_group(analysis_group: int):
+    """
+    Group-level step run once every AnalysisSample of a per-sample job has finished. Generates the RGI heatmap when
+    applicable and sets the final job_status of the AnalysisGroup.
+    :param analysis_group: Primary key of an AnalysisGroup object
+    """
+    analysis_group = AnalysisGroup.objects.get(id=analysis_group)
+    analysis_samples = AnalysisSample.objects.filter(group_id=analysis_group)
+    failed = analysis_samples.filter(job_status='Failed').exists()
+
+    if analysis_group.job_type == 'RGI':
+        rgi_sample_list = list(RGIResult.objects.filter(analysis_sample__group_id=analysis_group)
+                               .order_by('analysis_sample_id'))
         # If multiple samples are selected, generate group analysis job
         if len(rgi_sample_list) > 1:
-            submit_rgi_heatmap_job(analysis_group=analysis_group, rgi_sample_list=rgi_sample_list)
-    elif job_type == 'Stx':
-        # STX now runs at the AnalysisGroup level (generates one summary report)
-        submit_stx_job(analysis_group=analysis_group)
+            try:
+                submit_rgi_heatmap_job(analysis_group=analysis_group, rgi_sample_list=rgi_sample_list)
+            except Exception as e:
+                logger.exception(f"RGI heatmap failed for Group {analysis_group}: {e}")
+                failed = True
 
-    logger.info(f'Analysis for Group {analysis_group} completed')
-    analysis_group.job_status = 'Complete'
+    analysis_group.job_status = 'Failed' if failed else 'Complete'
     analysis_group.save()
+    logger.info(f'Analysis for Group {analysis_group} finished with status {analysis_group.job_status}')
 
 
 def submit_confindr_job(analysis_group: AnalysisGroup) -> ConfindrGroupResult:
@@ -84,7 +181,7 @@ def submit_confindr_job(analysis_group: AnalysisGroup) -> ConfindrGroupResult:
     reads_dir.mkdir(parents=True, exist_ok=True)
 
     # Grab all of the reads and symlink them to the reads_dir
-    analysis_samples = AnalysisSample.objects.filter(group_id=analysis_group)
+    analysis_samples = list(AnalysisSample.objects.filter(group_id=analysis_group).select_related('sample_id'))
     samples = [analysis_sample.sample_id for analysis_sample in analysis_samples]
     reads_dict = {sample: {'fwd_reads': MEDIA_ROOT / str(sample.fwd_reads),
                            'rev_reads': MEDIA_ROOT / str(sample.rev_reads)}
@@ -105,50 +202,14 @@ def submit_confindr_job(analysis_group: AnalysisGroup) -> ConfindrGroupResult:
 
     confindr_group_result.confindr_report = str(report)
     confindr_group_result.confindr_log = str(logfile)
-    confindr_group_result.save()
+    confindr_group_result.confindr_version = get_tool_version('confindr')
 
     # Create and populate individual result objects
     report_path = MEDIA_ROOT / str(confindr_group_result.confindr_report)
-    report_df = pd.read_csv(report_path)
     logger.info(f"report_path: {report_path}")
-
-    for analysis_sample in analysis_samples:
-        contam_csv = outdir / f"{analysis_sample.sample_id}_contamination.csv"
-        rmlst_csv = outdir / f"{analysis_sample.sample_id}_rmlstcsv"
-        confindr_result = ConfindrResult.objects.create(analysis_sample=analysis_sample,
-                                                        contamination_csv=str(contam_csv),
-                                                        rmlst_csv=str(rmlst_csv))
-        confindr_result.save()
-
-        # Filter to only sample of interest
-        df = report_df[report_df['Sample'] == str(analysis_sample.sample_id)].reset_index()
-
-        # Populate ConfindrResult object
-        if not df.empty:
-            try:
-                if df['PercentContam'][0] == "ND":
-                    df['PercentContam'][0] = "nan"
-                    df['PercentContamStandardDeviation'][0] = "nan"
-                confindr_result.genus = str(df['Genus'][0])
-                confindr_result.num_contam_snvs = int(df['NumContamSNVs'][0])
-                confindr_result.contam_status = str(df['ContamStatus'][0])
-                confindr_result.percent_contam = float(df['PercentContam'][0])
-                confindr_result.percent_contam_std_dev = float(df['PercentContamStandardDeviation'][0])
-                confindr_result.bases_examined = int(df['BasesExamined'][0])
-                confindr_result.database_download_date = parse_date(df['DatabaseDownloadDate'][0])
-            except BaseException as e:
-                logger.warning(f"Something is wrong with the Confindr report for {analysis_sample.sample_id}")
-                logger.warning(e)
-
-                confindr_result.genus = None
-                confindr_result.num_contam_snvs = None
-                confindr_result.contam_status = None
-                confindr_result.percent_contam = None
-                confindr_result.percent_contam_std_dev = None
-                confindr_result.bases_examined = None
-                confindr_result.database_download_date = None
-
-            confindr_result.save()
+    with transaction.atomic():
+        confindr_group_result.save()
+        ingest_confindr_results(analysis_samples=analysis_samples, report_path=report_path, outdir=outdir)
 
     return confindr_group_result
 
@@ -192,21 +253,33 @@ def submit_rgi_heatmap_job(analysis_group: AnalysisGroup, rgi_sample_list: [RGIR
 
 def submit_rgi_job(sample_instance: AnalysisSample) -> RGIResult:
     """
-    Given an input AnalysisSample instance, runs RGI and stores result in the database
+    Given an input AnalysisSample instance, runs RGI and stores result in the database. Results of a previous RGI job
+    on an identical assembly with the same RGI version are reused instead.
     :param sample_instance: Instance of AnalysisSample object
     :return: Populated RGIResult object generated by the method
     """
     logger.info(f"Received RGI job request for {sample_instance}")
     assembly_instance = SampleAssemblyData.objects.get(sample_id=sample_instance.sample_id)
-    rgi_dir_name = f'RGI_{sample_instance.user}_{sample_instance.pk}'
-    root_sample_instance = Sample.objects.get(sample_id=sample_instance.sample_id)
-    outdir = MEDIA_ROOT / Path(str(sample_instance.sample_id.fwd_reads)).parent / rgi_dir_name
-
     if not assembly_instance.assembly_exists():
         logger.warning(f"Could not find assembly for {assembly_instance} - cannot proceed with job")
         return
-    else:
-        assembly_path = assembly_instance.get_assembly_path()
+    assembly_path = assembly_instance.get_assembly_path()
+    return run_cached(sample_instance=sample_instance, tool='RGI', input_checksum=file_checksum(assembly_path),
+                      tool_version=get_tool_version('rgi'), params={'clean': True},
+                      compute=lambda instance: run_rgi_job(instance, assembly_path=assembly_path),
+                      reuse=reuse_rgi_result)
+
+
+def run_rgi_job(sample_instance: AnalysisSample, assembly_path: Path) -> RGIResult:
+    """
+    Runs RGI on the assembly of an AnalysisSample and stores the result in the database
+    :param sample_instance: Instance of AnalysisSample object
+    :param assembly_path: Path to the assembly of the sample
+    :return: Populated RGIResult object
+    """
+    rgi_dir_name = f'RGI_{sample_instance.user}_{sample_instance.pk}'
+    root_sample_instance = Sample.objects.get(sample_id=sample_instance.sample_id)
+    outdir = MEDIA_ROOT / Path(str(sample_instance.sample_id.fwd_reads)).parent / rgi_dir_name
 
     # Remove previous analysis if it exists
     if outdir.exists():
@@ -225,28 +298,55 @@ def submit_rgi_job(sample_instance: AnalysisSample) -> RGIResult:
     rgi_result_object.rgi_main_json_results = upload_analysis_file(instance=root_sample_instance,
                                                                    filename=rgi_json_results.name,
                                                                    analysis_folder=rgi_dir_name)
+    rgi_result_object.rgi_version = get_tool_version('rgi')
     rgi_result_object.save()
     logger.info(f"Completed running RGI on {sample_instance}")
     return rgi_result_object
 
 
+def reuse_rgi_result(source_sample: AnalysisSample, sample_instance: AnalysisSample) -> RGIResult:
+    """
+    Attaches the RGIResult of source_sample to sample_instance. Both rows point at the same result files.
+    :return: RGIResult of sample_instance, or None if source_sample no longer has a complete result
+    """
+    existing_result = RGIResult.objects.filter(analysis_sample=sample_instance).first()
+    if existing_result is not None:
+        return existing_result
+    source_result = RGIResult.objects.filter(analysis_sample=source_sample).first()
+    if source_result is None or not result_files_exist(source_result):
+        return None
+    return clone_result_object(source_result, analysis_sample_id=sample_instance.id)
+
+
 def submit_mob_recon_job(sample_instance: AnalysisSample) -> MobSuiteAnalysisGroup:
     """
-    Given an input AnalysisSample instance, runs Mob Recon and stores result in the database
+    Given an input AnalysisSample instance, runs Mob Recon and stores result in the database. Results of a previous
+    Mob Recon job on an identical assembly with the same MOB-suite version are reused instead.
     :param sample_instance: Instance of AnalysisSample object
     :return: Populated MobSuiteAnalysisGroup object generated by the method
     """
     logger.info(f"Running Mob Suite on {sample_instance}")
     assembly_instance = SampleAssemblyData.objects.get(sample_id=sample_instance.sample_id)
-    mobsuite_dir_name = f'mob_suite_{sample_instance.user}_{sample_instance.pk}'
-    outdir = MEDIA_ROOT / Path(str(sample_instance.sample_id.fwd_reads)).parent / mobsuite_dir_name
-    root_sample_instance = Sample.objects.get(sample_id=sample_instance.sample_id)
-
     if not assembly_instance.assembly_exists():
         logger.warning(f"Could not find assembly for {assembly_instance} - cannot proceed with job")
         return
-    else:
-        assembly_path = assembly_instance.get_assembly_path()
+    assembly_path = assembly_instance.get_assembly_path()
+    return run_cached(sample_instance=sample_instance, tool='MobRecon', input_checksum=file_checksum(assembly_path),
+                      tool_version=get_tool_version('mob_recon'), params={'run_typer': True},
+                      compute=lambda instance: run_mob_recon_job(instance, assembly_path=assembly_path),
+                      reuse=reuse_mob_recon_result)
+
+
+def run_mob_recon_job(sample_instance: AnalysisSample, assembly_path: Path) -> MobSuiteAnalysisGroup:
+    """
+    Runs Mob Recon on the assembly of an AnalysisSample and stores the result in the database
+    :param sample_instance: Instance of AnalysisSample object
+    :param assembly_path: Path to the assembly of the sample
+    :return: Populated MobSuiteAnalysisGroup object
+    """
+    mobsuite_dir_name = f'mob_suite_{sample_instance.user}_{sample_instance.pk}'
+    outdir = MEDIA_ROOT / Path(str(sample_instance.sample_id.fwd_reads)).parent / mobsuite_dir_name
+    root_sample_instance = Sample.objects.get(sample_id=sample_instance.sample_id)
 
     # Remove previous analysis if it exists
     if outdir.exists():
@@ -264,43 +364,41 @@ def submit_mob_recon_job(sample_instance: AnalysisSample) -> MobSuiteAnalysisGro
                                                                   mobsuite_dir_name=mobsuite_dir_name)
     mob_suite_analysis_group.mobtyper_aggregate_report = upload_mobsuite_file(
         root_sample_instance, mob_recon_data_object.mobtyper_aggregate_report.name, mobsuite_dir_name=mobsuite_dir_name)
+    mob_suite_analysis_group.mob_suite_version = get_tool_version('mob_recon')
     mob_suite_analysis_group.save()
 
     # Update database for MobSuiteAnalysisPlasmid
     # Quit early if there aren't any plasmids. This could potentially occur even earlier.
     if len(mob_recon_data_object.plasmid_fasta_list) == 0:
-        logger.warning(f"No plasmids detected by mob_recon for {assembly_instance}")
-        return
+        logger.warning(f"No plasmids detected by mob_recon for {sample_instance}")
+        return mob_suite_analysis_group
+
+    ingest_mob_suite_plasmids(mob_suite_analysis_group=mob_suite_analysis_group,
+                              plasmid_fasta_list=mob_recon_data_object.plasmid_fasta_list,
+                              root_sample_instance=root_sample_instance,
+                              mobsuite_dir_name=mobsuite_dir_name)
+    return mob_suite_analysis_group
 
-    # Iterate over each plasmid and update entry in db accordingly
-    for plasmid_fasta in mob_recon_data_object.plasmid_fasta_list:
-        logger.info(f"Processing {plasmid_fasta}")
-        mob_suite_plasmid_instance = MobSuiteAnalysisPlasmid.objects.create(
-            sample_id=mob_suite_analysis_group.analysis_sample.sample_id,
-            group_id=mob_suite_analysis_group,
-        )
 
-        logger.info(f"Creating new Mob Suite Plasmid object with {plasmid_fasta}")
-        plasmid_db_path = upload_mobsuite_file(root_sample_instance, plasmid_fasta.name, mobsuite_dir_name)
-        mob_suite_plasmid_instance.plasmid_fasta = plasmid_db_path
-
-        # Pull data from mobtype_aggregate_report.txt and place it in the database
-        attr_dict = {
-            'num_contigs': 'num_contigs', 'total_length': 'total_length', 'gc': 'gc_content', 'rep_type(s)': 'rep_type',
-            'rep_type_accession(s)': 'rep_type_accession', 'relaxase_type(s)': 'relaxase_type',
-            'relaxase_type_accession(s)': 'relaxase_type_accession', 'PredictedMobility': 'predicted_mobility',
-            'mash_nearest_neighbor': 'mash_nearest_neighbor', 'mash_neighbor_distance': 'mash_neighbor_distance',
-            'mash_neighbor_cluster': 'mash_neighbor_cluster'
-        }
-        for df_key, model_attr in attr_dict.items():
-            df_value = mob_suite_analysis_group.get_plasmid_attribute(
-                plasmid_basename=plasmid_fasta.name,
-                attribute=df_key)
-            setattr(mob_suite_plasmid_instance,
-                    model_attr,
-                    df_value)
-        # Save instance
-        mob_suite_plasmid_instance.save()
+def reuse_mob_recon_result(source_sample: AnalysisSample, sample_instance: AnalysisSample) -> MobSuiteAnalysisGroup:
+    """
+    Attaches the MobSuiteAnalysisGroup and MobSuiteAnalysisPlasmid rows of source_sample to sample_instance. All rows
+    point at the same result files.
+    :return: MobSuiteAnalysisGroup of sample_instance, or None if source_sample no longer has a complete result
+    """
+    existing_group = MobSuiteAnalysisGroup.objects.filter(analysis_sample=sample_instance).first()
+    if existing_group is not None:
+        return existing_group
+    source_group = MobSuiteAnalysisGroup.objects.filter(analysis_sample=source_sample).first()
+    if source_group is None or not result_files_exist(source_group):
+        return None
+    with transaction.atomic():
+        mob_suite_analysis_group = clone_result_object(source_group, analysis_sample_id=sample_instance.id)
+        MobSuiteAnalysisPlasmid.objects.bulk_create([
+            MobSuiteAnalysisPlasmid(**result_object_values(plasmid, group_id_id=mob_suite_analysis_group.pk))
+            for plasmid in MobSuiteAnalysisPlasmid.objects.filter(group_id=source_group)
+        ])
+    return mob_suite_analysis_group
 
 
 def submit_sendsketch_job(sample_instance: AnalysisSample) -> SendsketchResult:
@@ -351,31 +449,83 @@ def submit_sendsketch_job(sample_instance: AnalysisSample) -> SendsketchResult:
     return sendsketch_object
 
 
-def submit_rmlst_job(sample_instance: AnalysisSample) -> rMLSTResult:
+def submit_rmlst_group_job(analysis_group: AnalysisGroup):
+    """
+    Runs rMLST for every AnalysisSample in a group. The responses for the whole group are first fetched concurrently
+    over a single connection pool, bounded by RMLST_MAX_CONCURRENCY, after which each sample is recorded from the
+    response cache and given its final job_status.
+    :param analysis_group: Instance of AnalysisGroup object
+    """
+    client = get_rmlst_client()
+    analysis_samples = list(AnalysisSample.objects.filter(group_id=analysis_group))
+    assembly_instances = SampleAssemblyData.objects.filter(
+        sample_id__in=[sample_instance.sample_id_id for sample_instance in analysis_samples])
+    assembly_paths = [assembly_instance.get_assembly_path() for assembly_instance in assembly_instances
+                      if assembly_instance.assembly_exists()]
+    logger.info(f"Querying rMLST for {len(assembly_paths)} assemblies in Group {analysis_group}")
+    client.query_many(assembly_paths, max_workers=settings.RMLST_MAX_CONCURRENCY)
+
+    for sample_instance in analysis_samples:
+        sample_instance.job_status = 'Working'
+        sample_instance.save(update_fields=['job_status', 'modified'])
+        try:
+            submit_rmlst_job(sample_instance, client=client)
+            job_status = 'Complete'
+        except Exception as e:
+            logger.exception(f"rMLST job failed for {sample_instance}: {e}")
+            job_status = 'Failed'
+        record_analysis_sample_status(sample_instance=sample_instance, job_status=job_status)
+
+
+def submit_rmlst_job(sample_instance: AnalysisSample, client: RMLSTClient = None) -> rMLSTResult:
     # for now I am just copying the mobsuite function
     logger.info(f"Submitting {sample_instance} for rMLST analysis")
     assembly_instance = SampleAssemblyData.objects.get(sample_id=sample_instance.sample_id)
-    rmlst_dir_name = f'rmlst_{sample_instance.user}_{sample_instance.pk}'
-    outdir = Path(str(sample_instance.sample_id.fwd_reads)).parent / rmlst_dir_name
-    fulloutdir = MEDIA_ROOT / outdir
     if not assembly_instance.assembly_exists():
         logger.warning(f"Could not find assembly for {assembly_instance} - cannot proceed with job")
         return
-    else:
-        assembly_path = assembly_instance.get_assembly_path()
+    assembly_path = assembly_instance.get_assembly_path()
+    # The rMLST database is remote and has no local version, so cached results expire instead
+    return run_cached(sample_instance=sample_instance, tool='rMLST', input_checksum=file_checksum(assembly_path),
+                      tool_version='', params={'uri': settings.RMLST_URI},
+                      compute=lambda instance: run_rmlst_job(instance, assembly_path=assembly_path, client=client),
+                      reuse=reuse_rmlst_result, max_age=timedelta(days=settings.RMLST_RESULT_CACHE_DAYS))
+
+
+def run_rmlst_job(sample_instance: AnalysisSample, assembly_path: Path, client: RMLSTClient = None) -> rMLSTResult:
+    rmlst_dir_name = f'rmlst_{sample_instance.user}_{sample_instance.pk}'
+    outdir = Path(str(sample_instance.sample_id.fwd_reads)).parent / rmlst_dir_name
+    fulloutdir = MEDIA_ROOT / outdir
 
     # Remove previous analysis if it exists
     if fulloutdir.exists():
         shutil.rmtree(fulloutdir, ignore_errors=True)
     fulloutdir.mkdir(exist_ok=True)
 
-    rmlst_results = query_rmlst(assembly=assembly_path, outdir=outdir, root=MEDIA_ROOT)
+    rmlst_results = query_rmlst(assembly=assembly_path, outdir=outdir, root=MEDIA_ROOT, client=client)
+    if rmlst_results is None:
+        raise RMLSTError(f"Could not retrieve rMLST results for {sample_instance}")
 
     # We now create a new MobSuiteAnalysisGroup entry in the db for the AnalysisSample instance
     rmlst_analysis_group = rMLSTResult.objects.create(analysis_sample=sample_instance, rmlst_json=rmlst_results['json'], rmlst_csv=rmlst_results['csv'], support=rmlst_results['support'], taxon=rmlst_results['taxon'], rST=rmlst_results['rST'])
     return rmlst_analysis_group
 
 
+def reuse_rmlst_result(source_sample: AnalysisSample, sample_instance: AnalysisSample) -> rMLSTResult:
+    """
+    Attaches the rMLSTResult of source_sample to sample_instance. Both rows point at the same result files.
+    :return: rMLSTResult of sample_instance, or None if source_sample no longer has a complete result
+    """
+    existing_result = rMLSTResult.objects.filter(analysis_sample=sample_instance).first()
+    if existing_result is not None:
+        return existing_result
+    source_result = rMLSTResult.objects.filter(analysis_sample=source_sample).first()
+    # rmlst_csv is not always written, so only the JSON response is required
+    if source_result is None or not result_files_exist(source_result, field_names=['rmlst_json']):
+        return None
+    return clone_result_object(source_result, analysis_sample_id=sample_instance.id)
+
+
 def submit_stx_job(analysis_group: AnalysisGroup) -> StxGroupResult:
     """
     Given an input AnalysisGroup instance, runs STX and stores result in the database
@@ -393,7 +543,7 @@ def submit_stx_job(analysis_group: AnalysisGroup) -> StxGroupResult:
     assemblydir.mkdir(parents=True, exist_ok=True)
 
     logger.info(f"Submitting {analysis_group} for stx analysis")
-    analysis_samples = AnalysisSample.objects.filter(group_id=analysis_group)
+    analysis_samples = list(AnalysisSample.objects.filter(group_id=analysis_group).select_related('sample_id'))
     samples = [analysis_sample.sample_id for analysis_sample in analysis_samples]
         
     # Create symlinks and metadata lists. Note that reads are being renamed to stricly the sample ID + direction
@@ -423,66 +573,24 @@ def submit_stx_job(analysis_group: AnalysisGroup) -> StxGroupResult:
         logger.warning(f"STX analysis failed for group {analysis_group}")
         return
 
-    stx_group_result = StxGroupResult.objects.create(analysis_group=analysis_group, stx_report=str (analysis_dir / nf_info['report_xlsx']))
-    stx_group_result.save()
-
-    persample_results = nf_info.get('persample_results', {})
-    persample_result_vals = nf_info.get('persample_result_vals', {})
-    perstx_results = nf_info.get('perstx_results', {})
-    for analysis_sample in analysis_samples:
-        sample_id = str(analysis_sample.sample_id)
-        sample_vals = persample_result_vals.get(sample_id, {})
-        # Create sample instance
-        stx_sample_result = StxSampleResult.objects.create(analysis_sample=analysis_sample)
-        samplefiles = {}
-        for i in persample_results.get(sample_id, {}):
-            samplefiles[i] = str(analysis_dir / persample_results[sample_id][i])
-
-        stx_sample_result.kma_report = samplefiles.get('kma', None)
-        stx_sample_result.stxtyper_report = samplefiles.get('stxtyper', None)
-        stx_sample_result.blast_processed_stx1 = samplefiles.get('stx1blast', None)
-        stx_sample_result.blast_processed_stx2 = samplefiles.get('stx2blast', None)
-        stx_sample_result.hc_protein_allele = sample_vals.get('HC-Protein Allele', "")
-        stx_sample_result.hc_distance = sample_vals.get('HC-Distance', "")
-        stx_sample_result.hc_motif = sample_vals.get('HC-Motif', "")
-        stx_sample_result.hc_contig = sample_vals.get('HC-Contig', "")
-        stx_sample_result.hc_location = sample_vals.get('HC-Location', "")
-        stx_sample_result.ncbi_stx_type = sample_vals.get('NCBI-Stx Type', "")
-        stx_sample_result.ncbi_identity = sample_vals.get('NCBI-Identity', "")
-        stx_sample_result.ncbi_operon = sample_vals.get('NCBI-Operon', "")
-        stx_sample_result.ncbi_contig = sample_vals.get('NCBI-Contig', "")
-        stx_sample_result.ncbi_location = sample_vals.get('NCBI-Location', "")
-        stx_sample_result.kma_nucleotide_allele = sample_vals.get('KMA-Nucleotide Allele', "")
-        stx_sample_result.kma_identity = sample_vals.get('KMA-Identity', "")
-        stx_sample_result.kma_depth = sample_vals.get('KMA-Depth', "")
-        stx_sample_result.save()
-
-        # Create gene instances
-        for geneinfo, gene_results in perstx_results.get(sample_id, {}).items():
-            gene, contigandloc = geneinfo.split("_", 1)
-            contig, loc = contigandloc.rsplit("_", 1)
-            stx_gene_result = StxGeneResult.objects.create(
-                analysis_sample=analysis_sample,
-                gene=gene,
-                contig=contig,
-                loc=loc
-            )
-            genefiles = {}
-            for i in gene_results:
-                genefiles[i] = str(analysis_dir / gene_results[i])
-            stx_gene_result.motif = genefiles.get('motif', None)
-            stx_gene_result.tree = genefiles.get('tree', None)
-            stx_gene_result.alignment = genefiles.get('alignment', None)
-            stx_gene_result.save()
-        
+    with transaction.atomic():
+        stx_group_result = StxGroupResult.objects.create(analysis_group=analysis_group,
+                                                         stx_report=str(analysis_dir / nf_info['report_xlsx']))
+        ingest_stx_results(analysis_samples=analysis_samples, nf_info=nf_info, analysis_dir=analysis_dir)
+    return stx_group_result
 
 
 @shared_task()
-def assemble_sample_instance(sample_object_id: str):
+def assemble_sample_instance(sample_object_id: str, rerun_stages: list = None):
     """
     Assembles a sample. Locates the sample in the database via sample_id.
-    Must be called via assemble_sample_instance.delay(sample_object_id=sample_id) to queue in Celery
+    Must be called via assemble_sample_instance.delay(sample_object_id=sample_id) to queue in Celery.
+    Every step of the pipeline is checkpointed (see assemble_run.get_assembly_stage_graph()), so a retry resumes from
+    the last completed step.
     :param sample_object_id: sample_id value, e.g. BMH-2017-000001
+    :param rerun_stages: Names of stages to rerun on an existing assembly, e.g. ['mash'] after updating the RefSeq
+    sketch. Only these stages and the stages depending on them are run again. Assemblies without checkpoints (i.e.
+    made before the pipeline was checkpointed) can't be partially rerun and are left untouched.
     """
     try:
         sample_instance = Sample.objects.get(sample_id=sample_object_id)
@@ -492,7 +600,8 @@ def assemble_sample_instance(sample_object_id: str):
 
     # Get/create SampleAssemblyData instance
     sample_assembly_instance, sa_created = SampleAssemblyData.objects.get_or_create(sample_id=sample_instance)
-    if sa_created or str(sample_assembly_instance.assembly) == '' or sample_assembly_instance.assembly is None:
+    if sa_created or str(sample_assembly_instance.assembly) == '' or sample_assembly_instance.assembly is None \
+            or rerun_stages:
         """
         Check if it's even worth attempting the assembly by quickly checking the # of reads available.
         Note that this is contingent on there being # reads data available, which is not always the case.
@@ -511,71 +620,93 @@ def assemble_sample_instance(sample_object_id: str):
 
         # Setup assembly directory on NAS
         outdir = MEDIA_ROOT / Path(str(sample_instance.fwd_reads)).parent / "assembly"
-        # Delete any old assembly lying around without an attached database record
-        if outdir.exists():
-            shutil.rmtree(outdir)
+        stage_graph = get_assembly_stage_graph(outdir=outdir)
+        if not stage_graph.has_checkpoints():
+            if rerun_stages:
+                logger.error(f"Cannot rerun {rerun_stages} for {sample_instance}: the assembly in {outdir} has no "
+                             f"checkpoints to resume from. Reassemble the sample without rerun_stages instead.")
+                return
+            # Delete any old assembly lying around that has no checkpoints to resume from
+            if outdir.exists():
+                shutil.rmtree(outdir)
         outdir.mkdir(exist_ok=True)
         os.chmod(outdir, 0o777)
 
-        fwd_reads = MEDIA_ROOT / Path(str(sample_instance.fwd_reads))
-        rev_reads = MEDIA_ROOT / Path(str(sample_instance.rev_reads))
-        bamfile, polished_assembly = assembly_pipeline(
-            fwd_reads=fwd_reads,
-            rev_reads=rev_reads,
+        initial_state = get_assembly_initial_state(
+            fwd_reads=MEDIA_ROOT / Path(str(sample_instance.fwd_reads)),
+            rev_reads=MEDIA_ROOT / Path(str(sample_instance.rev_reads)),
             outdir=outdir,
             sample_id=str(sample_instance.sample_id)
         )
-        # Do a check to make sure the assembly isn't empty
-        if polished_assembly.stat().st_size == 0:
+        try:
+            results = stage_graph.run(state=initial_state, force=rerun_stages,
+                                      max_workers=settings.ASSEMBLY_STAGE_MAX_WORKERS)
+        except EmptyAssemblyError:
             logger.warning(f"The input assembly for {sample_instance} is empty. Skipping downstream analyses.")
             return
 
-        # Run and parse Qualimap
-        qualimap_result_file = call_qualimap(bamfile=bamfile, outdir=outdir)
-        mean_coverage, std_coverage = extract_coverage_from_qualimap_results(qualimap_result_file=qualimap_result_file)
-
-        # Clean up extraneous files and move the assembly to the root of the sample folder
-        polished_assembly = assembly_cleanup(assembly_dir=outdir, assembly=polished_assembly)
-
-        # Run and parse Quast
-        report_file = run_quast(assembly=polished_assembly, outdir=outdir)
-        quast_df = get_quast_df(report_file)
-
-        # Run prodigal to get gene count
-        num_predicted_genes = prodigal_pipeline(assembly=polished_assembly, outdir=outdir)
-
-        # Push the data to the database for SampleAssemblyData
-        sample_assembly_instance = upload_sampleassembly_data(sample_assembly_instance=sample_assembly_instance,
-                                                              assembly=polished_assembly,
-                                                              quast_df=quast_df,
-                                                              mean_coverage=mean_coverage,
-                                                              std_coverage=std_coverage,
-                                                              num_predicted_genes=num_predicted_genes)
-        sample_assembly_instance.save()
-        logger.info(f"Saved assembly data for {sample_instance}")
-
-        # Run confindr to get contamination info
-        logger.info(f"Running Confindr on {sample_instance}...")
-        confindr_instance = dotheconfindr(assembly_instance=assemble_sample_instance, sample=sample_instance)
-        confindr_instance.save()
-
-        # Run Mash and save the results to a MashResult model instance
-        if sample_assembly_instance.get_assembly_path().stat().st_size > 800:
-            print(sample_assembly_instance.get_assembly_path().stat().st_size)
-            logger.info(f"Running Mash on {sample_instance}...")
-            mash_result_object = create_mash_result_object(assembly_instance=assemble_sample_instance,
-                                                           sample=sample_instance)
-            mash_result_object.save()
-        else:
-            logger.warning(f"The input assembly for {sample_instance} is too small to pass to Mash. Skipping.")
+        record_assembly_results(sample_instance=sample_instance, sample_assembly_instance=sample_assembly_instance,
+                                results=results)
     else:
         logger.info(f"Assembly for {sample_assembly_instance.sample_id} already exists. Skipping.")
 
 
-def dotheconfindr(assembly_instance: SampleAssemblyData, sample: Sample) -> ConfindrResultAssembly:
+def record_assembly_results(sample_instance: Sample, sample_assembly_instance: SampleAssemblyData, results: dict):
+    """
+    Stores the outputs of the assembly StageGraph in SampleAssemblyData, ConfindrResultAssembly and MashResult
+    :param sample_instance: Sample that was assembled
+    :param sample_assembly_instance: SampleAssemblyData instance to update
+    :param results: Final state returned by StageGraph.run()
+    All three models are written in a single transaction.
+    """
+    quast_df = get_quast_df(results['quast_report'])
+    with transaction.atomic():
+        _record_assembly_results(sample_instance=sample_instance, sample_assembly_instance=sample_assembly_instance,
+                                 results=results, quast_df=quast_df)
+
+
+def _record_assembly_results(sample_instance: Sample, sample_assembly_instance: SampleAssemblyData, results: dict,
+                             quast_df: pd.DataFrame):
+    # Push the data to the database for SampleAssemblyData
+    sample_assembly_instance = upload_sampleassembly_data(sample_assembly_instance=sample_assembly_instance,
+                                                          assembly=results['polished_assembly'],
+                                                          quast_df=quast_df,
+                                                          mean_coverage=results['mean_coverage'],
+                                                          std_coverage=results['std_coverage'],
+                                                          num_predicted_genes=results['num_predicted_genes'])
+    sample_assembly_instance.save()
+    logger.info(f"Saved assembly data for {sample_instance}")
+
+    # Confindr contamination info; the confindr stage has already logged a missing report
+    if results['confindr_report'] is not None:
+        confindr_instance = dotheconfindr(assembly_instance=sample_assembly_instance, sample=sample_instance,
+                                          confindr_report=results['confindr_report'])
+        confindr_instance.save()
+
+    # Mash results; the mash stage skips assemblies that are too small
+    if results['mash_result_file'] is not None:
+        mash_result_object = create_mash_result_object(assembly_instance=sample_assembly_instance,
+                                                       sample=sample_instance,
+                                                       mash_result_file=results['mash_result_file'])
+        mash_result_object.save()
+
+
+def dotheconfindr(assembly_instance: SampleAssemblyData, sample: Sample,
+                  confindr_report: Path = None) -> ConfindrResultAssembly:
+    """
+    Populates the ConfindrResultAssembly for a sample. Confindr is called unless an existing report is provided.
+    :param assembly_instance: SampleAssemblyData instance for the sample
+    :param sample: Sample instance
+    :param confindr_report: Optional path to a confindr_report.csv already generated for the sample
+    :return: Populated ConfindrResultAssembly instance
+    """
     confindr_result_object, cr_created = ConfindrResultAssembly.objects.get_or_create(sample_id=sample)
-    result, result_file = confindr_result_object.get_confindr_result()
+    if confindr_report is None:
+        result, result_file = confindr_result_object.get_confindr_result()
+    else:
+        result, result_file = confindr_result_object.parse_confindr_report(confindr_report), confindr_report
     confindr_result_object.contamination_csv = upload_analysis_file(sample, filename=result_file.name, analysis_folder='assembly/confindr')
+    confindr_result_object.confindr_version = get_tool_version('confindr')
 
     if result is not None:
         confindr_result_object.genus = result['genus']
@@ -589,13 +720,24 @@ def dotheconfindr(assembly_instance: SampleAssemblyData, sample: Sample) -> Conf
     return confindr_result_object
 
 
-
-def create_mash_result_object(assembly_instance: SampleAssemblyData, sample: Sample) -> MashResult:
+def create_mash_result_object(assembly_instance: SampleAssemblyData, sample: Sample,
+                              mash_result_file: Path = None) -> MashResult:
+    """
+    Populates the MashResult for a sample. Mash is called unless an existing result file is provided.
+    :param assembly_instance: SampleAssemblyData instance for the sample
+    :param sample: Sample instance
+    :param mash_result_file: Optional path to a Mash result file already generated for the sample
+    :return: Populated MashResult instance
+    """
     mash_result_object, mr_created = MashResult.objects.get_or_create(sample_id=sample)
-    top_mash_result, mash_result_file = mash_result_object.get_top_mash_hit()
+    if mash_result_file is None:
+        top_mash_result, mash_result_file = mash_result_object.get_top_mash_hit()
+    else:
+        top_mash_result = MashResult.get_top_mash_result(mash_result_file=mash_result_file)
     mash_result_object.mash_result_file = upload_analysis_file(sample,
                                                                filename=mash_result_file.name,
                                                                analysis_folder='assembly')
+    mash_result_object.mash_version = get_tool_version('mash')
     if top_mash_result is not None:
         mash_result_object.top_hit = top_mash_result['hit']
         mash_result_object.top_identity = top_mash_result['identity']
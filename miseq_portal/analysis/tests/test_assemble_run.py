@@ -1,4 +1,5 @@
 import tempfile
+from subprocess import CalledProcessError
 import pytest
 from pathlib import Path, PosixPath
 from miseq_portal.analysis.tools import assemble_run
@@ -47,3 +48,38 @@ def test_get_bbduk_version():
 def test_get_pilon_version():
     pilon_version = assemble_run.get_pilon_version()
     assert 'pilon' in pilon_version.lower()
+
+
+def test_get_assembly_stage_graph():
+    outdir = Path(tempfile.mkdtemp())
+    streaming_graph = assemble_run.get_assembly_stage_graph(outdir, streaming=True)
+    assert 'preprocess' in streaming_graph.stage_dict
+    assert not {'repair', 'bbduk', 'tadpole'} & set(streaming_graph.stage_dict)
+    assert streaming_graph.producers['corrected_fwd_reads'].name == 'preprocess'
+
+    graph = assemble_run.get_assembly_stage_graph(outdir, streaming=False)
+    assert {'repair', 'bbduk', 'tadpole'} <= set(graph.stage_dict)
+    assert 'preprocess' not in graph.stage_dict
+    assert graph.producers['corrected_fwd_reads'].name == 'tadpole'
+
+
+def test_streaming_preprocessing_failure_is_not_checkpointed(monkeypatch):
+    outdir = Path(tempfile.mkdtemp())
+    commands = []
+
+    def failing_pipeline(cmd, cwd=None):
+        commands.append(cmd)
+        (outdir / 'filtered_interleaved.fq').write_text('@truncated\n')
+        raise CalledProcessError(137, cmd)
+
+    monkeypatch.setattr(assemble_run, 'run_pipeline', failing_pipeline)
+    graph = assemble_run.get_assembly_stage_graph(outdir, streaming=True)
+    state = {'fwd_reads': outdir / 'sample_R1.fastq.gz', 'rev_reads': outdir / 'sample_R2.fastq.gz',
+             'outdir': outdir}
+    with pytest.raises(CalledProcessError):
+        graph.run_stage(graph.stage_dict['preprocess'], state)
+
+    # Tadpole never runs on the truncated reads and the stage is left to be rerun
+    assert len(commands) == 1 and 'repair.sh' in commands[0]
+    assert not graph.manifest_path('preprocess').exists()
+    assert not (outdir / 'filtered_interleaved.fq').exists()
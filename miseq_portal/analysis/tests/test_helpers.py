@@ -1,3 +1,7 @@
+import os
+import tempfile
+from subprocess import CalledProcessError
+
 import mock
 import pytest
 from pathlib import Path
@@ -10,5 +14,24 @@ def test_run_subprocess():
     assert helpers.run_subprocess("echo test", get_stdout=True) == "test"
 
 
+def test_run_pipeline():
+    helpers.run_pipeline("echo test | cat > /dev/null")
+    # The pipeline fails even though its last command succeeds
+    with pytest.raises(CalledProcessError):
+        helpers.run_pipeline("false | cat")
+
+
 def test_remove_dir_files():
     assert helpers.remove_fastq_and_bam_files(Path("/fake/directory")) is None
+
+
+def test_file_checksum():
+    assembly = Path(tempfile.mkdtemp()) / 'assembly.fasta'
+    assembly.write_text('>contig_1\nACGT\n')
+    checksum = helpers.file_checksum(assembly)
+    assert checksum == helpers.file_checksum(assembly)
+
+    # Modified files are checksummed again rather than served from the memoized value
+    assembly.write_text('>contig_1\nACGTACGT\n')
+    os.utime(str(assembly), ns=(0, 0))
+    assert helpers.file_checksum(assembly) != checksum
@@ -0,0 +1,97 @@
+import tempfile
+from datetime import date
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from model_mommy import mommy
+
+from miseq_portal.analysis.ingest import index_confindr_report, parse_confindr_row, CONFINDR_RESULT_FIELDS, \
+    ingest_stx_results, ingest_mob_suite_plasmids
+from miseq_portal.analysis.models import AnalysisSample, MobSuiteAnalysisGroup, StxGeneResult, StxSampleResult
+from miseq_portal.analysis.tools.plasmid_report import MobTyperPlasmid
+from miseq_portal.miseq_viewer.models import Sample
+
+pytestmark = pytest.mark.django_db
+
+CONFINDR_REPORT = """Sample,Genus,NumContamSNVs,ContamStatus,PercentContam,PercentContamStandardDeviation,BasesExamined,DatabaseDownloadDate
+BMH-2019-000001,Escherichia,0,False,ND,ND,12345,2019-05-01
+BMH-2019-000002,Salmonella,12,True,5.5,1.2,23456,2019-05-01
+BMH-2019-000002,Salmonella,12,True,5.5,1.2,23456,2019-05-01
+0001,Listeria,0,False,0.0,0.0,34567,2019-05-01
+"""
+
+
+def write_report() -> Path:
+    report_path = Path(tempfile.mkdtemp()) / 'confindr_report.csv'
+    report_path.write_text(CONFINDR_REPORT)
+    return report_path
+
+
+def test_index_confindr_report():
+    index = index_confindr_report(write_report())
+    assert set(index) == {'BMH-2019-000001', 'BMH-2019-000002', '0001'}
+    assert index['BMH-2019-000002']['NumContamSNVs'] == 12
+
+
+def test_parse_confindr_row():
+    index = index_confindr_report(write_report())
+    values = parse_confindr_row(index['BMH-2019-000002'])
+    assert values['genus'] == 'Salmonella'
+    assert values['num_contam_snvs'] == 12
+    assert values['percent_contam'] == 5.5
+    assert values['database_download_date'] == date(2019, 5, 1)
+
+    # Undetermined contamination is stored as NaN
+    values = parse_confindr_row(index['BMH-2019-000001'])
+    assert values['percent_contam'] != values['percent_contam']
+
+
+def test_parse_confindr_row_malformed():
+    values = parse_confindr_row({'Genus': 'Escherichia', 'NumContamSNVs': 'not a number'})
+    assert values == {field: None for field in CONFINDR_RESULT_FIELDS}
+
+
+def test_ingest_stx_results():
+    analysis_samples = [mommy.make(AnalysisSample, sample_id=mommy.make(Sample, sample_id=sample_id))
+                        for sample_id in ('BMH-2019-000001', 'BMH-2019-000002')]
+    nf_info = {
+        'persample_results': {'BMH-2019-000001': {'kma': 'kma/BMH-2019-000001.res'}},
+        'persample_result_vals': {'BMH-2019-000001': {'NCBI-Stx Type': 'stx2a', 'KMA-Depth': '45.1'}},
+        'perstx_results': {'BMH-2019-000001': {'stx2_contig_1_1500': {'motif': 'motifs/stx2_aligned_motif.txt'}}},
+    }
+    sample_results, gene_results = ingest_stx_results(analysis_samples=analysis_samples, nf_info=nf_info,
+                                                      analysis_dir=Path('analysis_groups/Stx/1'))
+    assert len(sample_results) == 2
+    result = StxSampleResult.objects.get(analysis_sample=analysis_samples[0])
+    assert result.ncbi_stx_type == 'stx2a'
+    assert result.kma_depth == '45.1'
+    assert str(result.kma_report) == 'analysis_groups/Stx/1/kma/BMH-2019-000001.res'
+    assert str(result.stxtyper_report) == ''
+
+    # Samples without any stx results still get an empty StxSampleResult
+    assert StxSampleResult.objects.get(analysis_sample=analysis_samples[1]).ncbi_stx_type == ''
+
+    gene_result = StxGeneResult.objects.get()
+    assert (gene_result.gene, gene_result.contig, gene_result.loc) == ('stx2', 'contig_1', '1500')
+    assert str(gene_result.motif) == 'analysis_groups/Stx/1/motifs/stx2_aligned_motif.txt'
+    assert str(gene_result.tree) == ''
+
+
+def test_ingest_mob_suite_plasmids():
+    sample = mommy.make(Sample, sample_id='BMH-2019-000001')
+    mob_suite_analysis_group = mommy.make(MobSuiteAnalysisGroup, analysis_sample__sample_id=sample)
+    aggregate_report = {'plasmid_AA001.fasta': MobTyperPlasmid(file_id='plasmid_AA001.fasta', num_contigs=3,
+                                                               rep_type='IncFII')}
+    with mock.patch.object(MobSuiteAnalysisGroup, 'get_aggregate_report', return_value=aggregate_report):
+        plasmids = ingest_mob_suite_plasmids(mob_suite_analysis_group=mob_suite_analysis_group,
+                                             plasmid_fasta_list=[Path('/tmp/mob/plasmid_AA001.fasta'),
+                                                                 Path('/tmp/mob/plasmid_AA002.fasta')],
+                                             root_sample_instance=sample, mobsuite_dir_name='mob_recon')
+    assert len(plasmids) == 2
+    plasmids = {str(plasmid.plasmid_fasta).rsplit('/', 1)[1]: plasmid
+                for plasmid in mob_suite_analysis_group.mobsuiteanalysisplasmid_set.all()}
+    assert plasmids['plasmid_AA001.fasta'].num_contigs == 3
+    assert plasmids['plasmid_AA001.fasta'].rep_type == 'IncFII'
+    # A plasmid missing from the aggregate report is stored without mob_typer values
+    assert plasmids['plasmid_AA002.fasta'].num_contigs is None
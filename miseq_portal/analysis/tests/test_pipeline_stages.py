@@ -0,0 +1,162 @@
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+from miseq_portal.analysis.tools.pipeline_stages import PipelineStage, StageGraph, StageError
+
+pytestmark = pytest.mark.django_db
+
+
+def build_graph(workdir: Path, calls: list) -> StageGraph:
+    def copy_stage(state):
+        calls.append('copy')
+        out = workdir / 'copy.txt'
+        out.write_text(state['source'].read_text())
+        return {'copy_file': out}
+
+    def upper_stage(state):
+        calls.append('upper')
+        out = workdir / 'upper.txt'
+        out.write_text(state['copy_file'].read_text().upper())
+        return {'upper_file': out}
+
+    def cleanup_stage(state):
+        calls.append('cleanup')
+        os.remove(str(state['copy_file']))
+        return {}
+
+    def length_stage(state):
+        calls.append('length')
+        return {'length': len(state['upper_file'].read_text())}
+
+    stages = [
+        PipelineStage(name='copy', func=copy_stage, inputs=['source'], outputs=['copy_file'], intermediate=True),
+        PipelineStage(name='upper', func=upper_stage, inputs=['copy_file'], outputs=['upper_file']),
+        PipelineStage(name='cleanup', func=cleanup_stage, inputs=['copy_file'], after=['upper']),
+        PipelineStage(name='length', func=length_stage, inputs=['upper_file'], outputs=['length']),
+    ]
+    return StageGraph(stages=stages, manifest_dir=workdir / '.checkpoints')
+
+
+def setup_workdir() -> tuple:
+    workdir = Path(tempfile.mkdtemp())
+    source = workdir / 'source.txt'
+    source.write_text('abc')
+    return workdir, {'source': source}
+
+
+def test_stage_graph_runs_all_stages():
+    workdir, state = setup_workdir()
+    calls = []
+    graph = build_graph(workdir, calls)
+    assert not graph.has_checkpoints()
+    results = graph.run(state=state)
+    assert calls == ['copy', 'upper', 'cleanup', 'length']
+    assert results['length'] == 3
+    assert graph.has_checkpoints()
+
+
+def test_stage_graph_resumes_completed_stages():
+    workdir, state = setup_workdir()
+    graph = build_graph(workdir, [])
+    graph.run(state=state)
+
+    calls = []
+    graph = build_graph(workdir, calls)
+    results = graph.run(state=state)
+    assert calls == []
+    assert results['length'] == 3
+    assert results['upper_file'] == workdir / 'upper.txt'
+
+
+def test_stage_graph_resumes_after_interruption():
+    workdir, state = setup_workdir()
+    graph = build_graph(workdir, [])
+    graph.run(state=state)
+    graph.invalidate('length')
+
+    calls = []
+    graph = build_graph(workdir, calls)
+    graph.run(state=state)
+    assert calls == ['length']
+
+
+def test_stage_graph_force_reruns_downstream_stage_only():
+    workdir, state = setup_workdir()
+    graph = build_graph(workdir, [])
+    graph.run(state=state)
+
+    calls = []
+    graph = build_graph(workdir, calls)
+    graph.run(state=state, force=['length'])
+    assert calls == ['length']
+
+
+def test_stage_graph_force_unknown_stage():
+    workdir, state = setup_workdir()
+    graph = build_graph(workdir, [])
+    graph.run(state=state)
+
+    calls = []
+    graph = build_graph(workdir, calls)
+    with pytest.raises(ValueError):
+        graph.run(state=state, force=['lenght'])
+    assert calls == []
+    assert graph.has_checkpoints()
+
+
+def test_stage_graph_regenerates_cleaned_up_inputs():
+    workdir, state = setup_workdir()
+    graph = build_graph(workdir, [])
+    graph.run(state=state)
+
+    # copy.txt has been deleted by the cleanup stage, so rerunning 'upper' requires rerunning 'copy'
+    calls = []
+    graph = build_graph(workdir, calls)
+    graph.run(state=state, force=['upper'])
+    assert calls == ['copy', 'upper', 'cleanup', 'length']
+
+
+def test_stage_graph_reruns_on_changed_input():
+    workdir, state = setup_workdir()
+    graph = build_graph(workdir, [])
+    graph.run(state=state)
+
+    state['source'].write_text('abcdef')
+    os.utime(str(state['source']), ns=(0, 0))
+    calls = []
+    graph = build_graph(workdir, calls)
+    results = graph.run(state=state)
+    assert calls == ['copy', 'upper', 'cleanup', 'length']
+    assert results['length'] == 6
+
+
+def test_stage_graph_missing_output():
+    workdir, state = setup_workdir()
+    graph = StageGraph(stages=[PipelineStage(name='noop', func=lambda s: {'out': workdir / 'missing.txt'},
+                                             outputs=['out'])],
+                       manifest_dir=workdir / '.checkpoints')
+    with pytest.raises(StageError):
+        graph.run(state=state)
+    assert not graph.has_checkpoints()
+
+
+def test_stage_graph_runs_independent_stages_concurrently():
+    workdir, state = setup_workdir()
+    # Both stages must be waiting on the barrier at the same time, otherwise it times out and breaks
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_stage(key):
+        def func(s):
+            barrier.wait()
+            return {key: True}
+        return func
+
+    graph = StageGraph(stages=[PipelineStage(name='first', func=wait_stage('first'), outputs=['first']),
+                               PipelineStage(name='second', func=wait_stage('second'), outputs=['second'])],
+                       manifest_dir=workdir / '.checkpoints')
+    results = graph.run(state=state, max_workers=2)
+    assert results['first'] and results['second']
@@ -0,0 +1,46 @@
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from miseq_portal.analysis.tools.plasmid_report import read_mobtyper_aggregate_report
+
+pytestmark = pytest.mark.django_db
+
+AGGREGATE_REPORT = "\t".join(['file_id', 'num_contigs', 'total_length', 'gc', 'rep_type(s)', 'rep_type_accession(s)',
+                              'relaxase_type(s)', 'relaxase_type_accession(s)', 'PredictedMobility',
+                              'mash_nearest_neighbor', 'mash_neighbor_distance', 'mash_neighbor_cluster']) + "\n" + \
+                   "\t".join(['plasmid_AA474.fasta', '3', '91234', '0.5123', 'IncFII', '000123__NC_011102', 'MOBF',
+                              'NC_011102', 'Conjugative', 'CP012345', '0.0123', '474']) + "\n" + \
+                   "\t".join(['plasmid_AA123.fasta', '1', '4321', '0.4', '-', '-', '-', '-', 'Non-mobilizable', '',
+                              '', '']) + "\n"
+
+
+def write_report() -> Path:
+    report_path = Path(tempfile.mkdtemp()) / 'mobtyper_aggregate_report.txt'
+    report_path.write_text(AGGREGATE_REPORT)
+    return report_path
+
+
+def test_read_mobtyper_aggregate_report():
+    report = read_mobtyper_aggregate_report(write_report())
+    assert len(report) == 2
+    plasmid = report.get('plasmid_AA474.fasta')
+    assert plasmid.num_contigs == 3
+    assert plasmid.total_length == 91234
+    assert plasmid.gc_content == 0.5123
+    assert plasmid.predicted_mobility == 'Conjugative'
+    assert plasmid.mash_neighbor_distance == 0.0123
+    assert plasmid.mash_neighbor_cluster == '474'
+    assert 'file_id' not in plasmid.model_values()
+
+    plasmid = report.get('plasmid_AA123.fasta')
+    assert plasmid.rep_type == '-'
+    assert plasmid.mash_nearest_neighbor is None
+    assert plasmid.mash_neighbor_distance is None
+    assert report.get('plasmid_missing.fasta') is None
+
+
+def test_read_mobtyper_aggregate_report_is_memoized():
+    report_path = write_report()
+    assert read_mobtyper_aggregate_report(report_path) is read_mobtyper_aggregate_report(report_path)
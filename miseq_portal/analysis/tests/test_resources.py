@@ -0,0 +1,57 @@
+import json
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from miseq_portal.analysis.tools.resources import ResourceBroker, parse_memory_gb
+
+pytestmark = pytest.mark.django_db
+
+
+def get_broker(total_cpus: int = 8, total_memory_gb: int = 16) -> ResourceBroker:
+    return ResourceBroker(state_dir=Path(tempfile.mkdtemp()), total_cpus=total_cpus,
+                          total_memory_gb=total_memory_gb, poll_interval=0.01)
+
+
+def test_parse_memory_gb():
+    assert parse_memory_gb('65g') == 65
+    assert parse_memory_gb('2048m') == 2
+    assert parse_memory_gb('100m') == 1
+    assert parse_memory_gb(4) == 4
+
+
+def test_reserve_caps_request_to_node():
+    broker = get_broker()
+    with broker.reserve('tool', cpus=64, memory_gb=128) as grant:
+        assert grant.cpus == 8
+        assert grant.memory_gb == 16
+        assert grant.java_heap == '16g'
+        assert broker.available() == (0, 0)
+    assert broker.available() == (8, 16)
+
+
+def test_reserve_shrinks_to_remaining_capacity():
+    broker = get_broker()
+    with broker.reserve('first', cpus=6, memory_gb=12):
+        assert broker.try_acquire('second', cpus=4, memory_gb=8, min_cpus=4, min_memory_gb=8) is None
+        with broker.reserve('second', cpus=4, memory_gb=8, min_cpus=1, min_memory_gb=2) as grant:
+            assert grant.cpus == 2
+            assert grant.memory_gb == 4
+
+
+def test_release_on_exception():
+    broker = get_broker()
+    with pytest.raises(RuntimeError):
+        with broker.reserve('tool', cpus=4, memory_gb=4):
+            raise RuntimeError
+    assert broker.available() == (8, 16)
+
+
+def test_reservations_of_dead_processes_are_discarded():
+    broker = get_broker()
+    broker.state_dir.mkdir(parents=True, exist_ok=True)
+    # PIDs are capped well below this value, so the process cannot exist
+    with open(str(broker.ledger_path), 'w') as f:
+        json.dump({'stale': {'pid': 2 ** 30, 'tool': 'tool', 'cpus': 8, 'memory_gb': 16}}, f)
+    assert broker.available() == (8, 16)
@@ -0,0 +1,112 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.conf import settings
+from django.utils import timezone
+from model_mommy import mommy
+
+from miseq_portal.analysis.models import AnalysisResultCache, AnalysisSample
+from miseq_portal.analysis.tools import result_cache
+from miseq_portal.analysis.tools.result_cache import build_cache_key, claim_cache_entry, run_cached
+
+pytestmark = pytest.mark.django_db
+
+
+def test_build_cache_key():
+    key = build_cache_key(tool='RGI', input_checksum='abc', tool_version='5.1.0', params={'clean': True})
+    assert len(key) == 64
+    assert key == build_cache_key(tool='RGI', input_checksum='abc', tool_version='5.1.0', params={'clean': True})
+    assert key != build_cache_key(tool='RGI', input_checksum='abc', tool_version='5.1.1', params={'clean': True})
+    assert key != build_cache_key(tool='RGI', input_checksum='abd', tool_version='5.1.0', params={'clean': True})
+    assert key != build_cache_key(tool='MobRecon', input_checksum='abc', tool_version='5.1.0', params={'clean': True})
+    assert key != build_cache_key(tool='RGI', input_checksum='abc', tool_version='5.1.0', params={'clean': False})
+
+
+def claim(sample_instance: AnalysisSample, **kwargs) -> tuple:
+    return claim_cache_entry(cache_key='key', tool='RGI', sample_instance=sample_instance, input_checksum='abc',
+                             tool_version='5.1.0', **kwargs)
+
+
+def age_entry(entry: AnalysisResultCache, **kwargs):
+    # update() bypasses auto_now on modified
+    AnalysisResultCache.objects.filter(pk=entry.pk).update(modified=timezone.now() - timedelta(**kwargs))
+
+
+def test_claim_cache_entry():
+    owner, other = mommy.make(AnalysisSample), mommy.make(AnalysisSample)
+    entry, owned = claim(owner)
+    assert owned and entry.status == 'Working' and entry.analysis_sample == owner
+
+    # Another sample waits on the running entry, while a retry of the owner runs again
+    assert claim(other) == (entry, False)
+    assert claim(owner)[1]
+
+    # A completed entry is reused until it expires
+    result_cache.set_cache_entry_status(entry, 'Complete')
+    assert not claim(other)[1]
+    assert not claim(owner)[1]
+    age_entry(entry, days=2)
+    entry, owned = claim(other, max_age=timedelta(days=1))
+    assert owned and entry.analysis_sample == other
+
+
+def test_claim_takes_over_failed_and_stale_entries():
+    owner, other = mommy.make(AnalysisSample), mommy.make(AnalysisSample)
+    entry, _ = claim(owner)
+    result_cache.set_cache_entry_status(entry, 'Failed')
+    entry, owned = claim(other)
+    assert owned and entry.analysis_sample == other and entry.status == 'Working'
+
+    age_entry(entry, hours=settings.RESULT_CACHE_STALE_HOURS + 1)
+    entry, owned = claim(owner)
+    assert owned and entry.analysis_sample == owner
+
+
+def cached(sample_instance: AnalysisSample, compute, reuse):
+    return run_cached(sample_instance=sample_instance, tool='RGI', input_checksum='abc', tool_version='5.1.0',
+                      params={}, compute=compute, reuse=reuse)
+
+
+def test_run_cached_reuses_complete_entry():
+    owner, other = mommy.make(AnalysisSample), mommy.make(AnalysisSample)
+    compute = mock.Mock(return_value='computed')
+    reuse = mock.Mock(return_value='reused')
+    assert cached(owner, compute, reuse) == 'computed'
+    assert cached(other, compute, reuse) == 'reused'
+    compute.assert_called_once_with(owner)
+    reuse.assert_called_once_with(owner, other)
+
+
+def test_run_cached_recomputes_when_reuse_fails():
+    owner, other = mommy.make(AnalysisSample), mommy.make(AnalysisSample)
+    cached(owner, compute=lambda instance: 'computed', reuse=None)
+    compute = mock.Mock(return_value='recomputed')
+    assert cached(other, compute, reuse=lambda source, instance: None) == 'recomputed'
+    assert AnalysisResultCache.objects.get().analysis_sample == other
+
+
+def test_run_cached_waits_on_running_entry():
+    owner, other = mommy.make(AnalysisSample), mommy.make(AnalysisSample)
+    entry, _ = claim_cache_entry(cache_key=build_cache_key(tool='RGI', input_checksum='abc', tool_version='5.1.0',
+                                                           params={}),
+                                 tool='RGI', sample_instance=owner, input_checksum='abc', tool_version='5.1.0')
+
+    # The running job finishes while the second job is waiting
+    def sleep(seconds):
+        result_cache.set_cache_entry_status(entry, 'Complete')
+
+    compute = mock.Mock()
+    with mock.patch.object(result_cache.time, 'sleep', side_effect=sleep) as patched_sleep:
+        assert cached(other, compute, reuse=lambda source, instance: 'reused') == 'reused'
+    patched_sleep.assert_called_once()
+    compute.assert_not_called()
+
+
+def test_run_cached_marks_failures():
+    owner = mommy.make(AnalysisSample)
+    with pytest.raises(ValueError):
+        cached(owner, compute=mock.Mock(side_effect=ValueError), reuse=None)
+    assert AnalysisResultCache.objects.get().status == 'Failed'
+    cached(owner, compute=lambda instance: None, reuse=None)
+    assert AnalysisResultCache.objects.get().status == 'Failed'
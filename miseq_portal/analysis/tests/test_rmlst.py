@@ -0,0 +1,128 @@
+import base64
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from miseq_portal.analysis.tools.rmlst import Base64SequencePayload, RMLSTClient, RMLSTResponseCache, RMLSTError, \
+    write_rmlst_results
+
+pytestmark = pytest.mark.django_db
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockRMLSTHandler(BaseHTTPRequestHandler):
+    """ Stand-in for the rMLST sequence endpoint. Fails the first server.failures requests with a 503. """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(body)
+        if len(self.server.requests) <= self.server.failures:
+            self.send_response(503)
+            self.end_headers()
+            return
+        sequence = base64.b64decode(json.loads(body.decode())['sequence']).decode()
+        response = {
+            'taxon_prediction': [{'support': 100, 'taxon': 'Escherichia coli'}],
+            'fields': {'rST': 1},
+            'exact_matches': {'BACT000001': [{'allele_id': '1', 'length': len(sequence), 'contig': 'contig_1',
+                                              'start': 1, 'end': len(sequence)}]},
+        }
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(response).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def rmlst_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockRMLSTHandler)
+    server.requests = []
+    server.failures = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def write_assembly(sequence: str = 'ACGT' * 1000) -> Path:
+    assembly = Path(tempfile.mkdtemp()) / 'assembly.fasta'
+    assembly.write_text(f'>contig_1\n{sequence}\n')
+    return assembly
+
+
+def get_client(server, **kwargs) -> RMLSTClient:
+    return RMLSTClient(uri=f'http://127.0.0.1:{server.server_address[1]}/sequence', backoff=0, **kwargs)
+
+
+def test_payload_matches_in_memory_encoding():
+    assembly = write_assembly('ACGTN' * 1001)
+    payload = Base64SequencePayload(assembly, chunk_size=3 * 7)
+    expected = '{"base64":true,"details":true,"sequence":"' + \
+               base64.b64encode(assembly.read_bytes()).decode() + '"}'
+    body = b''.join(payload)
+    assert body.decode() == expected
+    assert len(payload) == len(body)
+    # Iterable more than once, so requests can be retried
+    assert b''.join(payload) == body
+
+
+def test_query_retries_transient_errors(rmlst_server):
+    rmlst_server.failures = 2
+    data = get_client(rmlst_server, max_retries=2).query(write_assembly())
+    assert data['taxon_prediction'][0]['taxon'] == 'Escherichia coli'
+    assert len(rmlst_server.requests) == 3
+
+
+def test_query_gives_up_after_max_retries(rmlst_server):
+    rmlst_server.failures = 5
+    with pytest.raises(RMLSTError):
+        get_client(rmlst_server, max_retries=1).query(write_assembly())
+    assert len(rmlst_server.requests) == 2
+
+
+def test_query_uses_response_cache(rmlst_server):
+    cache = RMLSTResponseCache(cache_dir=Path(tempfile.mkdtemp()))
+    client = get_client(rmlst_server, cache=cache)
+    assembly = write_assembly()
+    first = client.query(assembly)
+    second = client.query(assembly)
+    assert first == second
+    assert len(rmlst_server.requests) == 1
+
+
+def test_query_many(rmlst_server):
+    assemblies = [write_assembly('ACGT' * (i + 1)) for i in range(6)]
+    results = get_client(rmlst_server, pool_size=3).query_many(assemblies)
+    assert len(results) == 6
+    for assembly, data in results.items():
+        assert data['exact_matches']['BACT000001'][0]['length'] == len(assembly.read_text())
+
+
+def test_query_many_returns_unexpected_errors(rmlst_server):
+    assembly = write_assembly()
+    missing_assembly = Path(tempfile.mkdtemp()) / 'missing.fasta'
+    results = get_client(rmlst_server).query_many([assembly, missing_assembly])
+    assert 'exact_matches' in results[assembly]
+    assert isinstance(results[missing_assembly], RMLSTError)
+
+
+def test_write_rmlst_results(rmlst_server):
+    data = get_client(rmlst_server).query(write_assembly())
+    root = Path(tempfile.mkdtemp())
+    (root / 'rmlst').mkdir()
+    results = write_rmlst_results(data=data, outdir=Path('rmlst'), root=root)
+    assert results['taxon'] == 'Escherichia coli'
+    assert results['rST'] == 1
+    assert (root / results['csv']).read_text().startswith('Locus,Allele,Length,Contig,Start,End\nBACT000001,1,')
@@ -0,0 +1,67 @@
+from unittest import mock
+
+import pytest
+from model_mommy import mommy
+
+from miseq_portal.analysis import tasks
+from miseq_portal.analysis.models import AnalysisGroup, AnalysisSample
+from miseq_portal.miseq_viewer.models import Sample, SampleAssemblyData
+
+pytestmark = pytest.mark.django_db
+
+
+def make_group(sample_count: int, job_type: str = 'SendSketch') -> (AnalysisGroup, [AnalysisSample]):
+    analysis_group = mommy.make(AnalysisGroup, job_type=job_type, job_status='Working')
+    analysis_samples = [mommy.make(AnalysisSample, group_id=analysis_group) for _ in range(sample_count)]
+    return analysis_group, analysis_samples
+
+
+@mock.patch.object(tasks, 'submit_sendsketch_job')
+@mock.patch.object(tasks.finalize_analysis_group, 'apply_async')
+def test_last_sample_finalizes_group_once(apply_async, submit_sendsketch_job):
+    analysis_group, analysis_samples = make_group(3)
+    for analysis_sample in analysis_samples:
+        apply_async.assert_not_called()
+        tasks.submit_analysis_sample_job(analysis_sample=analysis_sample.id)
+    apply_async.assert_called_once_with(kwargs={'analysis_group': analysis_group.id}, queue='analysis_queue')
+    assert not AnalysisSample.objects.exclude(job_status='Complete').exists()
+
+
+@mock.patch.object(tasks, 'submit_sendsketch_job')
+@mock.patch.object(tasks.finalize_analysis_group, 'apply_async')
+def test_failed_sample_fails_group(apply_async, submit_sendsketch_job):
+    analysis_group, analysis_samples = make_group(2)
+    submit_sendsketch_job.side_effect = [None, RuntimeError('sendsketch.sh failed')]
+    for analysis_sample in analysis_samples:
+        tasks.submit_analysis_sample_job(analysis_sample=analysis_sample.id)
+    assert AnalysisSample.objects.get(id=analysis_samples[1].id).job_status == 'Failed'
+
+    tasks.finalize_analysis_group(analysis_group=analysis_group.id)
+    analysis_group.refresh_from_db()
+    assert analysis_group.job_status == 'Failed'
+
+
+@mock.patch.object(tasks.finalize_analysis_group, 'apply_async')
+def test_empty_group_is_finalized(apply_async):
+    analysis_group, _ = make_group(0)
+    tasks.submit_analysis_job(analysis_group=analysis_group.id)
+    apply_async.assert_called_once_with(kwargs={'analysis_group': analysis_group.id}, queue='analysis_queue')
+
+    tasks.finalize_analysis_group(analysis_group=analysis_group.id)
+    analysis_group.refresh_from_db()
+    assert analysis_group.job_status == 'Complete'
+
+
+def test_rerun_without_checkpoints_keeps_assembly(tmp_path):
+    sample = mommy.make(Sample, sample_id='BMH-2019-000001', fwd_reads='BMH-2019-000001/reads/R1.fastq.gz',
+                        rev_reads='BMH-2019-000001/reads/R2.fastq.gz')
+    mommy.make(SampleAssemblyData, sample_id=sample, assembly='BMH-2019-000001/reads/assembly/assembly.fasta')
+    assembly = tmp_path / 'BMH-2019-000001' / 'reads' / 'assembly' / 'assembly.fasta'
+    assembly.parent.mkdir(parents=True)
+    assembly.write_text('>contig_1\nACGT\n')
+
+    with mock.patch.object(tasks, 'MEDIA_ROOT', tmp_path), \
+            mock.patch.object(tasks, 'record_assembly_results') as record_assembly_results:
+        tasks.assemble_sample_instance(sample_object_id=sample.sample_id, rerun_stages=['mash'])
+    assert assembly.exists()
+    record_assembly_results.assert_not_called()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from miseq_portal.analysis.tools.versions import ToolSpec, ToolVersionRegistry, extract_bbtool_version_line
+
+
+def write_tool(directory: Path, version: str) -> Path:
+    executable = directory / 'tool.sh'
+    executable.write_text(f"#!/bin/sh\necho 'Loading tool'\necho 'Tool version {version}'\n")
+    executable.chmod(0o755)
+    return executable
+
+
+def test_extract_bbtool_version_line():
+    assert extract_bbtool_version_line("java -ea -Xmx200m\nBBMap version 38.22\n") == "BBMap version 38.22"
+
+
+def test_version_is_cached_per_executable():
+    executable = write_tool(Path(tempfile.mkdtemp()), '1.0')
+    registry = ToolVersionRegistry({'tool': ToolSpec(executable=str(executable), parser=extract_bbtool_version_line)})
+    with mock.patch.object(registry, 'call_version', wraps=registry.call_version) as call_version:
+        assert registry.get_version('tool') == 'Tool version 1.0'
+        assert registry.get_version('tool') == 'Tool version 1.0'
+    call_version.assert_called_once()
+
+
+def test_changed_executable_is_probed_again():
+    executable = write_tool(Path(tempfile.mkdtemp()), '1.0')
+    registry = ToolVersionRegistry({'tool': ToolSpec(executable=str(executable), parser=extract_bbtool_version_line)})
+    assert registry.get_version('tool') == 'Tool version 1.0'
+
+    # Upgrade the tool in place
+    write_tool(executable.parent, '2.0')
+    stat = executable.stat()
+    os.utime(str(executable), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert registry.get_version('tool') == 'Tool version 2.0'
+
+
+def test_missing_executable():
+    executable = Path(tempfile.mkdtemp()) / 'tool.sh'
+    registry = ToolVersionRegistry({'tool': ToolSpec(executable=str(executable), parser=extract_bbtool_version_line)})
+    assert registry.resolve_executable(registry.tool_specs['tool']) is None
+    # Failed probes are not cached
+    with mock.patch.object(registry, 'call_version', wraps=registry.call_version) as call_version:
+        registry.get_version('tool')
+        registry.get_version('tool')
+    assert call_version.call_count == 2
+
+    # Installing the tool afterwards is picked up on the next lookup
+    write_tool(executable.parent, '1.0')
+    assert registry.get_version('tool') == 'Tool version 1.0'
+
+
+def test_failed_probe_is_not_cached():
+    executable = Path(tempfile.mkdtemp()) / 'tool.sh'
+    executable.write_text("#!/bin/sh\necho 'Could not reserve enough space for object heap' >&2\nexit 1\n")
+    executable.chmod(0o755)
+    registry = ToolVersionRegistry({'tool': ToolSpec(executable=str(executable), parser=extract_bbtool_version_line)})
+    with mock.patch.object(registry, 'call_version', wraps=registry.call_version) as call_version:
+        registry.get_version('tool')
+        registry.get_version('tool')
+    assert call_version.call_count == 2
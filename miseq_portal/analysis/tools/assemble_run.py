@@ -8,6 +8,8 @@ Minimal assembly pipeline. Intended for prokaryotic assemblies.
 5. Assembly metrics with quast.py
 6. Coverage stats with Qualimap
 
+Each step is registered as a PipelineStage (see get_assembly_stage_graph()) so an interrupted assembly resumes from
+the last completed step instead of starting over.
 """
 import logging
 import os
@@ -16,8 +18,13 @@ from pathlib import Path
 
 import pandas as pd
 
-from config.settings.base import MEDIA_ROOT, JAVA_MAX_HEAP
-from miseq_portal.analysis.tools.helpers import run_subprocess, remove_fastq_and_bam_files
+from config.settings.base import MEDIA_ROOT, JAVA_MAX_HEAP, CONFINDR_DB, MASH_REFSEQ_DATABASE, \
+    ASSEMBLY_STREAMING_PREPROCESSING
+from miseq_portal.analysis.models import ConfindrGroupResult, MashResult
+from miseq_portal.analysis.tools.helpers import run_subprocess, run_pipeline, remove_fastq_and_bam_files
+from miseq_portal.analysis.tools.pipeline_stages import PipelineStage, StageGraph
+from miseq_portal.analysis.tools.resources import reserve_resources, parse_memory_gb
+from miseq_portal.analysis.tools.versions import get_tool_version
 from miseq_portal.miseq_viewer.models import SampleAssemblyData, upload_assembly
 
 logger = logging.getLogger('django')
@@ -53,8 +60,11 @@ def call_qualimap(bamfile: Path, outdir: Path) -> Path:
     :return: path to Qualimap genome_results.txt file
     """
     qualimap_dir = outdir / 'qualimap'
-    cmd = f"qualimap bamqc -bam {bamfile} -outdir {qualimap_dir} --java-mem-size={JAVA_MAX_HEAP}"
-    run_subprocess(cmd)
+    with reserve_resources('qualimap', cpus=4, memory_gb=parse_memory_gb(JAVA_MAX_HEAP), min_cpus=1,
+                           min_memory_gb=4) as grant:
+        cmd = f"qualimap bamqc -bam {bamfile} -outdir {qualimap_dir} -nt {grant.cpus} " \
+              f"--java-mem-size={grant.java_heap}"
+        run_subprocess(cmd)
     qualimap_result_file = qualimap_dir / 'genome_results.txt'
     if not qualimap_result_file.is_file():
         logging.warning(f"ERROR: Could not find genome_results.txt in {qualimap_dir}")
@@ -124,7 +134,8 @@ def run_prodigal(assembly: Path, outdir: Path) -> Path:
     """
     outfile = outdir / assembly.with_suffix(".prodigal.genes").name
     cmd = f"prodigal -i {assembly} -o {outfile}"
-    run_subprocess(cmd)
+    with reserve_resources('prodigal', cpus=1, memory_gb=1):
+        run_subprocess(cmd)
     return outfile
 
 
@@ -161,8 +172,9 @@ def run_quast(assembly: Path, outdir: Path) -> Path:
     :return: Output file from quast.py (transposed_report.tsv)
     """
     # Min contig needs to be set low in order to accomodate very bad assemblies, otherwise quast will fail
-    cmd = f"quast.py --no-plots --no-html --no-icarus --min-contig 100 -o {outdir} {assembly}"
-    run_subprocess(cmd)
+    with reserve_resources('quast', cpus=4, memory_gb=4, min_cpus=1) as grant:
+        cmd = f"quast.py --no-plots --no-html --no-icarus --min-contig 100 -t {grant.cpus} -o {outdir} {assembly}"
+        run_subprocess(cmd)
     transposed_report = list(outdir.glob("transposed_report.tsv"))[0]
     return transposed_report
 
@@ -199,80 +211,50 @@ def assembly_cleanup(assembly_dir: Path, assembly: Path) -> Path:
 
 def get_quast_version() -> str:
     """
-    Grabs text output from --version system call to quast.py
+    Grabs text output from --version system call to quast.py. Cached per worker by the tool version registry.
     :return: String containing stdout from quast.py --version
     """
-    cmd = f"quast.py --version"
-    version = run_subprocess(cmd, get_stdout=True)
-    return version
+    return get_tool_version('quast')
 
 
 def get_skesa_version() -> str:
     """
-    Grabs text output from --version system call to skesa
+    Grabs text output from --version system call to skesa. Cached per worker by the tool version registry.
     :return: String containing stdout from skesa --version
     """
-    cmd = f"skesa --version"
-    version = run_subprocess(cmd, get_stdout=True)
-    return version
+    return get_tool_version('skesa')
 
 
 def get_tadpole_version() -> str:
     """
-    Grabs text output from --version system call to tadpole.sh
+    Grabs text output from --version system call to tadpole.sh. Cached per worker by the tool version registry.
     :return: String containing stdout from tadpole.sh --version
     """
-    cmd = f"tadpole.sh --version"
-    version = run_subprocess(cmd, get_stdout=True)
-    version = extract_bbtool_version_line(version)
-    return version
-
-
-def extract_bbtool_version_line(version: str) -> str:
-    # Extract version line
-    elements = version.split("\n")
-    for e in elements:
-        if 'version' in e.lower():
-            version = e
-    return version
+    return get_tool_version('tadpole')
 
 
 def get_bbmap_version() -> str:
     """
-    Grabs text output from --version system call to bbmap.sh
+    Grabs text output from --version system call to bbmap.sh. Cached per worker by the tool version registry.
     :return: String containing stdout from bbmap.sh --version
     """
-    cmd = f"bbmap.sh --version"
-    version = run_subprocess(cmd, get_stdout=True)
-
-    # Extract version line
-    version = extract_bbtool_version_line(version)
-
-    return version
+    return get_tool_version('bbmap')
 
 
 def get_bbduk_version() -> str:
     """
-    Grabs text output from --version system call to bbduk.sh
+    Grabs text output from --version system call to bbduk.sh. Cached per worker by the tool version registry.
     :return: String containing stdout from bbduk.sh --version
     """
-    cmd = f"bbduk.sh --version"
-    version = run_subprocess(cmd, get_stdout=True)
-
-    # Extract version line
-    version = extract_bbtool_version_line(version)
-
-    return version
+    return get_tool_version('bbduk')
 
 
 def get_pilon_version() -> str:
     """
-    Grabs text output from --version system call to pilon
+    Grabs text output from --version system call to pilon. Cached per worker by the tool version registry.
     :return: String containing stdout from pilon --version
     """
-    cmd = f"pilon --version"
-    version = run_subprocess(cmd, get_stdout=True)
-    return version
+    return get_tool_version('pilon')
 
 
 def call_pilon(bamfile: Path, outdir: Path, assembly: Path, prefix: str, memory: str = JAVA_MAX_HEAP) -> Path:
@@ -282,13 +264,16 @@ def call_pilon(bamfile: Path, outdir: Path, assembly: Path, prefix: str, memory:
     :param outdir: Path to output directory (--outdir in pilon)
     :param assembly: Path to assembly (--genome in pilon)
     :param prefix: String to feed to --output param of pilon
-    :param memory: String with memory to allocate to pilon i.e. 128g.
+    :param memory: String with the maximum memory to allocate to pilon i.e. 128g. The resource broker may grant less.
     :return: Path to polished assembly
     """
     outdir = outdir / 'pilon'
     os.makedirs(str(outdir), exist_ok=True)
-    cmd = f"pilon -Xmx{memory} --genome {assembly} --bam {bamfile} --outdir {outdir} --output {prefix}"
-    run_subprocess(cmd)
+    with reserve_resources('pilon', cpus=8, memory_gb=parse_memory_gb(memory), min_cpus=1,
+                           min_memory_gb=16) as grant:
+        cmd = f"pilon -Xmx{grant.java_heap} --genome {assembly} --bam {bamfile} --outdir {outdir} --output {prefix} " \
+              f"--threads {grant.cpus}"
+        run_subprocess(cmd)
     try:
         polished_assembly = list(outdir.glob("*.fasta"))[0]
     except IndexError:
@@ -312,13 +297,11 @@ def call_skesa(fwd_reads: Path, rev_reads: Path, outdir: Path, sample_id: str) -
     :return: Path to completed assembly
     """
     assembly_out = outdir / Path(sample_id + ".contigs.fa")
-
-    if assembly_out.exists():
-        return assembly_out
-
-    cmd = f'skesa --use_paired_ends --fastq "{fwd_reads},{rev_reads}" --contigs_out {assembly_out}'
-    logger.info(cmd)
-    run_subprocess(cmd)
+    with reserve_resources('skesa', cpus=16, memory_gb=32, min_cpus=4, min_memory_gb=8) as grant:
+        cmd = f'skesa --use_paired_ends --fastq "{fwd_reads},{rev_reads}" --contigs_out {assembly_out} ' \
+              f'--cores {grant.cpus} --memory {grant.memory_gb}'
+        logger.info(cmd)
+        run_subprocess(cmd)
     return assembly_out
 
 
@@ -342,19 +325,16 @@ def call_bbmap(fwd_reads: Path, rev_reads: Path, outdir: Path, assembly: Path) -
     """
     outbam = outdir / assembly.with_suffix(".bam").name
 
-    # If the output .bam file was already generated for some reason, quit early
-    if outbam.exists():
-        return outbam
-
     """
     NOTE: Added deterministic=t averagepairdist=50 and pigz=t on May 6th, 2019.
     This ensures calls to bbmap.sh on a pair of reads will always result in the exact same output; this was not the
     case previously.
     """
-    cmd = f"bbmap.sh in1={fwd_reads} in2={rev_reads} ref={assembly} out={outbam} overwrite=t " \
-          f"pigz=t deterministic=t unbgzip=f averagepairdist=50"
-    logger.info(cmd)
-    run_subprocess(cmd, cwd=outdir)
+    with reserve_resources('bbmap', cpus=16, memory_gb=16, min_cpus=4, min_memory_gb=4) as grant:
+        cmd = f"bbmap.sh in1={fwd_reads} in2={rev_reads} ref={assembly} out={outbam} overwrite=t " \
+              f"pigz=t deterministic=t unbgzip=f averagepairdist=50 threads={grant.cpus} -Xmx{grant.java_heap}"
+        logger.info(cmd)
+        run_subprocess(cmd, cwd=outdir)
 
     # Sort .bam produced by bbmap.sh
     sorted_bam_file = sort_bamfile(bamfile=outbam, outdir=outdir)
@@ -367,9 +347,12 @@ def call_bbmap(fwd_reads: Path, rev_reads: Path, outdir: Path, assembly: Path) -
 
 def sort_bamfile(bamfile: Path, outdir: Path) -> Path:
     sorted_bam_file = outdir / bamfile.name.replace(".bam", "_sorted.bam")
-    cmd = f"samtools sort --output-fmt BAM -o {sorted_bam_file} {bamfile}"
-    logger.info(cmd)
-    run_subprocess(cmd)
+    with reserve_resources('samtools', cpus=4, memory_gb=4, min_cpus=1, min_memory_gb=1) as grant:
+        # samtools -m is per thread
+        memory_per_thread = max(int(grant.memory_gb * 1024 / grant.cpus), 64)
+        cmd = f"samtools sort --output-fmt BAM -@ {grant.cpus} -m {memory_per_thread}M -o {sorted_bam_file} {bamfile}"
+        logger.info(cmd)
+        run_subprocess(cmd)
     return sorted_bam_file
 
 
@@ -384,12 +367,11 @@ def call_tadpole(fwd_reads: Path, rev_reads: Path, outdir: Path) -> tuple:
     fwd_out = outdir / fwd_reads.name.replace(".filtered.", ".corrected.")
     rev_out = outdir / rev_reads.name.replace(".filtered.", ".corrected.")
 
-    # Exit out of function early if the corrected reads already exist for some reason
-    if fwd_out.exists() and rev_out.exists():
-        return fwd_out, rev_out
-
-    cmd = f"tadpole.sh in1={fwd_reads} in2={rev_reads} out1={fwd_out} out2={rev_out} mode=correct unbgzip=f"
-    run_subprocess(cmd)
+    with reserve_resources('tadpole', cpus=16, memory_gb=parse_memory_gb(JAVA_MAX_HEAP), min_cpus=4,
+                           min_memory_gb=8) as grant:
+        cmd = f"tadpole.sh in1={fwd_reads} in2={rev_reads} out1={fwd_out} out2={rev_out} mode=correct unbgzip=f " \
+              f"threads={grant.cpus} -Xmx{grant.java_heap}"
+        run_subprocess(cmd)
     return fwd_out, rev_out
 
 
@@ -397,9 +379,11 @@ def bbduk_trim_adapters(fwd_reads: Path, rev_reads: Path, outdir: Path) -> tuple
     fwd_out = outdir / fwd_reads.name.replace(".fastq.gz", ".cleaned.fastq.gz")
     rev_out = outdir / rev_reads.name.replace(".fastq.gz", ".cleaned.fastq.gz")
     stats_out = outdir / 'adapter_trimming_stats.txt'
-    cmd = f"bbduk.sh in1={fwd_reads} in2={rev_reads} out1={fwd_out} out2={rev_out} " \
-          f"ref=adapters tpe tbo overwrite=t unbgzip=f ktrim=r k=23 mink=11 hdist=1 stats={stats_out}"
-    run_subprocess(cmd)
+    with reserve_resources('bbduk', cpus=8, memory_gb=4, min_cpus=2, min_memory_gb=2) as grant:
+        cmd = f"bbduk.sh in1={fwd_reads} in2={rev_reads} out1={fwd_out} out2={rev_out} " \
+              f"ref=adapters tpe tbo overwrite=t unbgzip=f ktrim=r k=23 mink=11 hdist=1 stats={stats_out} " \
+              f"threads={grant.cpus} -Xmx{grant.java_heap}"
+        run_subprocess(cmd)
     return fwd_out, rev_out
 
 
@@ -407,9 +391,10 @@ def bbduk_qc_filtering(fwd_reads: Path, rev_reads: Path, outdir: Path) -> tuple:
     fwd_out = outdir / fwd_reads.name.replace(".fastq.gz", ".filtered.fastq.gz")
     rev_out = outdir / rev_reads.name.replace(".fastq.gz", ".filtered.fastq.gz")
     stats_out = outdir / 'quality_filtering_stats.txt'
-    cmd = f"bbduk.sh in1={fwd_reads} in2={rev_reads} out1={fwd_out} out2={rev_out} unbgzip=f qtrim=rl " \
-          f"trimq=10 2> {stats_out}"
-    run_subprocess(cmd)
+    with reserve_resources('bbduk', cpus=8, memory_gb=4, min_cpus=2, min_memory_gb=2) as grant:
+        cmd = f"bbduk.sh in1={fwd_reads} in2={rev_reads} out1={fwd_out} out2={rev_out} unbgzip=f qtrim=rl " \
+              f"trimq=10 threads={grant.cpus} -Xmx{grant.java_heap} 2> {stats_out}"
+        run_subprocess(cmd)
     return fwd_out, rev_out
 
 
@@ -427,10 +412,216 @@ def call_bbduk(fwd_reads: Path, rev_reads: Path, outdir: Path) -> tuple:
     return fwd_reads_filtered, rev_reads_filtered
 
 
+def call_streaming_preprocessing(fwd_reads: Path, rev_reads: Path, outdir: Path) -> tuple:
+    """
+    Streaming equivalent of call_repair() -> call_bbduk() -> call_tadpole(). Read repair, adapter trimming and quality
+    filtering are connected through interleaved, uncompressed stdin/stdout pipes. Tadpole makes two passes over its
+    input (k-mer counting, then correction) and cannot read from a pipe, so the filtered reads are written once as an
+    uncompressed interleaved file that is deleted as soon as correction finishes. Only the final corrected read pair
+    is compressed. Both commands are run with run_pipeline() so a tool that dies midway (e.g. out of memory) fails the
+    stage instead of silently truncating the reads.
+    :param fwd_reads: Path to forward reads (.fastq.gz)
+    :param rev_reads: Path to reverse reads (.fastq.gz)
+    :param outdir: Path to desired output directory
+    :return: tuple(corrected forward reads, corrected reverse reads)
+    """
+    fwd_out = outdir / fwd_reads.name.replace(".fastq.gz", ".cleaned.corrected.fastq.gz")
+    rev_out = outdir / rev_reads.name.replace(".fastq.gz", ".cleaned.corrected.fastq.gz")
+    filtered_reads = outdir / 'filtered_interleaved.fq'
+    adapter_stats_out = outdir / 'adapter_trimming_stats.txt'
+    quality_stats_out = outdir / 'quality_filtering_stats.txt'
+
+    try:
+        # The three piped JVMs share a single reservation
+        with reserve_resources('repair|bbduk|bbduk', cpus=12, memory_gb=24, min_cpus=3, min_memory_gb=6) as grant:
+            threads = max(grant.cpus // 3, 1)
+            heap = f"{max(grant.memory_gb // 3, 1)}g"
+            cmd = f"repair.sh in={fwd_reads} in2={rev_reads} out=stdout.fq threads={threads} -Xmx{heap} | " \
+                  f"bbduk.sh in=stdin.fq interleaved=t out=stdout.fq threads={threads} -Xmx{heap} " \
+                  f"ref=adapters tpe tbo ktrim=r k=23 mink=11 hdist=1 stats={adapter_stats_out} | " \
+                  f"bbduk.sh in=stdin.fq interleaved=t out={filtered_reads} overwrite=t qtrim=rl trimq=10 " \
+                  f"threads={threads} -Xmx{heap} 2> {quality_stats_out}"
+            logger.info(cmd)
+            run_pipeline(cmd)
+
+        with reserve_resources('tadpole', cpus=16, memory_gb=parse_memory_gb(JAVA_MAX_HEAP), min_cpus=4,
+                               min_memory_gb=8) as grant:
+            cmd = f"tadpole.sh in={filtered_reads} interleaved=t out1={fwd_out} out2={rev_out} mode=correct " \
+                  f"overwrite=t pigz=t threads={grant.cpus} -Xmx{grant.java_heap}"
+            logger.info(cmd)
+            run_pipeline(cmd)
+    finally:
+        if filtered_reads.exists():
+            os.remove(str(filtered_reads))
+    return fwd_out, rev_out
+
+
 def call_repair(fwd_reads: Path, rev_reads: Path, outdir: Path) -> tuple:
     fwd_out = outdir / fwd_reads.name
     rev_out = outdir / rev_reads.name
 
-    cmd = f"repair.sh in={fwd_reads} in2={rev_reads} out={fwd_out} out2={rev_out} overwrite=t"
-    run_subprocess(cmd)
+    with reserve_resources('repair', cpus=4, memory_gb=16, min_cpus=1, min_memory_gb=4) as grant:
+        cmd = f"repair.sh in={fwd_reads} in2={rev_reads} out={fwd_out} out2={rev_out} overwrite=t " \
+              f"threads={grant.cpus} -Xmx{grant.java_heap}"
+        run_subprocess(cmd)
     return fwd_out, rev_out
+
+
+class EmptyAssemblyError(Exception):
+    """ Raised when Pilon produces an empty assembly; downstream stages cannot run on it """
+    pass
+
+
+def repair_stage(state: dict) -> dict:
+    fwd_reads, rev_reads = call_repair(fwd_reads=state['fwd_reads'], rev_reads=state['rev_reads'],
+                                       outdir=state['outdir'])
+    return {'repaired_fwd_reads': fwd_reads, 'repaired_rev_reads': rev_reads}
+
+
+def bbduk_stage(state: dict) -> dict:
+    fwd_reads, rev_reads = call_bbduk(fwd_reads=state['repaired_fwd_reads'], rev_reads=state['repaired_rev_reads'],
+                                      outdir=state['outdir'])
+    return {'filtered_fwd_reads': fwd_reads, 'filtered_rev_reads': rev_reads}
+
+
+def tadpole_stage(state: dict) -> dict:
+    fwd_reads, rev_reads = call_tadpole(fwd_reads=state['filtered_fwd_reads'], rev_reads=state['filtered_rev_reads'],
+                                        outdir=state['outdir'])
+    return {'corrected_fwd_reads': fwd_reads, 'corrected_rev_reads': rev_reads}
+
+
+def streaming_preprocessing_stage(state: dict) -> dict:
+    fwd_reads, rev_reads = call_streaming_preprocessing(fwd_reads=state['fwd_reads'], rev_reads=state['rev_reads'],
+                                                        outdir=state['outdir'])
+    return {'corrected_fwd_reads': fwd_reads, 'corrected_rev_reads': rev_reads}
+
+
+def skesa_stage(state: dict) -> dict:
+    assembly = call_skesa(fwd_reads=state['corrected_fwd_reads'], rev_reads=state['corrected_rev_reads'],
+                          outdir=state['outdir'], sample_id=state['sample_id'])
+    return {'skesa_assembly': assembly}
+
+
+def bbmap_stage(state: dict) -> dict:
+    bamfile = call_bbmap(fwd_reads=state['corrected_fwd_reads'], rev_reads=state['corrected_rev_reads'],
+                         outdir=state['outdir'], assembly=state['skesa_assembly'])
+    return {'bamfile': bamfile}
+
+
+def pilon_stage(state: dict) -> dict:
+    polished_assembly = call_pilon(bamfile=state['bamfile'], outdir=state['outdir'], assembly=state['skesa_assembly'],
+                                   prefix=state['sample_id'])
+    # Do a check to make sure the assembly isn't empty
+    if polished_assembly.stat().st_size == 0:
+        raise EmptyAssemblyError(f"The assembly for {state['sample_id']} is empty")
+    return {'pilon_assembly': polished_assembly}
+
+
+def qualimap_stage(state: dict) -> dict:
+    qualimap_result_file = call_qualimap(bamfile=state['bamfile'], outdir=state['outdir'])
+    mean_coverage, std_coverage = extract_coverage_from_qualimap_results(qualimap_result_file=qualimap_result_file)
+    return {'qualimap_result_file': qualimap_result_file, 'mean_coverage': mean_coverage,
+            'std_coverage': std_coverage}
+
+
+def cleanup_stage(state: dict) -> dict:
+    # Clean up extraneous files and move the assembly to the root of the sample folder
+    polished_assembly = assembly_cleanup(assembly_dir=state['outdir'], assembly=state['pilon_assembly'])
+    return {'polished_assembly': polished_assembly}
+
+
+def quast_stage(state: dict) -> dict:
+    return {'quast_report': run_quast(assembly=state['polished_assembly'], outdir=state['outdir'])}
+
+
+def prodigal_stage(state: dict) -> dict:
+    prodigal_gene_file = run_prodigal(assembly=state['polished_assembly'], outdir=state['outdir'])
+    num_predicted_genes = count_prodigal_genes(prodigal_gene_file=prodigal_gene_file)
+    return {'prodigal_gene_file': prodigal_gene_file, 'num_predicted_genes': num_predicted_genes}
+
+
+def confindr_stage(state: dict) -> dict:
+    # Confindr is run on the raw reads in the sample folder
+    outdir = state['outdir'] / 'confindr'
+    report, logfile = ConfindrGroupResult.call_confindr(reads_dir=state['outdir'].parent, outdir=outdir)
+    if not report.exists():
+        logger.warning(f"Something has gone wrong. The Confindr report for {state['sample_id']} does not exist.")
+        report = None
+    return {'confindr_report': report}
+
+
+def mash_stage(state: dict) -> dict:
+    polished_assembly = state['polished_assembly']
+    if polished_assembly.stat().st_size <= 800:
+        logger.warning(f"The input assembly for {state['sample_id']} is too small to pass to Mash. Skipping.")
+        return {'mash_result_file': None}
+    mash_result_file = MashResult.call_mash(assembly=polished_assembly, outdir=polished_assembly.parent)
+    return {'mash_result_file': mash_result_file}
+
+
+# Read preprocessing stages; both variants produce the corrected read pair consumed by SKESA
+PREPROCESSING_STAGES = [
+    PipelineStage(name='repair', func=repair_stage, inputs=['fwd_reads', 'rev_reads'],
+                  outputs=['repaired_fwd_reads', 'repaired_rev_reads'], intermediate=True),
+    PipelineStage(name='bbduk', func=bbduk_stage, inputs=['repaired_fwd_reads', 'repaired_rev_reads'],
+                  outputs=['filtered_fwd_reads', 'filtered_rev_reads'], intermediate=True),
+    PipelineStage(name='tadpole', func=tadpole_stage, inputs=['filtered_fwd_reads', 'filtered_rev_reads'],
+                  outputs=['corrected_fwd_reads', 'corrected_rev_reads'], intermediate=True),
+]
+
+STREAMING_PREPROCESSING_STAGES = [
+    PipelineStage(name='preprocess', func=streaming_preprocessing_stage, inputs=['fwd_reads', 'rev_reads'],
+                  outputs=['corrected_fwd_reads', 'corrected_rev_reads'], intermediate=True),
+]
+
+ASSEMBLY_STAGES = [
+    PipelineStage(name='skesa', func=skesa_stage, inputs=['corrected_fwd_reads', 'corrected_rev_reads'],
+                  outputs=['skesa_assembly'], intermediate=True),
+    PipelineStage(name='bbmap', func=bbmap_stage,
+                  inputs=['corrected_fwd_reads', 'corrected_rev_reads', 'skesa_assembly'],
+                  outputs=['bamfile'], intermediate=True),
+    PipelineStage(name='pilon', func=pilon_stage, inputs=['bamfile', 'skesa_assembly'],
+                  outputs=['pilon_assembly'], intermediate=True),
+    PipelineStage(name='qualimap', func=qualimap_stage, inputs=['bamfile'],
+                  outputs=['qualimap_result_file', 'mean_coverage', 'std_coverage']),
+    PipelineStage(name='cleanup', func=cleanup_stage, inputs=['pilon_assembly'], outputs=['polished_assembly'],
+                  after=['qualimap']),
+    PipelineStage(name='quast', func=quast_stage, inputs=['polished_assembly'], outputs=['quast_report']),
+    PipelineStage(name='prodigal', func=prodigal_stage, inputs=['polished_assembly'],
+                  outputs=['prodigal_gene_file', 'num_predicted_genes']),
+    PipelineStage(name='confindr', func=confindr_stage, inputs=['fwd_reads', 'rev_reads', 'confindr_db'],
+                  outputs=['confindr_report'], after=['cleanup']),
+    PipelineStage(name='mash', func=mash_stage, inputs=['polished_assembly', 'mash_database'],
+                  outputs=['mash_result_file']),
+]
+
+
+def get_assembly_stage_graph(outdir: Path, streaming: bool = ASSEMBLY_STREAMING_PREPROCESSING) -> StageGraph:
+    """
+    Returns the StageGraph for the assembly pipeline. Stage manifests are stored in a hidden folder of the assembly
+    directory, which survives assembly_cleanup().
+    :param outdir: Assembly directory for a sample
+    :param streaming: Flag to use the streaming read preprocessing stage (see call_streaming_preprocessing())
+    :return: StageGraph instance
+    """
+    preprocessing_stages = STREAMING_PREPROCESSING_STAGES if streaming else PREPROCESSING_STAGES
+    return StageGraph(stages=preprocessing_stages + ASSEMBLY_STAGES, manifest_dir=outdir / '.checkpoints')
+
+
+def get_assembly_initial_state(fwd_reads: Path, rev_reads: Path, outdir: Path, sample_id: str) -> dict:
+    """
+    Builds the initial state passed to the assembly StageGraph
+    :param fwd_reads: Path to forward reads (.fastq.gz)
+    :param rev_reads:  Path to reverse reads (.fastq.gz)
+    :param outdir: Path to output directory for sample
+    :param sample_id: Sample ID (e.g. BMH-2017-000001) corresponding to miseq_viewer.models.Sample
+    :return: Dictionary of initial values
+    """
+    return {
+        'fwd_reads': fwd_reads,
+        'rev_reads': rev_reads,
+        'outdir': outdir,
+        'sample_id': sample_id,
+        'confindr_db': Path(CONFINDR_DB),
+        'mash_database': Path(MASH_REFSEQ_DATABASE),
+    }
@@ -2,9 +2,13 @@
 Generic functions for miseq_portal tools to call
 """
 
+import hashlib
 import os
+from functools import lru_cache
 from pathlib import Path
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, CalledProcessError
+
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
 
 
 def run_subprocess(cmd: str, get_stdout=False, cwd=None) -> str:
@@ -31,12 +35,46 @@ def run_subprocess(cmd: str, get_stdout=False, cwd=None) -> str:
         p.wait()
 
 
+def run_pipeline(cmd: str, cwd=None):
+    """
+    Runs a shell command, typically a pipeline, with bash -o pipefail so a failure anywhere in the pipeline is not
+    masked by the exit status of its last command
+    :param cmd: String containing command to pass to bash
+    :param cwd: Path to desired working dir
+    :raises CalledProcessError: If the command, or any command in the pipeline, exits with a non-zero status
+    """
+    p = Popen(['bash', '-o', 'pipefail', '-c', cmd], cwd=cwd)
+    returncode = p.wait()
+    if returncode != 0:
+        raise CalledProcessError(returncode, cmd)
+
+
 def remove_fastq_and_bam_files(target_directory: Path):
     """
     Delete all of the files in a given directory
     :param target_directory: Path to directory to delete files in
     """
     to_delete = list(target_directory.glob("*.bam")) + list(target_directory.glob("*.fastq.gz")) + list(
-        target_directory.glob("*.bai"))
+        target_directory.glob("*.bai")) + list(target_directory.glob("*.fq"))
     for f in to_delete:
         os.remove(str(f))
+
+
+@lru_cache(maxsize=4096)
+def _file_checksum(path: str, size: int, mtime_ns: int) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def file_checksum(path: Path) -> str:
+    """
+    Computes the sha256 checksum of a file. Results are memoized per process against the path, size and modification
+    time of the file, so repeated lookups for an unchanged file only cost a stat() call.
+    :param path: Path to the file
+    :return: Hex digest of the file contents
+    """
+    stat = Path(path).stat()
+    return _file_checksum(str(path), stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,269 @@
+"""
+Checkpointed execution of multi-step pipelines such as the assembly pipeline in assemble_run.py.
+
+Each PipelineStage reads named values from a shared state dictionary and returns the named values it produces. When a
+stage completes, a JSON manifest recording fingerprints of its inputs and the values of its outputs is written to the
+manifest directory. Subsequent runs skip every stage whose manifest is still valid, so a retry resumes from the last
+completed stage, and invalidating a single stage only reruns that stage and whatever depends on it. Independent stages
+can be run concurrently on a bounded thread pool; stages are expected to spend their time in external tools.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger('django')
+
+MANIFEST_VERSION = 1
+
+
+class StageError(Exception):
+    """ Raised when a stage does not produce the outputs it declares """
+    pass
+
+
+@dataclass
+class PipelineStage:
+    """
+    A single recorded step of a pipeline.
+    :param name: Unique name of the stage, used to name its manifest
+    :param func: Callable receiving the current state dict and returning a dict containing every key in outputs
+    :param inputs: State keys consumed by the stage. Their fingerprints are recorded in the manifest.
+    :param outputs: State keys produced by the stage
+    :param after: Names of stages that must run before this one without providing any of its inputs
+    :param intermediate: Set if the outputs of the stage are expected to be deleted by a later cleanup stage
+    """
+    name: str
+    func: Callable
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    after: list = field(default_factory=list)
+    intermediate: bool = False
+
+
+def fingerprint(value):
+    """
+    Fingerprints a state value. Files are identified by their path, size and modification time; directories by their
+    path and modification time. Any other value is used as-is.
+    :param value: Value stored in the pipeline state
+    :return: JSON serializable fingerprint, or None if the value is a path that does not exist
+    """
+    if isinstance(value, Path):
+        try:
+            stat = value.stat()
+        except FileNotFoundError:
+            return None
+        if value.is_dir():
+            return {'path': str(value), 'mtime_ns': stat.st_mtime_ns}
+        return {'path': str(value), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return value
+
+
+def encode_value(value):
+    """ Converts a state value to a JSON serializable representation """
+    if isinstance(value, Path):
+        return {'__path__': str(value)}
+    return value
+
+
+def decode_value(value):
+    """ Reverses encode_value() """
+    if isinstance(value, dict) and '__path__' in value:
+        return Path(value['__path__'])
+    return value
+
+
+def is_missing(value) -> bool:
+    return isinstance(value, Path) and not value.exists()
+
+
+class StageGraph:
+    """
+    Runs an ordered list of PipelineStage objects, skipping those with a valid manifest in manifest_dir.
+
+    A stage is rerun when it has no manifest, when a fingerprint of one of its inputs no longer matches its manifest,
+    when a stage it depends on is rerun, or when one of its outputs is missing (unless the stage is intermediate).
+    If a stage has to be rerun but one of its inputs was already removed from disk, the stage producing that input is
+    rerun as well.
+    """
+
+    def __init__(self, stages: [PipelineStage], manifest_dir: Path):
+        self.stages = list(stages)
+        self.manifest_dir = Path(manifest_dir)
+        self.stage_dict = {stage.name: stage for stage in self.stages}
+        if len(self.stage_dict) != len(self.stages):
+            raise ValueError("Stage names must be unique")
+
+        # Map each state key to the stage responsible for producing it
+        self.producers = {}
+        for stage in self.stages:
+            for key in stage.outputs:
+                if key in self.producers:
+                    raise ValueError(f"Output '{key}' is produced by both {self.producers[key].name} and {stage.name}")
+                self.producers[key] = stage
+
+    def manifest_path(self, stage_name: str) -> Path:
+        return self.manifest_dir / f"{stage_name}.json"
+
+    def load_manifest(self, stage_name: str):
+        manifest_path = self.manifest_path(stage_name)
+        try:
+            with open(str(manifest_path), 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if manifest.get('version') != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def write_manifest(self, stage: PipelineStage, state: dict):
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'stage': stage.name,
+            'completed': datetime.now().isoformat(),
+            'inputs': {key: fingerprint(state.get(key)) for key in stage.inputs},
+            'outputs': {key: encode_value(state.get(key)) for key in stage.outputs},
+        }
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.manifest_path(stage.name)
+        tmp_path = manifest_path.with_suffix('.json.tmp')
+        with open(str(tmp_path), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        # Atomic so an interrupted write never leaves a half-written manifest behind
+        os.replace(str(tmp_path), str(manifest_path))
+
+    def invalidate(self, *stage_names: str):
+        """ Deletes the manifests for the provided stages, forcing them (and their dependents) to run again """
+        for stage_name in stage_names:
+            if stage_name not in self.stage_dict:
+                raise ValueError(f"Unknown stage '{stage_name}'")
+            manifest_path = self.manifest_path(stage_name)
+            if manifest_path.exists():
+                manifest_path.unlink()
+
+    def has_checkpoints(self) -> bool:
+        return any(self.manifest_path(stage.name).exists() for stage in self.stages)
+
+    def _recorded_outputs(self, manifest: dict) -> dict:
+        return {key: decode_value(value) for key, value in manifest['outputs'].items()}
+
+    def _is_stale(self, stage: PipelineStage, manifest, values: dict, dirty: set) -> bool:
+        if manifest is None:
+            return True
+        for key in stage.inputs:
+            producer = self.producers.get(key)
+            if producer is not None and producer.name in dirty:
+                return True
+            value = values.get(key)
+            # Inputs consumed by a cleanup stage are gone by design; that alone does not invalidate the stage
+            if is_missing(value):
+                continue
+            if fingerprint(value) != manifest['inputs'].get(key):
+                return True
+        if not stage.intermediate:
+            for value in self._recorded_outputs(manifest).values():
+                if is_missing(value):
+                    return True
+        return False
+
+    def plan(self, state: dict, force: [str] = None) -> set:
+        """
+        Determines which stages need to run given the initial state
+        :param state: Dictionary of initial pipeline values
+        :param force: Names of stages to rerun regardless of their manifests
+        :return: Set of stage names that need to run
+        """
+        for stage_name in force or []:
+            if stage_name not in self.stage_dict:
+                raise ValueError(f"Unknown stage '{stage_name}'")
+        manifests = {stage.name: self.load_manifest(stage.name) for stage in self.stages}
+        dirty = set(force) if force else set()
+
+        changed = True
+        while changed:
+            changed = False
+            # Values currently available: the initial state plus outputs recorded by stages that won't be rerun
+            values = dict(state)
+            for stage in self.stages:
+                if stage.name not in dirty and manifests[stage.name] is not None:
+                    values.update(self._recorded_outputs(manifests[stage.name]))
+
+            # Propagate forwards through input fingerprints and dependencies
+            for stage in self.stages:
+                if stage.name not in dirty and self._is_stale(stage, manifests[stage.name], values, dirty):
+                    dirty.add(stage.name)
+                    changed = True
+
+            # Propagate backwards to regenerate inputs that a stage needs but which were already cleaned up
+            for stage in reversed(self.stages):
+                if stage.name not in dirty:
+                    continue
+                for key in stage.inputs:
+                    producer = self.producers.get(key)
+                    if producer is not None and producer.name not in dirty and is_missing(values.get(key)):
+                        dirty.add(producer.name)
+                        changed = True
+        return dirty
+
+    def run_stage(self, stage: PipelineStage, state: dict) -> dict:
+        """
+        Runs a single stage, validates its outputs and records its manifest
+        :param stage: PipelineStage to run
+        :param state: Current pipeline state
+        :return: Dictionary of values produced by the stage
+        """
+        logger.info(f"Running stage '{stage.name}'")
+        outputs = stage.func(state)
+        for key in stage.outputs:
+            if key not in outputs:
+                raise StageError(f"Stage '{stage.name}' did not return its '{key}' output")
+            if is_missing(outputs[key]):
+                raise StageError(f"Stage '{stage.name}' did not produce {outputs[key]}")
+        self.write_manifest(stage, {**state, **outputs})
+        return outputs
+
+    def dependencies(self, stage: PipelineStage) -> set:
+        """ Returns the names of the stages that must complete before the provided stage can run """
+        dependencies = set(stage.after)
+        for key in stage.inputs:
+            if key in self.producers:
+                dependencies.add(self.producers[key].name)
+        return dependencies
+
+    def run(self, state: dict, force: [str] = None, max_workers: int = 1) -> dict:
+        """
+        Runs every stage that is not already complete. Stages whose dependencies have all completed are run
+        concurrently, up to max_workers at a time.
+        :param state: Dictionary of initial pipeline values
+        :param force: Names of stages to rerun regardless of their manifests
+        :param max_workers: Maximum number of stages to run at the same time
+        :return: Final pipeline state containing the outputs of every stage
+        """
+        dirty = self.plan(state=state, force=force)
+        state = dict(state)
+        for stage in self.stages:
+            if stage.name not in dirty:
+                logger.info(f"Skipping completed stage '{stage.name}'")
+                state.update(self._recorded_outputs(self.load_manifest(stage.name)))
+
+        pending = [stage for stage in self.stages if stage.name in dirty]
+        # Drop stale manifests first so an interrupted rerun is never mistaken for a completed one
+        self.invalidate(*[stage.name for stage in pending])
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending:
+                pending_names = {stage.name for stage in pending}
+                ready = [stage for stage in pending if not self.dependencies(stage) & pending_names]
+                if not ready:
+                    raise StageError(f"Could not resolve stage dependencies for {sorted(pending_names)}")
+                futures = [executor.submit(self.run_stage, stage, dict(state)) for stage in ready]
+                # Wait for the whole batch so completed stages are checkpointed even if one of them fails
+                wait(futures)
+                for future in futures:
+                    state.update(future.result())
+                pending = [stage for stage in pending if stage not in ready]
+        return state
@@ -9,12 +9,16 @@ General overview:
 
 """
 
+import csv
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional
 
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 
 from django.conf import settings
 from miseq_portal.analysis.tools.helpers import run_subprocess
+from miseq_portal.analysis.tools.resources import reserve_resources
 
 MOB_RECON = settings.MOB_RECON_EXE
 
@@ -28,8 +32,9 @@ class MobSuiteDataObject:
 
 
 def call_mob_recon(assembly: Path, outdir: Path) -> MobSuiteDataObject:
-    cmd = f'{MOB_RECON} --infile {assembly} --outdir {outdir} --run_typer'
-    run_subprocess(cmd)
+    with reserve_resources('mob_recon', cpus=8, memory_gb=8, min_cpus=1, min_memory_gb=4) as grant:
+        cmd = f'{MOB_RECON} --infile {assembly} --outdir {outdir} --run_typer --num_threads {grant.cpus}'
+        run_subprocess(cmd)
     contig_report = list(outdir.glob("contig_report.txt"))[0]
     mobtyper_aggregate_report = list(outdir.glob("mobtyper_aggregate_report.txt"))[0]
     plasmid_fasta_list = list(outdir.glob("plasmid_*.fasta"))
@@ -40,6 +45,112 @@ def call_mob_recon(assembly: Path, outdir: Path) -> MobSuiteDataObject:
     return mob_recon_data
 
 
+# Maps columns of mob_typer's aggregate report to MobTyperPlasmid attributes (and MobSuiteAnalysisPlasmid fields)
+MOBTYPER_COLUMNS = {
+    'file_id': 'file_id', 'num_contigs': 'num_contigs', 'total_length': 'total_length', 'gc': 'gc_content',
+    'rep_type(s)': 'rep_type', 'rep_type_accession(s)': 'rep_type_accession', 'relaxase_type(s)': 'relaxase_type',
+    'relaxase_type_accession(s)': 'relaxase_type_accession', 'PredictedMobility': 'predicted_mobility',
+    'mash_nearest_neighbor': 'mash_nearest_neighbor', 'mash_neighbor_distance': 'mash_neighbor_distance',
+    'mash_neighbor_cluster': 'mash_neighbor_cluster'
+}
+
+
+def _to_str(value: str) -> Optional[str]:
+    return value if value not in ('', 'nan', 'NaN') else None
+
+
+def _to_int(value: str) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class MobTyperPlasmid:
+    """ A single row of mob_typer's aggregate report """
+    file_id: str
+    num_contigs: Optional[int] = None
+    total_length: Optional[int] = None
+    gc_content: Optional[float] = None
+    rep_type: Optional[str] = None
+    rep_type_accession: Optional[str] = None
+    relaxase_type: Optional[str] = None
+    relaxase_type_accession: Optional[str] = None
+    predicted_mobility: Optional[str] = None
+    mash_nearest_neighbor: Optional[str] = None
+    mash_neighbor_distance: Optional[float] = None
+    mash_neighbor_cluster: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: dict):
+        values = {attribute: row.get(column) for column, attribute in MOBTYPER_COLUMNS.items()}
+        return cls(
+            file_id=values['file_id'],
+            num_contigs=_to_int(values['num_contigs']),
+            total_length=_to_int(values['total_length']),
+            gc_content=_to_float(values['gc_content']),
+            rep_type=_to_str(values['rep_type']),
+            rep_type_accession=_to_str(values['rep_type_accession']),
+            relaxase_type=_to_str(values['relaxase_type']),
+            relaxase_type_accession=_to_str(values['relaxase_type_accession']),
+            predicted_mobility=_to_str(values['predicted_mobility']),
+            mash_nearest_neighbor=_to_str(values['mash_nearest_neighbor']),
+            mash_neighbor_distance=_to_float(values['mash_neighbor_distance']),
+            mash_neighbor_cluster=_to_str(values['mash_neighbor_cluster']),
+        )
+
+    def model_values(self) -> dict:
+        """ Returns the MobSuiteAnalysisPlasmid field values for this plasmid """
+        values = asdict(self)
+        del values['file_id']
+        return values
+
+
+@dataclass(frozen=True)
+class MobTyperAggregateReport:
+    """ Parsed mobtyper_aggregate_report.txt, indexed by file_id (the plasmid FASTA basename) """
+    path: Path
+    plasmids: dict
+
+    def get(self, file_id: str) -> Optional[MobTyperPlasmid]:
+        return self.plasmids.get(file_id)
+
+    def __len__(self):
+        return len(self.plasmids)
+
+    def __iter__(self):
+        return iter(self.plasmids.values())
+
+
+@lru_cache(maxsize=256)
+def _read_mobtyper_aggregate_report(path: str, size: int, mtime_ns: int) -> MobTyperAggregateReport:
+    plasmids = {}
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f, delimiter='\t'):
+            plasmid = MobTyperPlasmid.from_row(row)
+            plasmids.setdefault(plasmid.file_id, plasmid)
+    return MobTyperAggregateReport(path=Path(path), plasmids=plasmids)
+
+
+def read_mobtyper_aggregate_report(aggregate_report_path: Path) -> MobTyperAggregateReport:
+    """
+    Parses a mob_typer aggregate report. Parsed reports are memoized per process against the path, size and
+    modification time of the file, so the report is only read once no matter how many plasmids are looked up.
+    :param aggregate_report_path: Path to mobtyper_aggregate_report.txt
+    :return: MobTyperAggregateReport
+    """
+    stat = Path(aggregate_report_path).stat()
+    return _read_mobtyper_aggregate_report(str(aggregate_report_path), stat.st_size, stat.st_mtime_ns)
+
+
 @dataclass
 class AbricateDataObject:
     pass
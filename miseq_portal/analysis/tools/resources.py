@@ -0,0 +1,182 @@
+"""
+Node-level broker for the CPU and memory used by external tools.
+
+Several Celery worker processes share each node, so every tool invocation reserves the cores and memory it needs before
+it starts, and waits while the node is fully booked. Thread counts and heap sizes passed to the tool are then taken
+from the grant rather than hard-coded. Reservations are kept in a small JSON ledger guarded by an flock(2) lock in
+RESOURCE_BROKER_DIR, which is shared by every worker process on the node; entries left behind by a process that died
+are discarded automatically.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger('django')
+
+
+def parse_memory_gb(memory: str) -> int:
+    """
+    Converts a Java style memory string to an integer number of gigabytes
+    :param memory: String such as '65g' or '512m'
+    :return: Number of gigabytes (at least 1)
+    """
+    memory = str(memory).strip().lower()
+    if memory.endswith('g'):
+        return max(int(float(memory[:-1])), 1)
+    elif memory.endswith('m'):
+        return max(int(float(memory[:-1]) / 1024), 1)
+    return max(int(float(memory)), 1)
+
+
+@dataclass
+class ResourceGrant:
+    """ CPU and memory granted to a single tool invocation """
+    tool: str
+    cpus: int
+    memory_gb: int
+
+    @property
+    def java_heap(self) -> str:
+        """ Granted memory formatted for -Xmx style options """
+        return f"{self.memory_gb}g"
+
+
+class ResourceBroker:
+    """
+    Hands out CPU and memory slots on the current node.
+    :param state_dir: Directory holding the reservation ledger. Must be local to the node.
+    :param total_cpus: Number of CPUs that may be handed out on the node
+    :param total_memory_gb: Gigabytes of memory that may be handed out on the node
+    :param poll_interval: Seconds to wait between attempts while the node is fully booked
+    """
+
+    def __init__(self, state_dir: Path, total_cpus: int, total_memory_gb: int, poll_interval: float = 5):
+        self.state_dir = Path(state_dir)
+        self.total_cpus = max(int(total_cpus), 1)
+        self.total_memory_gb = max(int(total_memory_gb), 1)
+        self.poll_interval = poll_interval
+
+    @property
+    def ledger_path(self) -> Path:
+        return self.state_dir / 'reservations.json'
+
+    @property
+    def lock_path(self) -> Path:
+        return self.state_dir / 'reservations.lock'
+
+    @contextmanager
+    def _locked_ledger(self):
+        """ Yields the reservation ledger while holding an exclusive lock; changes are written back on exit """
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        with open(str(self.lock_path), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(str(self.ledger_path), 'r') as f:
+                        ledger = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    ledger = {}
+                ledger = {key: value for key, value in ledger.items() if self._process_alive(value['pid'])}
+                yield ledger
+                tmp_path = self.ledger_path.with_suffix('.json.tmp')
+                with open(str(tmp_path), 'w') as f:
+                    json.dump(ledger, f)
+                os.replace(str(tmp_path), str(self.ledger_path))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def available(self) -> tuple:
+        """
+        :return: tuple(available CPUs, available memory in GB) on the node
+        """
+        with self._locked_ledger() as ledger:
+            return self._available(ledger)
+
+    def _available(self, ledger: dict) -> tuple:
+        used_cpus = sum(reservation['cpus'] for reservation in ledger.values())
+        used_memory = sum(reservation['memory_gb'] for reservation in ledger.values())
+        return self.total_cpus - used_cpus, self.total_memory_gb - used_memory
+
+    def try_acquire(self, tool: str, cpus: int, memory_gb: int, min_cpus: int, min_memory_gb: int):
+        """
+        Attempts a single reservation without waiting
+        :return: tuple(reservation ID, ResourceGrant), or None if the node does not currently have enough capacity
+        """
+        with self._locked_ledger() as ledger:
+            available_cpus, available_memory = self._available(ledger)
+            if available_cpus < min_cpus or available_memory < min_memory_gb:
+                return None
+            grant = ResourceGrant(tool=tool, cpus=min(cpus, available_cpus), memory_gb=min(memory_gb, available_memory))
+            reservation_id = uuid.uuid4().hex
+            ledger[reservation_id] = {'pid': os.getpid(), 'thread': threading.get_ident(), 'tool': tool,
+                                      'cpus': grant.cpus, 'memory_gb': grant.memory_gb, 'started': time.time()}
+            return reservation_id, grant
+
+    def release(self, reservation_id: str):
+        with self._locked_ledger() as ledger:
+            ledger.pop(reservation_id, None)
+
+    @contextmanager
+    def reserve(self, tool: str, cpus: int, memory_gb: int = 1, min_cpus: int = None, min_memory_gb: int = None):
+        """
+        Blocks until the requested resources are available on the node, then yields a ResourceGrant for the duration
+        of the context. Requests are capped to the node size. If min_cpus/min_memory_gb are given, the grant may be
+        smaller than requested when the node is busy, but never smaller than these minimums.
+        :param tool: Name of the tool, for logging
+        :param cpus: Preferred number of CPUs
+        :param memory_gb: Preferred memory in gigabytes
+        :param min_cpus: Smallest acceptable number of CPUs. Defaults to cpus.
+        :param min_memory_gb: Smallest acceptable memory in gigabytes. Defaults to memory_gb.
+        """
+        cpus = min(max(int(cpus), 1), self.total_cpus)
+        memory_gb = min(max(int(memory_gb), 1), self.total_memory_gb)
+        min_cpus = cpus if min_cpus is None else min(max(int(min_cpus), 1), cpus)
+        min_memory_gb = memory_gb if min_memory_gb is None else min(max(int(min_memory_gb), 1), memory_gb)
+
+        waited = False
+        while True:
+            result = self.try_acquire(tool=tool, cpus=cpus, memory_gb=memory_gb, min_cpus=min_cpus,
+                                      min_memory_gb=min_memory_gb)
+            if result is not None:
+                break
+            if not waited:
+                logger.info(f"Waiting for {min_cpus} CPUs/{min_memory_gb}g to become available for {tool}")
+                waited = True
+            time.sleep(self.poll_interval)
+
+        reservation_id, grant = result
+        logger.info(f"Granted {grant.cpus} CPUs/{grant.java_heap} to {tool}")
+        try:
+            yield grant
+        finally:
+            self.release(reservation_id)
+
+
+resource_broker = ResourceBroker(state_dir=settings.RESOURCE_BROKER_DIR,
+                                 total_cpus=settings.RESOURCE_BROKER_CPUS,
+                                 total_memory_gb=settings.RESOURCE_BROKER_MEMORY_GB)
+
+
+def reserve_resources(tool: str, cpus: int, memory_gb: int = 1, min_cpus: int = None, min_memory_gb: int = None):
+    """ Shortcut for ResourceBroker.reserve() on the node-wide broker """
+    return resource_broker.reserve(tool=tool, cpus=cpus, memory_gb=memory_gb, min_cpus=min_cpus,
+                                   min_memory_gb=min_memory_gb)
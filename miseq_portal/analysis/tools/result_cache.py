@@ -0,0 +1,159 @@
+"""
+Content-addressed cache for per-sample analysis jobs (RGI, MobRecon, rMLST).
+
+Each job computes a key from a checksum of its input (the assembly), the version of the tool and its parameters. If an
+AnalysisResultCache entry for that key is complete, the result rows of the AnalysisSample that owns it are copied onto
+the new AnalysisSample; the result files themselves are shared rather than copied. If another job with the same key is
+currently running, the job waits for it instead of running the tool a second time.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from miseq_portal.analysis.models import AnalysisSample, AnalysisResultCache
+
+logger = logging.getLogger('django')
+
+
+def build_cache_key(tool: str, input_checksum: str, tool_version: str, params: dict = None) -> str:
+    """
+    :param tool: Name of the analysis, e.g. 'RGI'
+    :param input_checksum: Checksum of the input file(s)
+    :param tool_version: Version string of the tool
+    :param params: Parameters that affect the result
+    :return: Hex digest identifying the result
+    """
+    payload = json.dumps({'tool': tool, 'input': input_checksum, 'version': tool_version, 'params': params or {}},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def result_object_values(result_object, **kwargs) -> dict:
+    """
+    Retrieves the field values of a result row, excluding its primary key and timestamps, so they can be attached to
+    another AnalysisSample. FileFields are returned as their stored name so both rows point at the same file.
+    :param result_object: Instance of a result model, e.g. RGIResult
+    :param kwargs: Field values (by attname, e.g. analysis_sample_id) to replace
+    :return: Dictionary of field values
+    """
+    values = {}
+    for field in result_object._meta.concrete_fields:
+        if field.primary_key or field.name in ('created', 'modified'):
+            continue
+        value = getattr(result_object, field.attname)
+        if isinstance(field, models.FileField):
+            value = value.name
+        values[field.attname] = value
+    values.update(kwargs)
+    return values
+
+
+def clone_result_object(result_object, **kwargs):
+    """ Saves a copy of a result row with the provided field values replaced. See result_object_values(). """
+    return type(result_object).objects.create(**result_object_values(result_object, **kwargs))
+
+
+def result_files_exist(result_object, field_names: list = None) -> bool:
+    """
+    Checks that the files referenced by a result row are still present in MEDIA_ROOT
+    :param result_object: Instance of a result model, e.g. RGIResult
+    :param field_names: Names of the FileFields to check. Defaults to every FileField on the model.
+    :return: True if none of the files are missing
+    """
+    for field in result_object._meta.concrete_fields:
+        if isinstance(field, models.FileField) and (field_names is None or field.name in field_names):
+            name = getattr(result_object, field.attname).name
+            if name and not (Path(settings.MEDIA_ROOT) / name).exists():
+                return False
+    return True
+
+
+def claim_cache_entry(cache_key: str, tool: str, sample_instance: AnalysisSample, input_checksum: str,
+                      tool_version: str, max_age: timedelta = None, force: bool = False) -> tuple:
+    """
+    Retrieves the cache entry for cache_key, taking ownership of it if it does not exist yet, if the previous owner
+    failed or disappeared, if it has been running for longer than RESULT_CACHE_STALE_HOURS, or if it is older than
+    max_age.
+    :return: tuple(AnalysisResultCache, True if sample_instance now owns the entry and must run the job)
+    """
+    stale_before = timezone.now() - timedelta(hours=settings.RESULT_CACHE_STALE_HOURS)
+    with transaction.atomic():
+        entry, created = AnalysisResultCache.objects.select_for_update().get_or_create(
+            cache_key=cache_key,
+            defaults={'tool': tool, 'analysis_sample': sample_instance, 'input_checksum': input_checksum,
+                      'tool_version': tool_version, 'status': 'Working'})
+        if created:
+            return entry, True
+        expired = max_age is not None and entry.status == 'Complete' and entry.modified < timezone.now() - max_age
+        stale = entry.status == 'Working' and entry.modified < stale_before
+        if force or expired or stale or entry.status == 'Failed' or entry.analysis_sample_id is None:
+            entry.analysis_sample = sample_instance
+            entry.status = 'Working'
+            entry.save()
+            return entry, True
+        # A retry of the job that owns the entry
+        if entry.analysis_sample_id == sample_instance.id:
+            return entry, entry.status != 'Complete'
+        return entry, False
+
+
+def set_cache_entry_status(entry: AnalysisResultCache, status: str):
+    entry.status = status
+    entry.save(update_fields=['status', 'modified'])
+
+
+def run_cached(sample_instance: AnalysisSample, tool: str, input_checksum: str, tool_version: str, params: dict,
+               compute: Callable, reuse: Callable, max_age: timedelta = None):
+    """
+    Runs compute(sample_instance) unless an identical result is already available or being computed.
+    :param sample_instance: AnalysisSample the result is for
+    :param tool: Name of the analysis, e.g. 'RGI'
+    :param input_checksum: Checksum of the tool input
+    :param tool_version: Version string of the tool
+    :param params: Parameters that affect the result
+    :param compute: Callable(sample_instance) that runs the tool and stores its result rows. Returning None marks the
+    job as failed in the cache.
+    :param reuse: Callable(source_sample, sample_instance) that attaches the result rows of source_sample to
+    sample_instance, or returns the existing result if sample_instance already has one. Must return None if the source
+    results no longer exist.
+    :param max_age: Optional age after which a completed entry is recomputed
+    :return: The result object returned by compute or reuse
+    """
+    cache_key = build_cache_key(tool=tool, input_checksum=input_checksum, tool_version=tool_version, params=params)
+    force = False
+    waiting = False
+    while True:
+        entry, owned = claim_cache_entry(cache_key=cache_key, tool=tool, sample_instance=sample_instance,
+                                         input_checksum=input_checksum, tool_version=tool_version, max_age=max_age,
+                                         force=force)
+        if owned:
+            break
+        if entry.status == 'Complete':
+            result = reuse(entry.analysis_sample, sample_instance)
+            if result is not None:
+                logger.info(f"Reused {tool} results of {entry.analysis_sample} for {sample_instance}")
+                return result
+            # The results of the previous owner are gone; take over the entry and run the job again
+            force = True
+            continue
+        if not waiting:
+            logger.info(f"Waiting on the running {tool} job for {entry.analysis_sample} "
+                        f"instead of running {sample_instance}")
+            waiting = True
+        time.sleep(settings.RESULT_CACHE_POLL_INTERVAL)
+
+    try:
+        result = compute(sample_instance)
+    except Exception:
+        set_cache_entry_status(entry, 'Failed')
+        raise
+    set_cache_entry_status(entry, 'Failed' if result is None else 'Complete')
+    return result
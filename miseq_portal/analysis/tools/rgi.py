@@ -7,6 +7,7 @@ import pandas as pd
 from django.conf import settings
 from miseq_portal.analysis.models import AnalysisGroup
 from miseq_portal.analysis.tools.helpers import run_subprocess
+from miseq_portal.analysis.tools.resources import reserve_resources
 
 logger = logging.getLogger('django')
 
@@ -26,8 +27,9 @@ def call_rgi_main(fasta: Path, outdir: Path, sample_id: str) -> Optional[tuple]:
     :return:
     """
     outpath = outdir / (sample_id + "_RGI_Results")
-    cmd = f'{RGI} main -i {fasta} -o {outpath} --clean'
-    outlog = run_subprocess(cmd, get_stdout=True)
+    with reserve_resources('rgi', cpus=8, memory_gb=8, min_cpus=1, min_memory_gb=4) as grant:
+        cmd = f'{RGI} main -i {fasta} -o {outpath} --clean -n {grant.cpus}'
+        outlog = run_subprocess(cmd, get_stdout=True)
     logger.info(cmd)
     logger.info(outlog)
     rgi_text_results = outpath.with_suffix(".txt")
@@ -68,7 +70,8 @@ def call_rgi_heatmap(rgi_json_dir: Path, outdir: Path, analysis_group: AnalysisG
     outpath = outdir / (analysis_group.created.strftime('%Y%m%d') + '_heatmap')
     cmd = f'{RGI} heatmap -i {rgi_json_dir} --category {category} ' \
           f'--cluster {cluster} --display {display} --output {outpath}'
-    outlog = run_subprocess(cmd, get_stdout=True)
+    with reserve_resources('rgi heatmap', cpus=1, memory_gb=2):
+        outlog = run_subprocess(cmd, get_stdout=True)
     logger.info(cmd)
     logger.info(outlog)
 
@@ -2,49 +2,265 @@
 Get rMLST profile(s) via the pubmlst API, and process the result
 adapted from the script written by Keith Jolley
 
+Requests are made through RMLSTClient, which keeps a pool of connections open to the rMLST endpoint, streams the
+base64-encoded assembly instead of building the request body in memory, retries transient failures with exponential
+backoff and caches responses on disk by assembly checksum. The endpoint is configurable (settings.RMLST_URI) so a local
+stand-in server can be used for testing.
 """
 
-import requests, base64, logging, json
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from miseq_portal.analysis.tools.helpers import file_checksum
+
 logger = logging.getLogger('raven')
 
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RMLSTError(Exception):
+    """ Raised when the rMLST endpoint does not return a usable response """
+    pass
+
+
+class Base64SequencePayload:
+    """
+    Iterable JSON request body for the rMLST sequence endpoint, equivalent to
+    '{"base64":true,"details":true,"sequence":"<base64 encoded assembly>"}'. The assembly is read and encoded in chunks
+    as the body is sent. __len__ lets requests send a Content-Length header rather than a chunked body, and the payload
+    can be iterated again when a request is retried.
+    :param fasta: Path to the assembly
+    :param chunk_size: Bytes of the assembly to encode at a time. Must be a multiple of 3 so chunks concatenate into
+    valid base64.
+    """
+    prefix = b'{"base64":true,"details":true,"sequence":"'
+    suffix = b'"}'
+
+    def __init__(self, fasta: Path, chunk_size: int = 3 * 256 * 1024):
+        if chunk_size % 3 != 0:
+            raise ValueError("chunk_size must be a multiple of 3")
+        self.fasta = Path(fasta)
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        yield self.prefix
+        with open(str(self.fasta), 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                yield base64.b64encode(chunk)
+        yield self.suffix
 
-def query_rmlst(assembly: Path, outdir: Path, root: Path):
-    uri = 'https://rest.pubmlst.org/db/pubmlst_rmlst_seqdef_kiosk/schemes/1/sequence'
-    logger.info(f"Submitting rMLST query for {assembly}")
-    with open(assembly, 'r') as x:
-        fasta = x.read()
-    payload = '{"base64":true,"details":true,"sequence":"' + base64.b64encode(fasta.encode()).decode() + '"}'
-    response = requests.post(uri, data=payload)
-    if response.status_code == requests.codes.ok:
-        data = response.json()
-        jout = outdir / 'rmlst.json'
-        with open(root / jout , 'w') as w:
-            json.dump(data, w)
+    def __len__(self):
+        encoded_size = 4 * ((self.fasta.stat().st_size + 2) // 3)
+        return len(self.prefix) + encoded_size + len(self.suffix)
+
+
+class RMLSTResponseCache:
+    """
+    On-disk cache of rMLST responses, stored as one JSON file per assembly checksum
+    :param cache_dir: Directory holding the cached responses
+    :param max_age_days: Age after which a cached response is ignored, since the remote database changes over time
+    """
+
+    def __init__(self, cache_dir: Path, max_age_days: float = None):
+        self.cache_dir = Path(cache_dir)
+        self.max_age_days = max_age_days
+
+    def path(self, checksum: str) -> Path:
+        return self.cache_dir / checksum[:2] / f"{checksum}.json"
+
+    def get(self, checksum: str):
+        path = self.path(checksum)
         try:
-            support = data['taxon_prediction'][0]['support']
-            taxon = data['taxon_prediction'][0]['taxon']
-        except KeyError:
-            support = None
-            taxon = None
+            if self.max_age_days is not None and time.time() - path.stat().st_mtime > self.max_age_days * 86400:
+                return None
+            with open(str(path), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, checksum: str, data: dict):
+        path = self.path(checksum)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(str(tmp_path), 'w') as f:
+            json.dump(data, f)
+        os.replace(str(tmp_path), str(path))
+
+
+class RMLSTClient:
+    """
+    Thread-safe client for the rMLST sequence endpoint. Each thread gets its own requests.Session, but all of them share
+    a single connection pool.
+    :param uri: URL of the rMLST sequence endpoint
+    :param cache: Optional RMLSTResponseCache
+    :param timeout: Seconds to wait for a response
+    :param max_retries: Number of times to retry a request after a connection error, timeout or RETRY_STATUS_CODES
+    :param backoff: Seconds to wait before the first retry; doubled on every following retry
+    :param pool_size: Maximum number of connections kept open to the endpoint
+    """
+
+    def __init__(self, uri: str, cache: RMLSTResponseCache = None, timeout: float = 600, max_retries: int = 5,
+                 backoff: float = 2, pool_size: int = 4):
+        self.uri = uri
+        self.cache = cache
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            session.headers.update({'Content-Type': 'application/json'})
+            self._local.session = session
+        return session
+
+    def retry_delay(self, attempt: int, response: requests.Response = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is not None and retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * 2 ** attempt
+
+    def post(self, assembly: Path) -> dict:
+        """
+        Submits an assembly to the endpoint, retrying transient failures
+        :param assembly: Path to the assembly
+        :return: Decoded JSON response
+        """
+        payload = Base64SequencePayload(assembly)
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self.session.post(self.uri, data=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == requests.codes.ok:
+                    return response.json()
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise RMLSTError(f"rMLST query for {assembly} failed ({response.status_code}): {response.text}")
+                error = f"HTTP {response.status_code}"
+            if attempt == self.max_retries:
+                raise RMLSTError(f"rMLST query for {assembly} failed after {attempt + 1} attempts ({error})")
+            delay = self.retry_delay(attempt, response)
+            logger.warning(f"rMLST query for {assembly} failed ({error}), retrying in {delay} seconds")
+            time.sleep(delay)
+
+    def query(self, assembly: Path) -> dict:
+        """
+        Retrieves the rMLST response for an assembly, from the cache if available
+        :param assembly: Path to the assembly
+        :return: Decoded JSON response
+        """
+        checksum = file_checksum(assembly) if self.cache is not None else None
+        if checksum is not None:
+            data = self.cache.get(checksum)
+            if data is not None:
+                logger.info(f"Using cached rMLST response for {assembly}")
+                return data
+        logger.info(f"Submitting rMLST query for {assembly}")
+        data = self.post(assembly)
+        if checksum is not None:
+            self.cache.put(checksum, data)
+        return data
+
+    def query_many(self, assemblies: [Path], max_workers: int = None) -> dict:
+        """
+        Queries several assemblies concurrently. Failures of any kind are logged and returned as RMLSTError instead
+        of raised so one bad assembly does not affect the rest of the batch.
+        :param assemblies: List of paths to assemblies
+        :param max_workers: Maximum number of simultaneous requests. Defaults to the connection pool size.
+        :return: Dictionary of {assembly: response dict or RMLSTError}
+        """
+        def query(assembly: Path):
+            try:
+                return self.query(assembly)
+            except RMLSTError as e:
+                logger.warning(str(e))
+                return e
+            except Exception as e:
+                logger.exception(f"rMLST query failed for {assembly}: {e}")
+                return RMLSTError(f"rMLST query failed for {assembly}: {e}")
+
+        assemblies = list(assemblies)
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as executor:
+            return dict(zip(assemblies, executor.map(query, assemblies)))
+
+
+def get_rmlst_client() -> RMLSTClient:
+    """
+    Returns an RMLSTClient configured from the RMLST_* settings. Responses are cached separately for each endpoint so
+    responses from a local stand-in server never end up in the production cache.
+    """
+    cache_dir = Path(settings.RMLST_CACHE_DIR) / hashlib.sha1(settings.RMLST_URI.encode()).hexdigest()[:12]
+    return RMLSTClient(uri=settings.RMLST_URI,
+                       cache=RMLSTResponseCache(cache_dir=cache_dir, max_age_days=settings.RMLST_RESULT_CACHE_DAYS),
+                       timeout=settings.RMLST_TIMEOUT,
+                       max_retries=settings.RMLST_MAX_RETRIES,
+                       pool_size=settings.RMLST_MAX_CONCURRENCY)
+
+
+def write_rmlst_results(data: dict, outdir: Path, root: Path) -> dict:
+    """
+    Writes an rMLST response to rmlst.json and its exact matches to rmlst.csv
+    :param data: Decoded JSON response from the rMLST endpoint
+    :param outdir: Output directory relative to root
+    :param root: Root directory (MEDIA_ROOT)
+    :return: Dictionary of result paths relative to root, support, taxon and rST
+    """
+    jout = outdir / 'rmlst.json'
+    with open(root / jout, 'w') as w:
+        json.dump(data, w)
+    try:
+        support = data['taxon_prediction'][0]['support']
+        taxon = data['taxon_prediction'][0]['taxon']
+    except KeyError:
+        support = None
+        taxon = None
+    try:
+        rST = data['fields']['rST']
+    except KeyError:
+        rST = None
+
+    csvout = outdir / 'rmlst.csv'
+    with open(root / csvout, 'w') as w:
+        w.write("Locus,Allele,Length,Contig,Start,End\n")
         try:
-            rST = data['fields']['rST']
+            for exact_match in data['exact_matches']:
+                em = data['exact_matches'][exact_match][0]
+                w.write(",".join(str(item) for item in [exact_match, em['allele_id'], em['length'], em['contig'], em['start'], em['end']]))
+                w.write("\n")
         except KeyError:
-            rST = None
+            csvout = None
 
-        csvout = outdir / 'rmlst.csv'
-        with open(root / csvout, 'w') as w:
-            w.write("Locus,Allele,Length,Contig,Start,End\n")
-            try:
-                for exact_match in data['exact_matches']:
-                    em = data['exact_matches'][exact_match][0]
-                    w.write(",".join(str(item) for item in [exact_match, em['allele_id'], em['length'], em['contig'], em['start'], em['end']]))
-                    w.write("\n")
-            except KeyError:
-                csvout = None
+    return {'json': str(jout), 'csv': str(csvout), 'support': support, 'taxon': taxon, 'rST': rST}
 
-        return {'json': str(jout), 'csv': str(csvout), 'support': support, 'taxon': taxon, 'rST': rST}
 
-    else:
-        logging.info(f"Could not perform rMLST analysis: {response.text}")
+def query_rmlst(assembly: Path, outdir: Path, root: Path, client: RMLSTClient = None):
+    if client is None:
+        client = get_rmlst_client()
+    try:
+        data = client.query(assembly)
+    except RMLSTError as e:
+        logging.info(f"Could not perform rMLST analysis: {e}")
+        return
+    return write_rmlst_results(data=data, outdir=outdir, root=root)
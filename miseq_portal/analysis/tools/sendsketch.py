@@ -5,6 +5,7 @@ from subprocess import Popen
 import pandas as pd
 
 from miseq_portal.analysis.models import SendsketchResult
+from miseq_portal.analysis.tools.resources import reserve_resources
 from miseq_portal.miseq_viewer.models import Sample
 
 logger = logging.getLogger('raven')
@@ -23,10 +24,11 @@ def run_sendsketch(fwd_reads: Path, rev_reads: Path, outpath: Path) -> Path:
     logger.info(f"R2: {rev_reads}")
     logger.info(f"Outpath: {outpath}")
     # TODO: Refactor this to use the assembly if available. Bushnell says this is generally more accurate.
-    cmd = f"sendsketch.sh in={fwd_reads} in2={rev_reads} out={outpath} " \
-        f"reads=1m samplerate=0.5 minkeycount=2 overwrite=true"
-    p = Popen(cmd, shell=True)
-    p.wait()
+    with reserve_resources('sendsketch', cpus=2, memory_gb=4, min_cpus=1, min_memory_gb=2) as grant:
+        cmd = f"sendsketch.sh in={fwd_reads} in2={rev_reads} out={outpath} " \
+            f"reads=1m samplerate=0.5 minkeycount=2 overwrite=true threads={grant.cpus} -Xmx{grant.java_heap}"
+        p = Popen(cmd, shell=True)
+        p.wait()
     return outpath
 
 
@@ -7,6 +7,7 @@ import logging
 from pathlib import Path
 from django.conf import settings
 from miseq_portal.analysis.tools.helpers import run_subprocess
+from miseq_portal.analysis.tools.resources import reserve_resources
 import re
 
 logger = logging.getLogger('raven')
@@ -29,7 +30,10 @@ def query_stx(read_dir: Path, outdir: Path, assembly_dir: Path = None, samples_s
         cmd += f" --samplenames '{samples_str}'"
     if coverage_str:
         cmd += f" --coverage '{coverage_str}'"
-    outlog = run_subprocess(cmd, get_stdout=True)
+    # Nextflow schedules its own processes with the CPUs and memory set in main.config and can't be handed a smaller
+    # grant, so the full budget it is configured to use is reserved; keep these in step with main.config
+    with reserve_resources('stx nextflow', cpus=8, memory_gb=16):
+        outlog = run_subprocess(cmd, get_stdout=True)
     logger.info(cmd)
     logger.info(outlog)
     report_xlsx = outdir / reportdir / reportname
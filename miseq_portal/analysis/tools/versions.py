@@ -0,0 +1,137 @@
+"""
+Process-wide registry of external tool versions.
+
+Calling '<tool> --version' spawns a subprocess (and a JVM for the BBTools and Pilon), so versions are resolved once per
+worker process and cached against the path and modification time of the executable. Upgrading a tool in place is
+picked up on the next lookup without having to restart the workers. Failed probes (e.g. a missing executable or a JVM
+that could not reserve its heap) are never cached, so the tool is probed again on the next lookup.
+"""
+import logging
+import shutil
+import subprocess
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('django')
+
+
+def extract_bbtool_version_line(version: str) -> str:
+    # Extract version line
+    elements = version.split("\n")
+    for e in elements:
+        if 'version' in e.lower():
+            version = e
+    return version
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """
+    Describes how to retrieve the version of an external tool
+    :param executable: Name of the executable on $PATH, or an absolute path
+    :param version_args: Arguments passed to the executable to print its version
+    :param interpreter: Optional interpreter used to invoke the executable (e.g. a Conda environment's python)
+    :param parser: Optional callable to extract the relevant line(s) from the raw output
+    """
+    executable: str
+    version_args: str = '--version'
+    interpreter: Optional[str] = None
+    parser: Optional[Callable] = None
+
+
+TOOL_SPECS = {
+    'bbduk': ToolSpec(executable='bbduk.sh', parser=extract_bbtool_version_line),
+    'bbmap': ToolSpec(executable='bbmap.sh', parser=extract_bbtool_version_line),
+    'tadpole': ToolSpec(executable='tadpole.sh', parser=extract_bbtool_version_line),
+    'pilon': ToolSpec(executable='pilon'),
+    'skesa': ToolSpec(executable='skesa'),
+    'quast': ToolSpec(executable='quast.py'),
+    'mash': ToolSpec(executable='mash', version_args='--version'),
+    'rgi': ToolSpec(executable=str(settings.RGI_EXE), version_args='main --version'),
+    'mob_recon': ToolSpec(executable=str(settings.MOB_RECON_EXE)),
+    'confindr': ToolSpec(executable=str(settings.CONFINDR_EXE),
+                         interpreter=str(settings.CONFINDR_EXE.parent / 'python')),
+}
+
+
+class ToolVersionRegistry:
+    """
+    Thread-safe cache of tool versions keyed by tool name. Each entry remembers the (path, mtime) of the executable it
+    was resolved from; a lookup only costs a stat() call unless the executable has changed.
+    """
+
+    def __init__(self, tool_specs: dict):
+        self.tool_specs = tool_specs
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def resolve_executable(tool_spec: ToolSpec) -> Optional[Path]:
+        executable = Path(tool_spec.executable)
+        if not executable.is_absolute():
+            found = shutil.which(tool_spec.executable)
+            if found is None:
+                return None
+            executable = Path(found)
+        return executable if executable.exists() else None
+
+    @staticmethod
+    def executable_key(executable: Optional[Path]) -> Optional[tuple]:
+        if executable is None:
+            return None
+        return str(executable), executable.stat().st_mtime_ns
+
+    @staticmethod
+    def call_version(tool_spec: ToolSpec) -> (str, bool):
+        """
+        :return: Tuple of (version, success). Tools print their version to either stdout or stderr, so the version is
+        taken from stdout if it isn't empty and from stderr otherwise. The probe succeeded if the tool exited with
+        status 0 and printed something.
+        """
+        cmd = f"{tool_spec.executable} {tool_spec.version_args}"
+        if tool_spec.interpreter is not None:
+            cmd = f"{tool_spec.interpreter} {cmd}"
+        p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        version = p.stdout.decode().strip() or p.stderr.decode().strip()
+        success = p.returncode == 0 and version != ""
+        if success and tool_spec.parser is not None:
+            version = tool_spec.parser(version)
+        return version, success
+
+    def get_version(self, tool: str) -> str:
+        """
+        Retrieves the version string for a tool, calling the tool only if its executable changed since the last lookup
+        :param tool: Name of the tool in the registry, e.g. 'bbduk'
+        :return: Version string as reported by the tool, or the output of the failed probe
+        """
+        tool_spec = self.tool_specs[tool]
+        key = self.executable_key(self.resolve_executable(tool_spec))
+        with self._lock:
+            cached = self._cache.get(tool)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        version, success = self.call_version(tool_spec)
+        if not success:
+            logger.warning(f"Could not resolve {tool} version: {version}")
+            return version
+        logger.info(f"Resolved {tool} version: {version}")
+        with self._lock:
+            self._cache[tool] = (key, version)
+        return version
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+tool_versions = ToolVersionRegistry(tool_specs=TOOL_SPECS)
+
+
+def get_tool_version(tool: str) -> str:
+    """ Shortcut for retrieving a version from the process-wide ToolVersionRegistry """
+    return tool_versions.get_version(tool)
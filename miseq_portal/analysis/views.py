@@ -2,6 +2,7 @@ import logging
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import JsonResponse
+from django.db.models import Prefetch
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
 from django.views.generic import View, TemplateView, DetailView, DeleteView
@@ -10,7 +11,7 @@ from miseq_portal.analysis.forms import AnalysisToolForm
 from miseq_portal.analysis.models import AnalysisSample, AnalysisGroup, SendsketchResult, MobSuiteAnalysisPlasmid, \
     MobSuiteAnalysisGroup, RGIResult, RGIGroupResult, ConfindrGroupResult, ConfindrResult, rMLSTResult, StxGroupResult, StxSampleResult, StxGeneResult
 from miseq_portal.analysis.tasks import submit_analysis_job
-from miseq_portal.miseq_viewer.models import Sample, UserProjectRelationship
+from miseq_portal.miseq_viewer.permissions import get_selected_samples
 
 logger = logging.getLogger('django')
 
@@ -19,20 +20,12 @@ class SampleSelectView(LoginRequiredMixin, TemplateView):
     template_name = "analysis/sample_select.html"
     success_url = 'tools/'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['approved_users'] = UserProjectRelationship.objects.filter(user_id=self.request.user)
-        return context
-
     def post(self, request, *args, **kwargs):
         # Grab sample list from user selection from the analysis_index.html page via AJAX
         sample_id_list = request.POST.getlist('sample_id_list[]')
 
         # Get corresponding Sample objects from user selection
-        sample_object_list = list()
-        for sample_id in sample_id_list:
-            sample_object = Sample.objects.get(sample_id=sample_id)
-            sample_object_list.append(sample_object)
+        sample_object_list = get_selected_samples(sample_id_list, request.user)
 
         # Create new AnalysisGroup
         analysis_group = AnalysisGroup(user=request.user)
@@ -126,13 +119,12 @@ class AnalysisGroupDetailView(LoginRequiredMixin, DetailView):
         # Mob Suite
         elif context['analysis_group'].job_type == 'MobRecon':
 
-            # Add analysis samples to context
+            # Add analysis samples to context, each with its plasmids attached as .plasmids
             context['mob_suite_analysis_samples'] = MobSuiteAnalysisGroup.objects.filter(
-                analysis_sample__group_id=context['analysis_group']).order_by('-analysis_sample__sample_id')
-
-            # Add plasmids to context
-            context['mob_suite_analysis_plasmids'] = MobSuiteAnalysisPlasmid.objects.filter(
-                group_id__analysis_sample__group_id=context['analysis_group']).order_by('-sample_id')
+                analysis_sample__group_id=context['analysis_group']).select_related(
+                'analysis_sample__sample_id').prefetch_related(
+                Prefetch('mobsuiteanalysisplasmid_set', queryset=MobSuiteAnalysisPlasmid.objects.order_by('id'),
+                         to_attr='plasmids')).order_by('-analysis_sample__sample_id')
 
         # RGI
         elif context['analysis_group'].job_type == 'RGI':
@@ -3,10 +3,11 @@ import logging
 import pandas as pd
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import OuterRef
 from django.urls import reverse
 
 from miseq_portal.core.models import TimeStampedModel
-from miseq_portal.miseq_viewer.models import Sample, Project
+from miseq_portal.miseq_viewer.models import Sample, Project, count_subquery
 
 logger = logging.getLogger('django')
 
@@ -73,19 +74,32 @@ def validate_minion_sample_id(value: str, length: int = 15):
     return True
 
 
+class MinIONRunQuerySet(models.QuerySet):
+    def with_sample_stats(self):
+        """ Annotates every run with annotated_num_samples, computed by the database in the same query """
+        return self.annotate(
+            annotated_num_samples=count_subquery(MinIONSample.objects.filter(run_id=OuterRef('pk')), 'run_id')
+        )
+
+
 class MinIONRun(TimeStampedModel):
     """
     Stores information relating to a single sequencing run
     """
     run_id = models.CharField(max_length=256, unique=True)
 
+    objects = MinIONRunQuerySet.as_manager()
+
     @property
     def run_url(self) -> str:
         return reverse('miseq_viewer:miseq_viewer_run_detail', args=(self.pk,))
 
     @property
     def num_samples(self) -> int:
-        return len(MinIONSample.objects.filter(run_id=self.pk))
+        # Use the value annotated by MinIONRunQuerySet.with_sample_stats() when available
+        if hasattr(self, 'annotated_num_samples'):
+            return self.annotated_num_samples
+        return MinIONSample.objects.filter(run_id=self.pk).count()
 
     def __str__(self):
         return str(self.run_id)
@@ -6,6 +6,8 @@ from miseq_portal.users.models import User
 
 
 class MinIONRunSerializer(serializers.ModelSerializer):
+    num_samples = serializers.ReadOnlyField()
+
     class Meta:
         model = MinIONRun
         fields = '__all__'
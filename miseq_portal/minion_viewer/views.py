@@ -1,5 +1,6 @@
 from django.shortcuts import render
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Prefetch
 from django.views.generic import TemplateView
 from miseq_portal.minion_viewer.models import MinIONRun, MinIONRunSamplesheet, MinIONSample
 from django.views.generic import DetailView, ListView
@@ -51,7 +52,7 @@ minion_sample_detail_view = MinIONSampleDetailView.as_view()
 
 
 class MinIONRunSamplesheetListView(LoginRequiredMixin, ListView):
-    queryset = MinIONRunSamplesheet.objects.all().order_by('-created')
+    queryset = MinIONRunSamplesheet.objects.select_related('run_id').order_by('-created')
     context_object_name = 'run_list'
     template_name = "minion_viewer/minion_run_list.html"
 
@@ -60,15 +61,19 @@ minion_run_list_view = MinIONRunSamplesheetListView.as_view()
 
 
 class MinIONRunViewSet(viewsets.ModelViewSet):
-    queryset = MinIONRun.objects.all().order_by('run_id')
+    queryset = MinIONRun.objects.with_sample_stats().order_by('run_id')
     serializer_class = MinIONRunSerializer
 
 
 class MinIONRunSamplesheetViewSet(viewsets.ModelViewSet):
-    queryset = MinIONRunSamplesheet.objects.all().order_by('run_id__run_id')
+    queryset = MinIONRunSamplesheet.objects.prefetch_related(
+        Prefetch('run_id', queryset=MinIONRun.objects.with_sample_stats())
+    ).order_by('run_id__run_id')
     serializer_class = MinIONRunSamplesheetSerializer
 
 
 class MinIONSampleViewSet(viewsets.ModelViewSet):
-    queryset = MinIONSample.objects.all().order_by('sample_name')
+    queryset = MinIONSample.objects.select_related('project_id').prefetch_related(
+        Prefetch('run_id', queryset=MinIONRun.objects.with_sample_stats())
+    ).order_by('sample_name')
     serializer_class = MinIONSampleSerializer
@@ -1,3 +1,6 @@
 from django.contrib import admin
 
+from .models import RunIngestJob
+
 # Register your models here.
+admin.site.register(RunIngestJob)
@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.utils import timezone
+
+from miseq_portal.miseq_viewer.models import Run
+from miseq_portal.users.models import User
+
+RUN_INGEST_PROGRESS_CACHE_KEY = 'miseq_uploader:run_ingest_progress:{pk}'
+RUN_INGEST_PROGRESS_CACHE_TIMEOUT = 60 * 60 * 24
+RUN_INGEST_STALE_ERROR = 'The ingest did not finish within RUN_INGEST_TIME_LIMIT; the worker was likely killed'
+
+
+def get_run_ingest_stale_before():
+    """ Active jobs last modified before this time can no longer be running, see RunIngestJob.is_stale """
+    return timezone.now() - timedelta(seconds=settings.RUN_INGEST_TIME_LIMIT)
+
+
+class RunIngestJobQuerySet(models.QuerySet):
+    def active(self):
+        """ Restricts the queryset to jobs that are queued or running and are not stale """
+        return self.filter(job_status__in=['Queued', 'Working'], modified__gte=get_run_ingest_stale_before())
+
+
+class RunIngestJob(models.Model):
+    """
+    Tracks the ingest of a MiSeq run directory by the ingest_miseq_run Celery task.
+    The per-file transfer progress is kept in the cache while the job is running (see record_transfer_progress), so a
+    transferred file doesn't cost a database write, and is stored on the job once it has finished.
+    A job that dies without calling finish() (e.g. the worker was killed or the message was lost) is treated as failed
+    once it has not been modified for RUN_INGEST_TIME_LIMIT seconds.
+    """
+    status_choices = (
+        ('Queued', 'Queued'),
+        ('Working', 'Working'),
+        ('Complete', 'Complete'),
+        ('Failed', 'Failed'),
+    )
+    job_status = models.CharField(choices=status_choices, max_length=50, blank=False, default='Queued')
+
+    phase_choices = (
+        ('Queued', 'Queued'),
+        ('Validating', 'Validating run directory'),
+        ('Uploading', 'Transferring reads and uploading to database'),
+        ('Assembling', 'Submitting samples for assembly'),
+        ('Finished', 'Finished'),
+    )
+    phase = models.CharField(choices=phase_choices, max_length=50, blank=False, default='Queued')
+
+    miseq_directory = models.CharField(max_length=1000)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    run = models.ForeignKey(Run, on_delete=models.SET_NULL, blank=True, null=True)
+    task_id = models.CharField(max_length=255, blank=True)
+
+    sample_count = models.IntegerField(default=0)
+    files_transferred = models.IntegerField(default=0)
+    files_total = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    objects = RunIngestJobQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.id} ({self.miseq_directory})"
+
+    @property
+    def is_stale(self) -> bool:
+        """ The job is recorded as queued or running but has outlived the ingest_miseq_run time limit """
+        return self.job_status in ('Queued', 'Working') and self.modified is not None \
+            and self.modified < get_run_ingest_stale_before()
+
+    @property
+    def is_active(self) -> bool:
+        return self.job_status in ('Queued', 'Working') and not self.is_stale
+
+    @property
+    def progress_cache_key(self) -> str:
+        return RUN_INGEST_PROGRESS_CACHE_KEY.format(pk=self.pk)
+
+    def set_phase(self, phase: str):
+        self.phase = phase
+        self.save(update_fields=['phase', 'modified'])
+
+    def record_transfer_progress(self, completed: int, total: int, result=None):
+        """ progress_callback for miseq_uploader.transfer.transfer_files() """
+        cache.set(self.progress_cache_key, (completed, total), timeout=RUN_INGEST_PROGRESS_CACHE_TIMEOUT)
+
+    def get_transfer_progress(self) -> (int, int):
+        """ :return: Tuple of (files transferred, total files), read from the cache while the job is running """
+        if self.is_active:
+            progress = cache.get(self.progress_cache_key)
+            if progress is not None:
+                return progress
+        return self.files_transferred, self.files_total
+
+    def finish(self, job_status: str, error: str = ''):
+        """ Stores the final status of the job along with its last transfer progress """
+        self.files_transferred, self.files_total = self.get_transfer_progress()
+        self.job_status = job_status
+        self.phase = 'Finished'
+        self.error = error
+        self.save()
+        cache.delete(self.progress_cache_key)
+
+    def as_dict(self) -> dict:
+        files_transferred, files_total = self.get_transfer_progress()
+        stale = self.is_stale
+        return {
+            'id': self.pk,
+            'status': 'Failed' if stale else self.job_status,
+            'phase': 'Finished' if stale else self.phase,
+            'phase_display': 'Finished' if stale else self.get_phase_display(),
+            'miseq_directory': self.miseq_directory,
+            'run_id': self.run.run_id if self.run is not None else None,
+            'sample_count': self.sample_count,
+            'files_transferred': files_transferred,
+            'files_total': files_total,
+            'error': RUN_INGEST_STALE_ERROR if stale else self.error,
+            'modified': self.modified.isoformat() if self.modified is not None else None,
+        }
+
+    class Meta:
+        verbose_name = 'Run Ingest Job'
+        verbose_name_plural = 'Run Ingest Jobs'
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from interop import py_interop_plot, py_interop_run_metrics, py_interop_run
 from pathlib import Path
 from celery import shared_task
@@ -22,10 +23,11 @@ def get_qscore_dataframe(run_folder: Path) -> pd.DataFrame:
     py_interop_plot.plot_qscore_histogram(run_metrics, options, bar_data, boundary)
 
     for i in range(bar_data.size() - 1):
-        x = [bar_data.at(i).at(j).x() for j in range(bar_data.at(i).size())]
-        y = [bar_data.at(i).at(j).y() for j in range(bar_data.at(i).size())]
-        x_vals += x
-        y_vals += y
+        series = bar_data.at(i)
+        for j in range(series.size()):
+            point = series.at(j)
+            x_vals.append(point.x())
+            y_vals.append(point.y())
     df_dict['x'] = x_vals
     df_dict['y'] = y_vals
     df = pd.DataFrame.from_dict(df_dict)
@@ -36,3 +38,25 @@ def get_qscore_dataframe(run_folder: Path) -> pd.DataFrame:
 def get_qscore_json(run_folder: Path) -> str:
     df = get_qscore_dataframe(run_folder)
     return df.to_json()
+
+
+def get_interop_mtime_ns(run_folder: Path) -> int:
+    """
+    Returns the latest modification time of the InterOp binaries of a run, which changes whenever they are replaced.
+    Raises FileNotFoundError if the run has no InterOp directory.
+    """
+    interop_dir = Path(run_folder) / 'InterOp'
+    return max((f.stat().st_mtime_ns for f in interop_dir.iterdir()), default=0)
+
+
+@lru_cache(maxsize=128)
+def _get_qscore_json_for_mtime(run_folder: str, mtime_ns: int) -> str:
+    return get_qscore_dataframe(Path(run_folder)).to_json()
+
+
+def get_cached_qscore_json(run_folder: Path) -> str:
+    """
+    Equivalent to get_qscore_json(), but memoized per process on the run folder and the modification time of its
+    InterOp binaries so the binaries are only read again after they change
+    """
+    return _get_qscore_json_for_mtime(str(run_folder), get_interop_mtime_ns(run_folder))
@@ -130,17 +130,19 @@ def correct_sample_id_list(sample_id_list: list, sample_sheet: Path) -> dict:
 
     # Correct the sample_id_list if necessary
     df = read_samplesheet(sample_sheet)
+    sample_id_values = set(df['Sample_ID'].values)
+    # Sample_ID of the first row with each Sample_Name
+    sample_name_to_id = {}
+    for sample_id_value, sample_name_value in zip(df['Sample_ID'].values, df['Sample_Name'].values):
+        sample_name_to_id.setdefault(sample_name_value, sample_id_value)
+
     sample_id_dict = {}
     for sample_id in sample_id_list:
-        sample_id_values = list(df['Sample_ID'].values)
-        sample_name_values = list(df['Sample_Name'].values)
-
         # Verify sample_id is in Sample_ID or Sample_Name column
         if sample_id in sample_id_values:
             sample_id_dict[sample_id] = sample_id
-        elif sample_id in sample_name_values:
-            sample_id_value = df[df['Sample_Name'] == sample_id].reset_index()['Sample_ID'][0]
-            sample_id_dict[sample_id] = sample_id_value
+        elif sample_id in sample_name_to_id:
+            sample_id_dict[sample_id] = sample_name_to_id[sample_id]
         else:
             raise ValueError(f"Couldn't find provided sample ID {sample_id} in SampleSheet")
     return sample_id_dict
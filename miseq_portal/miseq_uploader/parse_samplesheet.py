@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pandas as pd
 
+from miseq_portal.miseq_uploader.samplesheet import load_samplesheet
 from miseq_portal.miseq_viewer.models import Sample, SampleDataObject
 
 logger = logging.getLogger('django')
@@ -44,20 +45,12 @@ def validate_samplesheet_header(header: list) -> bool:
 
 def read_samplesheet(samplesheet: Path) -> pd.DataFrame:
     """
-    TODO:   This code has been duplicated -> method was moved to miseq_viewer.models.SampleSheetSampleData as a
-            static method. Should refactor all calls to this method to use SampleSheetSampleData.read_samplesheet()
-    Reads SampleSheet.csv and returns dataframe (all header information will be stripped)
+    Reads SampleSheet.csv and returns dataframe (all header information will be stripped), validating Sample_Project.
+    The file itself is parsed once by miseq_uploader.samplesheet.load_samplesheet().
     :param samplesheet: Path to SampleSheet.csv
     :return: pandas df of SampleSheet.csv with head section stripped away
     """
-    counter = 1
-    with open(str(samplesheet)) as f:
-        for line in f:
-            if '[Data]' in line:
-                break
-            else:
-                counter += 1
-    df = pd.read_csv(samplesheet, sep=",", index_col=False, skiprows=counter)
+    df = load_samplesheet(samplesheet).get_data()
 
     # Force Sample_Name and Sample_Project into str types
     df['Sample_Name'] = df['Sample_Name'].astype(str)
@@ -119,20 +112,11 @@ def group_by_project(samplesheet_df: pd.DataFrame) -> dict:
 
 def extract_run_name(samplesheet: Path) -> str:
     """
-    Retrieves the 'Experiment Name' from SampleSheet.csv
+    Retrieves the 'Experiment Name' from SampleSheet.csv (see SampleSheet.run_name)
     :param samplesheet: Path to SampleSheet.csv
     :return: value of 'Experiment Name'
     """
-    with open(str(samplesheet)) as f:
-        for line in f:
-            if 'Experiment Name' in line:
-                experiment_name = line.split(',')[1].strip()
-                return experiment_name
-            elif 'Description' in line:
-                experiment_name = line.split(',')[1].strip()
-                return experiment_name
-        else:
-            raise Exception(f"Could not find 'Experiment Name' in {samplesheet}")
+    return load_samplesheet(samplesheet).run_name
 
 
 def check_sample_id(value: str, length: int = 15) -> bool:
@@ -289,16 +273,7 @@ def extract_samplesheet_header_lines(samplesheet: Path):
     :param samplesheet: Path to SampleSheet.csv generated by MiSeq or iSeq
     :return: List containing header lines
     """
-    samplesheet_headers = []
-    with open(str(samplesheet), 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line == '[Header]':
-                continue
-            elif line == '[Reads]':
-                break
-            samplesheet_headers.append(line)
-    return samplesheet_headers
+    return load_samplesheet(samplesheet).header_lines
 
 
 def samplesheet_headers_to_dict(samplesheet_headers: list) -> dict:
@@ -1,6 +1,10 @@
 import json
 import pandas as pd
 from pathlib import Path
+from typing import Optional
+
+# ReadMetrics fields reported per read, prefixed with R1_/R2_ in the sample stats dictionary
+READ_METRIC_FIELDS = ('QualityScoreSum', 'TrimmedBases', 'Yield', 'YieldQ30')
 
 
 def stats_json_to_df(stats_json: Path) -> pd.DataFrame:
@@ -9,34 +13,75 @@ def stats_json_to_df(stats_json: Path) -> pd.DataFrame:
     return stats_df
 
 
+def index_demux_results(data: dict) -> dict:
+    """
+    Indexes the DemuxResults of every lane in the ConversionResults of a parsed Stats.json by sample
+    :param data: Parsed contents of a Stats.json file
+    :return: dictionary of {SampleId: [(LaneNumber, DemuxResult), ...]}
+    """
+    lane_index = dict()
+    for lane_number, conversion_result in enumerate(data.get('ConversionResults', []), start=1):
+        lane_number = int(conversion_result.get('LaneNumber', lane_number))
+        for demux_result in conversion_result.get('DemuxResults', []):
+            lane_index.setdefault(demux_result['SampleId'], []).append((lane_number, demux_result))
+    return lane_index
+
+
+def get_read_metrics(demux_result: dict, read_number: int) -> dict:
+    """ :return: ReadMetrics entry for read_number (1 or 2), or an empty dict if the read was not sequenced """
+    for position, read_metrics in enumerate(demux_result.get('ReadMetrics', []), start=1):
+        if int(read_metrics.get('ReadNumber', position)) == read_number:
+            return read_metrics
+    return dict()
+
+
+def get_optional_int(values: dict, key: str) -> Optional[int]:
+    value = values.get(key)
+    return int(value) if value is not None else None
+
+
+def sum_optional(values: list) -> Optional[int]:
+    """ :return: Sum of values, or None if any of them is missing """
+    if not values or None in values:
+        return None
+    return sum(values)
+
+
+def demux_result_stats(demux_result: dict) -> dict:
+    """ :return: Typed NumberReads, Yield and per-read metrics of a single DemuxResult """
+    stats = {
+        'NumberReads': get_optional_int(demux_result, 'NumberReads'),
+        'Yield': get_optional_int(demux_result, 'Yield'),
+    }
+    for read_number in (1, 2):
+        read_metrics = get_read_metrics(demux_result, read_number)
+        for field in READ_METRIC_FIELDS:
+            stats[f'R{read_number}_{field}'] = get_optional_int(read_metrics, field)
+    return stats
+
+
 def read_stats_json(stats_json: Path) -> dict:
     """
+    Parses a Stats.json file once. Metrics of a sample demultiplexed on more than one lane are summed over its lanes,
+    and the metrics of every lane are kept under 'Lanes'.
     :param stats_json: Path to Stats.json file from the MiSeq Log folder
     :return: dictionary containing stats on each sample: key is sample_id
     """
     with open(str(stats_json)) as f:
-        data = json.loads(f.read())
+        data = json.load(f)
 
-    sample_json = data['ConversionResults'][0]['DemuxResults']
     sample_stats_dict = dict()
-    for sample in sample_json:
-        tmp_stats_dict = dict()
-        sample_id = sample['SampleId']
+    for sample_id, lanes in index_demux_results(data).items():
+        lane_stats = []
+        for lane_number, demux_result in lanes:
+            lane_stats.append({'LaneNumber': lane_number, **demux_result_stats(demux_result)})
 
         # Basic information on sample
-        tmp_stats_dict['SampleName'] = sample['SampleName']
-        tmp_stats_dict['NumberReads'] = sample['NumberReads']
-        tmp_stats_dict['Yield'] = sample['Yield']
-
-        # ReadMetrics per read (R1, R2)
-        tmp_stats_dict['R1_QualityScoreSum'] = sample['ReadMetrics'][0]['QualityScoreSum']
-        tmp_stats_dict['R1_TrimmedBases'] = sample['ReadMetrics'][0]['TrimmedBases']
-        tmp_stats_dict['R1_Yield'] = sample['ReadMetrics'][0]['Yield']
-        tmp_stats_dict['R1_YieldQ30'] = sample['ReadMetrics'][0]['YieldQ30']
-        tmp_stats_dict['R2_QualityScoreSum'] = sample['ReadMetrics'][1]['QualityScoreSum']
-        tmp_stats_dict['R2_TrimmedBases'] = sample['ReadMetrics'][1]['TrimmedBases']
-        tmp_stats_dict['R2_Yield'] = sample['ReadMetrics'][1]['Yield']
-        tmp_stats_dict['R2_YieldQ30'] = sample['ReadMetrics'][1]['YieldQ30']
+        tmp_stats_dict = {'SampleName': lanes[0][1].get('SampleName')}
+        for key in lane_stats[0]:
+            if key != 'LaneNumber':
+                tmp_stats_dict[key] = sum_optional([lane[key] for lane in lane_stats])
+        tmp_stats_dict['Lanes'] = lane_stats
         sample_stats_dict[sample_id] = tmp_stats_dict
     return sample_stats_dict
 
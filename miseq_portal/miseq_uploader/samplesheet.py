@@ -0,0 +1,131 @@
+"""
+Single-pass SampleSheet.csv parser. A SampleSheet is read from disk once into a SampleSheet object holding its
+sections, and the object is memoized on (path, modification time, size) so every caller handling the same run shares
+it. This module does not depend on any models so it can be used from miseq_viewer.models.
+"""
+import io
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class SampleSheet:
+    """
+    Parsed contents of a SampleSheet.csv. The [Data] section is kept as a DataFrame which must not be modified, as the
+    object is shared between callers; use get_data() for a copy.
+    """
+    path: Path
+    lines: tuple
+    # Index of the [Data] line in lines, or None if the SampleSheet has no [Data] section
+    data_line: Optional[int]
+    data: pd.DataFrame = field(compare=False, repr=False)
+    # {Sample_ID: row positions in data}
+    sample_id_index: dict = field(compare=False, repr=False)
+    # {Sample_Name: row positions in data}
+    sample_name_index: dict = field(compare=False, repr=False)
+
+    @property
+    def sections(self) -> dict:
+        """ :return: dictionary of {section name: list of rows (lists of cells)} for every section before [Data] """
+        sections = {}
+        current = None
+        for line in self.lines[:self.data_line]:
+            line = line.strip()
+            if line.startswith('[') and line.endswith(']'):
+                current = sections.setdefault(line[1:-1], [])
+            elif current is not None and line.strip(','):
+                current.append(line.split(','))
+        return sections
+
+    @property
+    def settings(self) -> dict:
+        """ :return: dictionary of the key/value pairs in the [Settings] section """
+        return {row[0]: row[1] if len(row) > 1 else '' for row in self.sections.get('Settings', [])}
+
+    @property
+    def header_lines(self) -> list:
+        """
+        The stripped lines before the [Reads] subheader, except for the [Header] line itself. Fairly brittle approach
+        with the assumption that Illumina won't change their SampleSheet format.
+        """
+        header_lines = []
+        for line in self.lines:
+            line = line.strip()
+            if line == '[Header]':
+                continue
+            elif line == '[Reads]':
+                break
+            header_lines.append(line)
+        return header_lines
+
+    @property
+    def run_name(self) -> str:
+        """
+        The 'Experiment Name' of the run. Falls back to the value of the first line containing 'Description', which may
+        be the column header of the [Data] section on SampleSheets without an Experiment Name.
+        """
+        for line in self.lines:
+            if 'Experiment Name' in line or 'Description' in line:
+                return line.split(',')[1].strip()
+        raise Exception(f"Could not find 'Experiment Name' in {self.path}")
+
+    def get_data(self) -> pd.DataFrame:
+        """ :return: Copy of the [Data] section that callers are free to modify """
+        return self.data.copy()
+
+    def get_sample_row(self, sample_id: str) -> Optional[pd.Series]:
+        """ :return: [Data] row for a Sample_ID, falling back to Sample_Name, or None if the sample is not listed """
+        positions = self.sample_id_index.get(sample_id) or self.sample_name_index.get(sample_id)
+        if not positions:
+            return None
+        return self.data.iloc[positions[0]]
+
+
+def index_column(df: pd.DataFrame, column: str) -> dict:
+    """ :return: dictionary of {value: list of row positions} for a column of df, or {} if the column is missing """
+    index = {}
+    if column in df.columns:
+        for position, value in enumerate(df[column]):
+            index.setdefault(str(value), []).append(position)
+    return index
+
+
+def parse_samplesheet(samplesheet: Path) -> SampleSheet:
+    """
+    Reads a SampleSheet.csv in a single pass, without caching; see load_samplesheet()
+    :param samplesheet: Path to SampleSheet.csv
+    :return: Parsed SampleSheet
+    """
+    with open(str(samplesheet)) as f:
+        lines = tuple(f.readlines())
+
+    data_line = next((i for i, line in enumerate(lines) if '[Data]' in line), None)
+    if data_line is not None and data_line + 1 < len(lines):
+        data = pd.read_csv(io.StringIO(''.join(lines[data_line + 1:])), sep=",", index_col=False)
+    else:
+        data = pd.DataFrame()
+
+    return SampleSheet(path=Path(samplesheet),
+                       lines=lines,
+                       data_line=data_line,
+                       data=data,
+                       sample_id_index=index_column(data, 'Sample_ID'),
+                       sample_name_index=index_column(data, 'Sample_Name'))
+
+
+@lru_cache(maxsize=64)
+def _load_samplesheet(samplesheet: str, mtime_ns: int, size: int) -> SampleSheet:
+    return parse_samplesheet(Path(samplesheet))
+
+
+def load_samplesheet(samplesheet: Path) -> SampleSheet:
+    """
+    Equivalent to parse_samplesheet(), but memoized per process on the path, modification time and size of the file so
+    it is only read again after it changes. The least recently used SampleSheets are evicted first.
+    """
+    stat = Path(samplesheet).stat()
+    return _load_samplesheet(str(samplesheet), stat.st_mtime_ns, stat.st_size)
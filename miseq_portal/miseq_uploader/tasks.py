@@ -0,0 +1,39 @@
+import logging
+from pathlib import Path
+
+from celery import shared_task
+from django.conf import settings
+
+from miseq_portal.miseq_uploader.models import RunIngestJob, RUN_INGEST_STALE_ERROR
+from miseq_portal.miseq_uploader.upload_to_db import receive_miseq_run_dir
+
+logger = logging.getLogger('django')
+
+
+@shared_task(bind=True, serializer='json', time_limit=settings.RUN_INGEST_TIME_LIMIT,
+             soft_time_limit=settings.RUN_INGEST_TIME_LIMIT - 60)
+def ingest_miseq_run(self, ingest_job_id: int):
+    """
+    Ingests the MiSeq run directory of a RunIngestJob (see upload_to_db.receive_miseq_run_dir), recording the outcome
+    on the job
+    :param ingest_job_id: Primary key of the RunIngestJob
+    """
+    ingest_job = RunIngestJob.objects.get(pk=ingest_job_id)
+    if ingest_job.is_stale:
+        # The job has already been reported as failed and the run may have been resubmitted since
+        logger.warning(f"RunIngestJob {ingest_job.pk} was delivered after it went stale; not ingesting")
+        ingest_job.finish(job_status='Failed', error=RUN_INGEST_STALE_ERROR)
+        return
+    ingest_job.job_status = 'Working'
+    ingest_job.task_id = self.request.id or ''
+    ingest_job.save(update_fields=['job_status', 'task_id', 'modified'])
+
+    logger.info(f"Starting ingest of {ingest_job.miseq_directory} (RunIngestJob {ingest_job.pk})")
+    try:
+        receive_miseq_run_dir(Path(ingest_job.miseq_directory), ingest_job=ingest_job)
+    except Exception as e:
+        logger.exception(f"Ingest of {ingest_job.miseq_directory} failed (RunIngestJob {ingest_job.pk}): {e}")
+        ingest_job.finish(job_status='Failed', error=f"{type(e).__name__}: {e}")
+        raise
+    ingest_job.finish(job_status='Complete')
+    logger.info(f"Ingest of {ingest_job.miseq_directory} completed (RunIngestJob {ingest_job.pk})")
@@ -0,0 +1,45 @@
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from miseq_portal.miseq_uploader import parse_interop
+
+pytestmark = pytest.mark.django_db
+
+
+def make_run_folder() -> Path:
+    run_folder = Path(tempfile.mkdtemp())
+    (run_folder / 'InterOp').mkdir()
+    (run_folder / 'InterOp' / 'QMetricsOut.bin').write_bytes(b'\x00')
+    return run_folder
+
+
+def test_get_cached_qscore_json(monkeypatch):
+    calls = []
+
+    def get_qscore_dataframe(run_folder: Path) -> pd.DataFrame:
+        calls.append(run_folder)
+        return pd.DataFrame({'x': [30], 'y': [len(calls)]})
+
+    monkeypatch.setattr(parse_interop, 'get_qscore_dataframe', get_qscore_dataframe)
+    parse_interop._get_qscore_json_for_mtime.cache_clear()
+    run_folder = make_run_folder()
+
+    first = parse_interop.get_cached_qscore_json(run_folder)
+    assert parse_interop.get_cached_qscore_json(run_folder) == first
+    assert len(calls) == 1
+
+    # Replacing the InterOp binaries invalidates the cached histogram
+    qmetrics = run_folder / 'InterOp' / 'QMetricsOut.bin'
+    mtime_ns = qmetrics.stat().st_mtime_ns + 10 ** 9
+    os.utime(str(qmetrics), ns=(mtime_ns, mtime_ns))
+    assert parse_interop.get_cached_qscore_json(run_folder) != first
+    assert len(calls) == 2
+
+
+def test_get_interop_mtime_ns_without_interop_dir():
+    with pytest.raises(FileNotFoundError):
+        parse_interop.get_interop_mtime_ns(Path(tempfile.mkdtemp()))
@@ -0,0 +1,35 @@
+import json
+
+from miseq_portal.miseq_uploader.parse_stats_json import read_stats_json
+
+
+def make_demux_result(sample_id: str, number_reads: int, read_numbers=(1, 2)) -> dict:
+    return {
+        'SampleId': sample_id,
+        'SampleName': f'{sample_id}_name',
+        'NumberReads': number_reads,
+        'Yield': number_reads * 300,
+        'ReadMetrics': [{'ReadNumber': read_number, 'Yield': number_reads * 150, 'YieldQ30': number_reads * 140,
+                         'QualityScoreSum': number_reads * 5000, 'TrimmedBases': 0}
+                        for read_number in read_numbers]
+    }
+
+
+def test_read_stats_json(tmp_path):
+    stats_json = tmp_path / 'Stats.json'
+    stats_json.write_text(json.dumps({'ConversionResults': [
+        {'LaneNumber': 1, 'DemuxResults': [make_demux_result('BMH-2019-000001', 100),
+                                           make_demux_result('BMH-2019-000002', 10, read_numbers=(1,))]},
+        {'LaneNumber': 2, 'DemuxResults': [make_demux_result('BMH-2019-000001', 50)]},
+    ]}))
+    stats = read_stats_json(stats_json)
+
+    sample_stats = stats['BMH-2019-000001']
+    assert sample_stats['NumberReads'] == 150
+    assert sample_stats['R2_YieldQ30'] == 150 * 140
+    assert [lane['LaneNumber'] for lane in sample_stats['Lanes']] == [1, 2]
+    assert sample_stats['Lanes'][1]['NumberReads'] == 50
+
+    # Single-end samples have no R2 metrics
+    assert stats['BMH-2019-000002']['R1_Yield'] == 1500
+    assert stats['BMH-2019-000002']['R2_Yield'] is None
@@ -0,0 +1,48 @@
+from miseq_portal.miseq_uploader.samplesheet import load_samplesheet
+
+SAMPLESHEET = """[Header]
+IEMFileVersion,4
+Experiment Name,TEST_RUN
+Date,2019-01-01
+[Reads]
+151
+151
+[Settings]
+Adapter,CTGTCTCTTATACACATCT
+[Data]
+Sample_ID,Sample_Name,Sample_Plate,Sample_Well,I7_Index_ID,index,I5_Index_ID,index2,Sample_Project,Description
+BMH-2019-000001,SALMONELLA_1,,A01,N701,TAAGGCGA,S502,CTCTCTAT,PROJECT_1,WGS
+BMH-2019-000002,SALMONELLA_2,,A02,N702,CGTACTAG,S502,CTCTCTAT,PROJECT_1,META
+"""
+
+
+def write_samplesheet(tmp_path, contents: str = SAMPLESHEET):
+    samplesheet = tmp_path / 'SampleSheet.csv'
+    samplesheet.write_text(contents)
+    return samplesheet
+
+
+def test_load_samplesheet(tmp_path):
+    samplesheet = load_samplesheet(write_samplesheet(tmp_path))
+    assert samplesheet.run_name == 'TEST_RUN'
+    assert samplesheet.header_lines == ['IEMFileVersion,4', 'Experiment Name,TEST_RUN', 'Date,2019-01-01']
+    assert samplesheet.settings == {'Adapter': 'CTGTCTCTTATACACATCT'}
+    assert list(samplesheet.data['Sample_ID']) == ['BMH-2019-000001', 'BMH-2019-000002']
+    assert samplesheet.get_sample_row('SALMONELLA_2')['Sample_ID'] == 'BMH-2019-000002'
+    assert samplesheet.get_sample_row('BMH-2019-000003') is None
+
+
+def test_load_samplesheet_is_memoized(tmp_path):
+    path = write_samplesheet(tmp_path)
+    samplesheet = load_samplesheet(path)
+    assert load_samplesheet(path) is samplesheet
+
+    # Any change to the file is picked up
+    write_samplesheet(tmp_path, SAMPLESHEET.replace('TEST_RUN', 'RENAMED_RUN_01'))
+    assert load_samplesheet(path).run_name == 'RENAMED_RUN_01'
+
+
+def test_run_name_falls_back_to_description(tmp_path):
+    path = write_samplesheet(tmp_path, SAMPLESHEET.replace('Experiment Name,TEST_RUN\n', ''))
+    # Mirrors the legacy behaviour of extract_run_name(), which picks up the [Data] column header
+    assert load_samplesheet(path).run_name == 'Sample_Name'
@@ -0,0 +1,62 @@
+import hashlib
+from unittest import mock
+
+import pytest
+
+from miseq_portal.miseq_uploader import transfer
+from miseq_portal.miseq_uploader.transfer import TransferJob, read_sidecar, transfer_file, transfer_files
+
+
+def write_file(path, contents: bytes = b'@read\nACGT\n+\nIIII\n'):
+    path.write_bytes(contents)
+    return path
+
+
+def test_transfer_file(tmp_path):
+    src = write_file(tmp_path / 'sample_R1.fastq.gz')
+    dst = tmp_path / 'media' / 'reads' / 'sample_R1.fastq.gz'
+    result = transfer_file(src, dst)
+    checksum = hashlib.sha256(src.read_bytes()).hexdigest()
+    assert dst.read_bytes() == src.read_bytes()
+    assert result.sha256 == checksum
+    assert result.method == 'hardlink'
+    assert read_sidecar(dst) == checksum
+    assert sorted(path.name for path in dst.parent.iterdir()) == [dst.name, dst.name + '.sha256']
+
+
+def test_transfer_file_copy(tmp_path):
+    src = write_file(tmp_path / 'sample_R1.fastq.gz')
+    dst = tmp_path / 'media' / 'sample_R1.fastq.gz'
+    with mock.patch.object(transfer, 'same_filesystem', return_value=False), \
+            mock.patch.object(transfer, 'try_reflink', return_value=False):
+        result = transfer_file(src, dst, chunk_size=4)
+    assert result.method == 'copy'
+    assert result.sha256 == hashlib.sha256(src.read_bytes()).hexdigest()
+    assert dst.read_bytes() == src.read_bytes()
+
+
+def test_transfer_file_resume(tmp_path):
+    src = write_file(tmp_path / 'sample_R1.fastq.gz')
+    dst = tmp_path / 'media' / 'sample_R1.fastq.gz'
+    transfer_file(src, dst)
+    assert transfer_file(src, dst).method == 'resumed'
+
+
+def test_transfer_file_failure_leaves_no_partial_file(tmp_path):
+    src = write_file(tmp_path / 'sample_R1.fastq.gz')
+    dst = tmp_path / 'media' / 'sample_R1.fastq.gz'
+    with mock.patch.object(transfer, 'same_filesystem', return_value=False), \
+            mock.patch.object(transfer, 'try_reflink', return_value=False), \
+            mock.patch.object(transfer, 'stream_copy', side_effect=IOError('disk full')):
+        with pytest.raises(IOError):
+            transfer_file(src, dst)
+    assert list(dst.parent.iterdir()) == []
+
+
+def test_transfer_files(tmp_path):
+    jobs = [TransferJob(src=write_file(tmp_path / f'sample_{i}.fastq.gz', bytes([i]) * 10),
+                        dst=tmp_path / 'media' / f'sample_{i}.fastq.gz') for i in range(6)]
+    progress = []
+    results = transfer_files(jobs, max_workers=3, progress_callback=lambda *args: progress.append(args[:2]))
+    assert [result.dst for result in results] == [job.dst for job in jobs]
+    assert sorted(progress) == [(i, 6) for i in range(1, 7)]
@@ -0,0 +1,54 @@
+from pathlib import Path
+from unittest import mock
+
+from django.test import TestCase
+from model_mommy import mommy
+
+from miseq_portal.miseq_uploader.transfer import TransferResult
+from miseq_portal.miseq_uploader.upload_to_db import db_create_projects, db_create_sample_logs, \
+    transfer_new_sample_reads
+from miseq_portal.miseq_viewer.models import Project, Sample, SampleDataObject, SampleLogData, \
+    UserProjectRelationship
+from miseq_portal.users.models import User
+
+
+class BulkIngestTest(TestCase):
+    def setUp(self):
+        self.admin = mommy.make(User, username='admin')
+        self.sample_objects = [
+            SampleDataObject(sample_id=f'BMH-2019-00000{i}', run_id='TEST_RUN', project_id=f'PROJECT_{i % 2}',
+                             sample_name=f'sample_{i}', sample_type='BMH', number_reads=i * 100)
+            for i in range(1, 5)
+        ]
+
+    def test_projects_are_created_once(self):
+        mommy.make(Project, project_id='PROJECT_0')
+        projects = db_create_projects(sample_object_list=self.sample_objects, admin_user=self.admin)
+        assert set(projects) == {'PROJECT_0', 'PROJECT_1'}
+        assert UserProjectRelationship.objects.filter(user_id=self.admin).count() == 1
+
+    def test_sample_logs_are_bulk_created(self):
+        samples = [mommy.make(Sample, sample_id=sample_object.sample_id) for sample_object in self.sample_objects]
+        mommy.make(SampleLogData, sample_id=samples[0], number_reads=1)
+        with self.assertNumQueries(2):
+            created = db_create_sample_logs(sample_object_list=self.sample_objects, sample_instances=samples)
+        assert len(created) == 3
+        assert SampleLogData.objects.get(sample_id=samples[0]).number_reads == 1
+        assert SampleLogData.objects.get(sample_id=samples[3]).number_reads == 400
+
+    def test_only_new_sample_reads_are_transferred(self):
+        mommy.make(Sample, sample_id='BMH-2019-000001')
+        for sample_object in self.sample_objects:
+            sample_object.fwd_read_path = Path(f'/data/{sample_object.sample_id}_R1.fastq.gz')
+            sample_object.rev_read_path = Path(f'/data/{sample_object.sample_id}_R2.fastq.gz')
+
+        def transfer_files(jobs, **kwargs):
+            return [TransferResult(src=job.src, dst=job.dst, sha256=job.src.name, size=0, method='copy')
+                    for job in jobs]
+
+        with mock.patch('miseq_portal.miseq_uploader.upload_to_db.transfer_files', side_effect=transfer_files):
+            transferred_reads = transfer_new_sample_reads(sample_object_list=self.sample_objects)
+        assert set(transferred_reads) == {'BMH-2019-000002', 'BMH-2019-000003', 'BMH-2019-000004'}
+        sample = transferred_reads['BMH-2019-000002']
+        assert sample.fwd_reads.name == 'uploads/runs/TEST_RUN/BMH-2019-000002/BMH-2019-000002_R1.fastq.gz'
+        assert sample.rev_reads_sha256 == 'BMH-2019-000002_R2.fastq.gz'
@@ -0,0 +1,68 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from model_mommy import mommy
+
+from miseq_portal.miseq_uploader.models import RunIngestJob
+from miseq_portal.miseq_uploader.tasks import ingest_miseq_run
+from miseq_portal.users.models import User
+
+
+class RunIngestJobTest(TestCase):
+    def setUp(self):
+        self.user = mommy.make(User, is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_form_queues_ingest_job(self):
+        response = self.client.post(reverse('miseq_uploader:miseq_form'), {'miseq_directory': '/data/RUN_1'})
+        ingest_job = RunIngestJob.objects.get()
+        self.assertRedirects(response, reverse('miseq_uploader:run_ingest_job', kwargs={'pk': ingest_job.pk}))
+        assert ingest_job.job_status == 'Queued'
+        assert ingest_job.user == self.user
+
+        # Submitting the same directory again while it is being ingested returns the existing job
+        self.client.post(reverse('miseq_uploader:miseq_form'), {'miseq_directory': '/data/RUN_1'})
+        assert RunIngestJob.objects.count() == 1
+
+    def test_status(self):
+        ingest_job = mommy.make(RunIngestJob, miseq_directory='/data/RUN_1', job_status='Working', phase='Uploading')
+        ingest_job.record_transfer_progress(3, 10)
+        response = self.client.get(reverse('miseq_uploader:run_ingest_job_status', kwargs={'pk': ingest_job.pk}))
+        data = json.loads(response.content)
+        assert data['phase'] == 'Uploading'
+        assert (data['files_transferred'], data['files_total']) == (3, 10)
+
+        ingest_job.finish(job_status='Complete')
+        ingest_job.refresh_from_db()
+        assert (ingest_job.files_transferred, ingest_job.files_total) == (3, 10)
+        assert ingest_job.phase == 'Finished'
+
+    def test_failed_ingest_is_recorded(self):
+        ingest_job = mommy.make(RunIngestJob, miseq_directory='/data/RUN_1')
+        with mock.patch('miseq_portal.miseq_uploader.tasks.receive_miseq_run_dir',
+                        side_effect=FileNotFoundError('SampleSheet.csv')):
+            with self.assertRaises(FileNotFoundError):
+                ingest_miseq_run(ingest_job_id=ingest_job.pk)
+        ingest_job.refresh_from_db()
+        assert ingest_job.job_status == 'Failed'
+        assert 'SampleSheet.csv' in ingest_job.error
+
+    def test_stale_job_does_not_block_resubmission(self):
+        stale_job = mommy.make(RunIngestJob, miseq_directory='/data/RUN_1', job_status='Working', phase='Uploading')
+        modified = timezone.now() - timedelta(seconds=settings.RUN_INGEST_TIME_LIMIT + 60)
+        RunIngestJob.objects.filter(pk=stale_job.pk).update(modified=modified)
+        stale_job.refresh_from_db()
+        assert stale_job.is_stale
+
+        response = self.client.get(reverse('miseq_uploader:run_ingest_job_status', kwargs={'pk': stale_job.pk}))
+        assert json.loads(response.content)['status'] == 'Failed'
+
+        self.client.post(reverse('miseq_uploader:miseq_form'), {'miseq_directory': '/data/RUN_1'})
+        ingest_job = RunIngestJob.objects.exclude(pk=stale_job.pk).get()
+        assert ingest_job.job_status == 'Queued'
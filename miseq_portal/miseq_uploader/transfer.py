@@ -0,0 +1,200 @@
+"""
+Transfer engine used to move reads, InterOp binaries and run files into MEDIA_ROOT during ingest.
+
+- Files are transferred by a bounded pool of worker threads
+- When the source and destination share a filesystem the file is hard linked, otherwise a reflink (copy-on-write
+  clone) is attempted before falling back to a streaming copy
+- A SHA-256 checksum is computed while the file is streamed and written to a <file>.sha256 sidecar
+- Every file is written to a temporary name and renamed into place, so a failed transfer never leaves a partial file
+  at the destination
+- A destination that already has a sidecar and the size of its source is not transferred again, which lets a failed
+  ingest be resumed without copying everything a second time
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger('django')
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# ioctl request number of FICLONE on Linux, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+SIDECAR_SUFFIX = '.sha256'
+
+
+@dataclass
+class TransferJob:
+    src: Path
+    dst: Path
+
+
+@dataclass
+class TransferResult:
+    src: Path
+    dst: Path
+    sha256: str
+    size: int
+    method: str  # hardlink, reflink, copy or resumed
+
+
+def get_sidecar_path(dst: Path) -> Path:
+    return dst.with_name(dst.name + SIDECAR_SUFFIX)
+
+
+def get_tmp_path(path: Path) -> Path:
+    return path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+
+
+def sha256_file(path: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    sha256 = hashlib.sha256()
+    with open(str(path), 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def read_sidecar(dst: Path) -> Optional[str]:
+    """ :return: Checksum recorded in the sidecar of dst (sha256sum format), or None if there is no sidecar """
+    try:
+        with open(str(get_sidecar_path(dst))) as f:
+            return f.read().split()[0]
+    except (FileNotFoundError, IndexError):
+        return None
+
+
+def write_sidecar(dst: Path, checksum: str):
+    sidecar = get_sidecar_path(dst)
+    tmp = get_tmp_path(sidecar)
+    with open(str(tmp), 'w') as f:
+        f.write(f'{checksum}  {dst.name}\n')
+    os.replace(str(tmp), str(sidecar))
+
+
+def same_filesystem(src: Path, dst_dir: Path) -> bool:
+    return src.stat().st_dev == dst_dir.stat().st_dev
+
+
+def try_hardlink(src: Path, tmp: Path) -> bool:
+    try:
+        os.link(str(src), str(tmp))
+        return True
+    except OSError:
+        return False
+
+
+def try_reflink(src: Path, tmp: Path) -> bool:
+    """ Clones src to tmp on filesystems that support it (btrfs, XFS); returns False everywhere else """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(str(src), 'rb') as fsrc, open(str(tmp), 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        if tmp.exists():
+            tmp.unlink()
+        return False
+
+
+def stream_copy(src: Path, tmp: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    """ Copies src to tmp, computing the SHA-256 checksum of the data as it is written """
+    sha256 = hashlib.sha256()
+    with open(str(src), 'rb') as fsrc, open(str(tmp), 'wb') as fdst:
+        for chunk in iter(lambda: fsrc.read(chunk_size), b''):
+            sha256.update(chunk)
+            fdst.write(chunk)
+        fdst.flush()
+        os.fsync(fdst.fileno())
+    return sha256.hexdigest()
+
+
+def transfer_file(src: Path, dst: Path, dir_mode: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> TransferResult:
+    """
+    Transfers a single file to dst, see the module docstring
+    :param src: Path of the file to transfer
+    :param dst: Destination path of the file
+    :param dir_mode: If provided, permissions to set on the destination directory
+    :param chunk_size: Number of bytes read at a time while streaming
+    :return: TransferResult
+    """
+    src, dst = Path(src), Path(dst)
+    size = src.stat().st_size
+
+    os.makedirs(str(dst.parent), exist_ok=True)
+    if dir_mode is not None:
+        os.chmod(str(dst.parent), dir_mode)
+
+    # Resume: the file was fully transferred by a previous ingest of this run
+    checksum = read_sidecar(dst)
+    if checksum is not None and dst.exists() and dst.stat().st_size == size:
+        logger.info(f"{dst} was already transferred, skipping")
+        return TransferResult(src=src, dst=dst, sha256=checksum, size=size, method='resumed')
+
+    tmp = get_tmp_path(dst)
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        if same_filesystem(src, dst.parent) and try_hardlink(src, tmp):
+            method = 'hardlink'
+            checksum = sha256_file(tmp, chunk_size=chunk_size)
+        elif try_reflink(src, tmp):
+            method = 'reflink'
+            checksum = sha256_file(tmp, chunk_size=chunk_size)
+        else:
+            method = 'copy'
+            checksum = stream_copy(src, tmp, chunk_size=chunk_size)
+
+        if tmp.stat().st_size != size:
+            raise IOError(f"Size of {dst} does not match {src} after transfer")
+        os.replace(str(tmp), str(dst))
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+
+    write_sidecar(dst, checksum)
+    logger.info(f"Transferred {src} to {dst} ({method})")
+    return TransferResult(src=src, dst=dst, sha256=checksum, size=size, method=method)
+
+
+def transfer_files(jobs: [TransferJob], max_workers: int = 4, dir_mode: Optional[int] = None,
+                   progress_callback: Callable = None) -> [TransferResult]:
+    """
+    Transfers files concurrently with a bounded pool of worker threads
+    :param jobs: List of TransferJob
+    :param max_workers: Maximum number of files transferred at the same time
+    :param dir_mode: If provided, permissions to set on the destination directories
+    :param progress_callback: Called with (completed, total, TransferResult) as each transfer finishes
+    :return: List of TransferResult in the order of jobs. If any transfer fails, the first error is raised once the
+    other transfers have finished.
+    """
+    if not jobs:
+        return []
+
+    results = [None] * len(jobs)
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = {executor.submit(transfer_file, job.src, job.dst, dir_mode): i for i, job in enumerate(jobs)}
+        completed = 0
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                logger.error(f"Could not transfer {jobs[i].src} to {jobs[i].dst}: {e}")
+                errors.append(e)
+                continue
+            completed += 1
+            if progress_callback is not None:
+                progress_callback(completed, len(jobs), results[i])
+    if errors:
+        raise errors[0]
+    return results
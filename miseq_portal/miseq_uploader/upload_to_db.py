@@ -1,23 +1,44 @@
+import json
 import logging
 import os
-import shutil
 from pathlib import Path
 from typing import Union
 
-from config.settings.base import MEDIA_ROOT
+from django.db import transaction
+
+from config.settings.base import MEDIA_ROOT, INGEST_TRANSFER_WORKERS
 from miseq_portal.analysis.tasks import assemble_sample_instance
+from miseq_portal.miseq_uploader.models import RunIngestJob
+from miseq_portal.miseq_uploader.parse_interop import get_cached_qscore_json
 from miseq_portal.miseq_uploader.parse_miseq_analysis_folder import parse_miseq_folder
 from miseq_portal.miseq_uploader.parse_samplesheet import generate_sample_objects, validate_sample_id, \
     extract_samplesheet_headers
-from miseq_portal.miseq_uploader.parse_stats_json import stats_json_to_df
+from miseq_portal.miseq_uploader.parse_stats_json import read_stats_json
+from miseq_portal.miseq_uploader.transfer import TransferJob, transfer_files
 from miseq_portal.miseq_viewer.models import Project, UserProjectRelationship, Run, RunInterOpData, Sample, \
     SampleLogData, RunSamplesheet, SampleSheetSampleData, \
     upload_run_file, upload_reads, upload_interop_file, upload_interop_dir, SampleDataObject, \
     RunDataObject
+from miseq_portal.miseq_viewer.statistics import refresh_portal_statistics
+from miseq_portal.sample_search.index import index_samples
 from miseq_portal.users.models import User
 
 logger = logging.getLogger('django')
 
+# SampleLogData fields populated from the SampleDataObject attributes of the same name
+SAMPLE_LOG_ATTRIBUTES = [
+    'number_reads',
+    'sample_yield',
+    'r1_qualityscoresum',
+    'r2_qualityscoresum',
+    'r1_trimmedbases',
+    'r2_trimmedbases',
+    'r1_yield',
+    'r2_yield',
+    'r1_yieldq30',
+    'r2_yieldq30'
+]
+
 
 def determine_run_type(sample_object_list: list) -> str:
     sample_types = []
@@ -45,8 +66,16 @@ def check_for_ignore_run_file(miseq_dir: Path) -> bool:
     return ignore_run
 
 
-def receive_miseq_run_dir(miseq_dir: Path):
+def receive_miseq_run_dir(miseq_dir: Path, ingest_job: RunIngestJob = None):
+    """
+    Validates a MiSeq run directory, uploads its run and samples to the database and submits the WGS samples for
+    assembly
+    :param miseq_dir: Path to the MiSeq run directory
+    :param ingest_job: If provided, RunIngestJob that is kept up to date with the phase and transfer progress
+    """
     logger.info(f'CHECKING MISEQ DIRECTORY')
+    if ingest_job is not None:
+        ingest_job.set_phase('Validating')
 
     ignore_run = check_for_ignore_run_file(miseq_dir)
     if ignore_run:
@@ -75,10 +104,22 @@ def receive_miseq_run_dir(miseq_dir: Path):
         if sample_object.sample_type == 'BMH':
             validate_sample_id(sample_object.sample_id)
 
+    progress_callback = None
+    if ingest_job is not None:
+        ingest_job.sample_count = len(sample_object_list)
+        ingest_job.phase = 'Uploading'
+        ingest_job.save(update_fields=['sample_count', 'phase', 'modified'])
+        progress_callback = ingest_job.record_transfer_progress
+
     sample_object_list = upload_to_db(sample_object_list=sample_object_list,
-                                      run_data_object=run_data_object)
+                                      run_data_object=run_data_object,
+                                      progress_callback=progress_callback)
 
     logger.info(f'UPLOAD COMPLETE')
+    if ingest_job is not None:
+        ingest_job.run = sample_object_list[0].run_id if sample_object_list else None
+        ingest_job.phase = 'Assembling'
+        ingest_job.save(update_fields=['run', 'phase', 'modified'])
 
     # Call assembly pipeline on all valid sample objects
     for sample_object in sample_object_list:
@@ -127,70 +168,92 @@ def append_sample_object_stats(json_stats_file: Path, sample_object_list: [Sampl
         'r1_yieldq30': 'R1_YieldQ30',
         'r2_yieldq30': 'R2_YieldQ30',
     }
+    # Parsed once for the whole run
+    sample_stats_dict = read_stats_json(stats_json=json_stats_file)
     for sample_object in sample_object_list:
-        stats_df = stats_json_to_df(stats_json=json_stats_file)
-        if sample_object.sample_id not in list(stats_df['sample_id']):
+        sample_stats = sample_stats_dict.get(sample_object.sample_id)
+        if sample_stats is None:
             logger.info(f'WARNING: Could not find Stats entry for {sample_object.sample_id}')
             for attribute, value in attribute_dict.items():
                 setattr(sample_object, attribute, None)
+            sample_object.lane_stats = None
         else:
             for attribute, value in attribute_dict.items():
-                set_value = int(stats_df[stats_df['sample_id'] == sample_object.sample_id][value])
-                setattr(sample_object, attribute, set_value)
+                setattr(sample_object, attribute, sample_stats[value])
+            sample_object.lane_stats = sample_stats['Lanes']
         sample_object_list_stats.append(sample_object)
     return sample_object_list_stats
 
 
 def upload_run_data(run_instance: Union[Run, RunInterOpData], run_data_object: RunDataObject,
                     run_model_fieldname: str, interop_flag: bool) -> Union[Run, RunInterOpData]:
-    # Check if the attribute exists, quit if it doesn't
-    try:
-        model_attr = getattr(run_data_object, run_model_fieldname)
-    except AttributeError:
-        raise AttributeError(f"Attribute {run_model_fieldname} does not exist.")
+    return upload_run_files(run_instance=run_instance,
+                            run_data_object=run_data_object,
+                            run_model_fieldnames=[run_model_fieldname],
+                            interop_flag=interop_flag)
 
-    if not os.path.isfile(str(model_attr)):
-        logger.info(f"WARNING: Could not find {str(model_attr)}. Skipping.")
-        return run_instance
 
-    # Create destination path for InterOp file
-    if interop_flag:
-        run_file_path = upload_interop_file(run_instance, model_attr.name)
-    else:
-        run_file_path = upload_run_file(run_instance, model_attr.name)
+def upload_run_files(run_instance: Union[Run, RunInterOpData], run_data_object: RunDataObject,
+                     run_model_fieldnames: [str], interop_flag: bool) -> Union[Run, RunInterOpData]:
+    """
+    Transfers the files of a run referenced by run_model_fieldnames concurrently (see miseq_uploader.transfer) and
+    points the corresponding fields of run_instance at them. Files that can't be found are skipped.
+    """
+    jobs = []
+    for run_model_fieldname in run_model_fieldnames:
+        # Check if the attribute exists, quit if it doesn't
+        try:
+            model_attr = getattr(run_data_object, run_model_fieldname)
+        except AttributeError:
+            raise AttributeError(f"Attribute {run_model_fieldname} does not exist.")
+
+        if not os.path.isfile(str(model_attr)):
+            logger.info(f"WARNING: Could not find {str(model_attr)}. Skipping.")
+            continue
 
-    # Create InterOp directory for file if it doesn't already exist
-    run_dir_path = os.path.dirname(MEDIA_ROOT + '/' + run_file_path)
-    os.makedirs(run_dir_path, exist_ok=True)
-    os.chmod(run_dir_path, 0o777)
+        # Create destination path for InterOp file
+        if interop_flag:
+            run_file_path = upload_interop_file(run_instance, model_attr.name)
+        else:
+            run_file_path = upload_run_file(run_instance, model_attr.name)
+        jobs.append(TransferJob(src=Path(model_attr), dst=Path(MEDIA_ROOT) / run_file_path))
 
-    # Transfer the file to the disk
-    shutil.copy(src=str(model_attr), dst=(MEDIA_ROOT + '/' + run_file_path))
+        # Update the run instance
+        setattr(run_instance, run_model_fieldname, run_file_path)
 
-    # Update the run instance
-    setattr(run_instance, run_model_fieldname, run_file_path)
-    logger.info(f"Succesfully uploaded {model_attr.name} to {run_file_path}")
+    # Transfer the files to the disk
+    for result in transfer_files(jobs, max_workers=INGEST_TRANSFER_WORKERS, dir_mode=0o777):
+        logger.info(f"Succesfully uploaded {result.src.name} to {result.dst}")
     return run_instance
 
 
-def db_create_project(sample_object: SampleDataObject):
+def db_create_project(project_id: str, admin_user: User) -> Project:
     # PROJECT
-    project_instance, p_created = Project.objects.get_or_create(project_id=sample_object.project_id,
+    project_instance, p_created = Project.objects.get_or_create(project_id=project_id,
                                                                 defaults={
                                                                     # Default to admin ownership
-                                                                    'project_owner': User.objects.get(
-                                                                        username="admin")
+                                                                    'project_owner': admin_user
                                                                 })
     if p_created:
         # Create admin relationship to project immediately
-        UserProjectRelationship.objects.create(project_id=project_instance,
-                                               user_id=User.objects.get(username="admin"))
+        UserProjectRelationship.objects.create(project_id=project_instance, user_id=admin_user)
         logger.info(f"Created Project '{project_instance}'")
     else:
         logger.info(f"Project '{project_instance}' already exists")
     return project_instance
 
 
+def db_create_projects(sample_object_list: [SampleDataObject], admin_user: User) -> dict:
+    """
+    Retrieves or creates each distinct Project referenced by the BMH and EXT samples of a run once
+    :return: Dictionary of {project_id: Project}
+    """
+    project_ids = {sample_object.project_id for sample_object in sample_object_list
+                   if sample_object.sample_type in ('BMH', 'EXT')}
+    return {project_id: db_create_project(project_id=project_id, admin_user=admin_user)
+            for project_id in sorted(project_ids)}
+
+
 def db_create_run(sample_object: SampleDataObject, run_data_object: RunDataObject):
     run_instance, r_created = Run.objects.get_or_create(run_id=sample_object.run_id,
                                                         defaults={'sample_sheet': '',
@@ -212,12 +275,11 @@ def db_create_run(sample_object: SampleDataObject, run_data_object: RunDataObjec
 
         # Upload XML files + SampleSheet
         xml_field_list = ['runinfoxml', 'runparametersxml', 'sample_sheet']
-        for field in xml_field_list:
-            logger.info(f'Trying to upload: {field}')
-            run_instance = upload_run_data(run_instance=run_instance,
-                                           run_data_object=run_data_object,
-                                           run_model_fieldname=field,
-                                           interop_flag=False)
+        logger.info(f'Trying to upload: {xml_field_list}')
+        run_instance = upload_run_files(run_instance=run_instance,
+                                        run_data_object=run_data_object,
+                                        run_model_fieldnames=xml_field_list,
+                                        interop_flag=False)
         # Save instance
         run_instance.save()
         logger.info(f"Saved {run_instance} to the database")
@@ -253,11 +315,10 @@ def db_create_run_interop(run_instance: Run, run_data_object: RunDataObject):
             'tilemetrics'
         ]
 
-        for field in run_interop_data_field_list:
-            run_interop_instance = upload_run_data(run_instance=run_interop_instance,
-                                                   run_data_object=run_data_object,
-                                                   run_model_fieldname=field,
-                                                   interop_flag=True)
+        run_interop_instance = upload_run_files(run_instance=run_interop_instance,
+                                                run_data_object=run_data_object,
+                                                run_model_fieldnames=run_interop_data_field_list,
+                                                interop_flag=True)
 
         # Save the changes to the run_interop model instance
         run_interop_instance.save()
@@ -266,6 +327,19 @@ def db_create_run_interop(run_instance: Run, run_data_object: RunDataObject):
         return run_interop_instance
 
 
+def db_store_run_qscore_json(run_instance: Run) -> Run:
+    """ Computes the q-score histogram from the uploaded InterOp binaries once and stores it on the Run """
+    run_folder = Path(MEDIA_ROOT) / Path(run_instance.interop_directory_path).parent
+    try:
+        run_instance.qscore_json = get_cached_qscore_json(run_folder)
+    except Exception as e:
+        logger.warning(f"Could not compute the q-score histogram for {run_instance}: {e}")
+        return run_instance
+    run_instance.save(update_fields=['qscore_json'])
+    logger.info(f"Stored the q-score histogram for {run_instance}")
+    return run_instance
+
+
 def db_create_sample(sample_object: SampleDataObject, run_instance: Run, project_instance: Project):
     if project_instance is not None:
         sample_instance, s_created = Sample.objects.get_or_create(sample_id=sample_object.sample_id,
@@ -284,18 +358,7 @@ def db_create_sample(sample_object: SampleDataObject, run_instance: Run, project
             s_created = False
 
     if s_created:
-        logger.info(f"Uploading {sample_object.sample_id}...")
-
-        # Sample data + read handling
-        fwd_read_path = upload_reads(sample_instance, sample_object.fwd_read_path.name)
-        rev_read_path = upload_reads(sample_instance, sample_object.rev_read_path.name)
-        read_dir_path = os.path.dirname(MEDIA_ROOT + '/' + fwd_read_path)
-        os.makedirs(read_dir_path, exist_ok=True)
-        os.chmod(read_dir_path, 0o777)
-        shutil.copy(str(sample_object.fwd_read_path), os.path.dirname(MEDIA_ROOT + '/' + fwd_read_path))
-        shutil.copy(str(sample_object.rev_read_path), os.path.dirname(MEDIA_ROOT + '/' + fwd_read_path))
-        sample_instance.fwd_reads = fwd_read_path
-        sample_instance.rev_reads = rev_read_path
+        transfer_sample_reads(sample_pairs=[(sample_object, sample_instance)])
         sample_instance.sample_name = sample_object.sample_name
         sample_instance.sequencing_type = sample_object.sequencing_type
         sample_instance.save()
@@ -304,46 +367,167 @@ def db_create_sample(sample_object: SampleDataObject, run_instance: Run, project
     return sample_instance
 
 
-def db_create_sample_log(sample_object: SampleDataObject, sample_instance: Sample):
-    # Save sample stats
-    sample_log_instance, sl_created = SampleLogData.objects.get_or_create(sample_id=sample_instance)
-    if sl_created:
-        sample_log_attribute_list = [
-            'number_reads',
-            'sample_yield',
-            'r1_qualityscoresum',
-            'r2_qualityscoresum',
-            'r1_trimmedbases',
-            'r2_trimmedbases',
-            'r1_yield',
-            'r2_yield',
-            'r1_yieldq30',
-            'r2_yieldq30'
-        ]
-        for attribute in sample_log_attribute_list:
-            attribute_value = getattr(sample_object, attribute)
-            setattr(sample_log_instance, attribute, attribute_value)
-        sample_log_instance.save()
-    return sample_log_instance
-
-
-def db_create_samplesheetsampledata(sample_instance: Sample, run_instance: Run):
-    """ Create SampleSheetSampleData instance and populate with relevant data from SampleSheet """
-    samplesheet = run_instance.sample_sheet
-    samplesheetsampledata_instance, samplesheetsampledata_created = SampleSheetSampleData.objects.get_or_create(
-        sample_id=sample_instance)
-    if samplesheetsampledata_created:
-        row = samplesheetsampledata_instance.extract_sample_row_from_samplesheet(
-            samplesheet=(Path(MEDIA_ROOT) / str(samplesheet))
-        )
+def transfer_sample_reads(sample_pairs: [(SampleDataObject, Sample)], progress_callback=None) -> [Sample]:
+    """
+    Transfers the reads of samples to their upload location concurrently (see miseq_uploader.transfer), pointing
+    fwd_reads and rev_reads at them and storing their SHA-256 checksums on the samples
+    :param sample_pairs: List of (SampleDataObject, Sample) tuples
+    :param progress_callback: Passed on to transfer_files()
+    :return: List of the updated Samples
+    """
+    jobs = []
+    for sample_object, sample_instance in sample_pairs:
+        logger.info(f"Uploading {sample_object.sample_id}...")
+        sample_instance.fwd_reads = upload_reads(sample_instance, sample_object.fwd_read_path.name)
+        sample_instance.rev_reads = upload_reads(sample_instance, sample_object.rev_read_path.name)
+        jobs.append(TransferJob(src=Path(sample_object.fwd_read_path),
+                                dst=Path(MEDIA_ROOT) / sample_instance.fwd_reads.name))
+        jobs.append(TransferJob(src=Path(sample_object.rev_read_path),
+                                dst=Path(MEDIA_ROOT) / sample_instance.rev_reads.name))
+
+    results = transfer_files(jobs, max_workers=INGEST_TRANSFER_WORKERS, dir_mode=0o777,
+                             progress_callback=progress_callback)
+
+    # The results are in the order of the jobs: R1 then R2 for each sample
+    for i, (_, sample_instance) in enumerate(sample_pairs):
+        sample_instance.fwd_reads_sha256 = results[2 * i].sha256
+        sample_instance.rev_reads_sha256 = results[2 * i + 1].sha256
+    return [sample_instance for _, sample_instance in sample_pairs]
+
+
+def transfer_new_sample_reads(sample_object_list: [SampleDataObject], progress_callback=None) -> dict:
+    """
+    Transfers the reads of the BMH and EXT samples of a run that are not in the database yet. This is done before the
+    ingest transaction is opened so that it isn't held open for the whole copy; the transfers are atomic and resumed
+    on a re-ingest, so nothing is lost if the transaction later rolls back.
+    :param sample_object_list: Samples of the run
+    :param progress_callback: Passed on to transfer_sample_reads()
+    :return: Dictionary of {sample_id: unsaved Sample holding fwd_reads, rev_reads and their checksums}
+    """
+    sample_ids = [sample_object.sample_id for sample_object in sample_object_list
+                  if sample_object.sample_type in ('BMH', 'EXT')]
+    existing_sample_ids = set(Sample.objects.filter(sample_id__in=sample_ids).values_list('sample_id', flat=True))
+    sample_pairs = []
+    for sample_object in sample_object_list:
+        if sample_object.sample_type not in ('BMH', 'EXT') or sample_object.sample_id in existing_sample_ids:
+            continue
+        # The upload location only depends on the sample and run IDs, so the Run doesn't need to exist yet
+        sample_instance = Sample(sample_id=sample_object.sample_id, run_id=Run(run_id=sample_object.run_id))
+        sample_pairs.append((sample_object, sample_instance))
+    transfer_sample_reads(sample_pairs=sample_pairs, progress_callback=progress_callback)
+    return {sample_instance.sample_id: sample_instance for _, sample_instance in sample_pairs}
+
+
+def db_create_samples(sample_object_list: [SampleDataObject], run_instance: Run,
+                      project_instances: dict, transferred_reads: dict = None) -> ([Sample], [Sample]):
+    """
+    Retrieves the samples of a run that are already in the database with a single query and inserts the rest with a
+    single bulk_create. Note that bulk_create does not send the post_save signal.
+    :param sample_object_list: Samples of the run
+    :param run_instance: Run the samples belong to
+    :param project_instances: Dictionary of {project_id: Project} from db_create_projects()
+    :param transferred_reads: Dictionary returned by transfer_new_sample_reads(). The reads of new samples missing
+    from it are transferred here.
+    :return: Tuple of (Sample for every item of sample_object_list, newly created Samples)
+    """
+    if transferred_reads is None:
+        transferred_reads = {}
+    existing_samples = Sample.objects.in_bulk([sample_object.sample_id for sample_object in sample_object_list],
+                                              field_name='sample_id')
+    sample_instances = []
+    new_samples = []
+    untransferred_pairs = []
+    for sample_object in sample_object_list:
+        project_instance = project_instances.get(sample_object.project_id)
+        if sample_object.sample_type not in ('BMH', 'EXT') or project_instance is None:
+            # Samples without a project get their sample ID from their primary key, so are created one at a time
+            sample_instances.append(db_create_sample(sample_object=sample_object,
+                                                     run_instance=run_instance,
+                                                     project_instance=None))
+            continue
+
+        sample_instance = existing_samples.get(sample_object.sample_id)
+        if sample_instance is not None:
+            logger.info(f"Sample '{sample_instance}' already exists, skipping'")
+        else:
+            sample_instance = Sample(sample_id=sample_object.sample_id,
+                                     run_id=run_instance,
+                                     project_id=project_instance,
+                                     sample_name=sample_object.sample_name,
+                                     sequencing_type=sample_object.sequencing_type)
+            transferred = transferred_reads.get(sample_object.sample_id)
+            if transferred is not None:
+                for field in ('fwd_reads', 'rev_reads', 'fwd_reads_sha256', 'rev_reads_sha256'):
+                    setattr(sample_instance, field, getattr(transferred, field))
+            else:
+                untransferred_pairs.append((sample_object, sample_instance))
+            new_samples.append(sample_instance)
+        sample_instances.append(sample_instance)
+
+    transfer_sample_reads(sample_pairs=untransferred_pairs)
+    Sample.objects.bulk_create(new_samples)
+    logger.info(f"Created {len(new_samples)} new samples for {run_instance}")
+    return sample_instances, new_samples
+
+
+def db_create_sample_logs(sample_object_list: [SampleDataObject], sample_instances: [Sample]) -> [SampleLogData]:
+    """
+    Saves the Stats.json values of every sample that does not have a SampleLogData yet with a single bulk_create
+    :param sample_object_list: Samples of the run
+    :param sample_instances: Sample for every item of sample_object_list, as returned by db_create_samples()
+    :return: Newly created SampleLogData
+    """
+    existing = set(SampleLogData.objects.filter(sample_id__in=[sample.pk for sample in sample_instances])
+                   .values_list('sample_id', flat=True))
+    new_log_data = []
+    for sample_object, sample_instance in zip(sample_object_list, sample_instances):
+        if sample_instance.pk in existing:
+            continue
+        existing.add(sample_instance.pk)
+        sample_log_instance = SampleLogData(sample_id=sample_instance,
+                                            **{attribute: getattr(sample_object, attribute)
+                                               for attribute in SAMPLE_LOG_ATTRIBUTES})
+        if sample_object.lane_stats is not None:
+            sample_log_instance.lane_stats_json = json.dumps(sample_object.lane_stats)
+        new_log_data.append(sample_log_instance)
+    SampleLogData.objects.bulk_create(new_log_data)
+    return new_log_data
+
+
+def db_create_samplesheetsampledata(sample_instances: [Sample], run_instance: Run) -> [SampleSheetSampleData]:
+    """
+    Create SampleSheetSampleData instances and populate with relevant data from SampleSheet. The SampleSheet is read
+    once for the run and the rows are inserted with a single bulk_create.
+    :param sample_instances: Samples of the run
+    :param run_instance: Run the samples belong to
+    :return: Newly created SampleSheetSampleData
+    """
+    existing = set(SampleSheetSampleData.objects.filter(sample_id__in=[sample.pk for sample in sample_instances])
+                   .values_list('sample_id', flat=True))
+    missing_samples = []
+    for sample_instance in sample_instances:
+        if sample_instance.pk in existing:
+            logger.info(f"SampleSheet data for {sample_instance} already exists! Skipping!")
+            continue
+        existing.add(sample_instance.pk)
+        missing_samples.append(sample_instance)
+    if not missing_samples:
+        return []
+
+    df = SampleSheetSampleData.read_samplesheet(samplesheet=Path(MEDIA_ROOT) / str(run_instance.sample_sheet))
+    new_samplesheet_data = []
+    for sample_instance in missing_samples:
+        samplesheetsampledata_instance = SampleSheetSampleData(sample_id=sample_instance)
+        row = samplesheetsampledata_instance.extract_sample_row(df=df)
+        if row is None:
+            logger.warning(f"Could not store SampleSheet data for {sample_instance}")
+            continue
         attr_dict = samplesheetsampledata_instance.samplesheet_row_to_dict(row=row)
         for attribute, value in attr_dict.items():
             setattr(samplesheetsampledata_instance, attribute, value)
-        samplesheetsampledata_instance.save()
-    else:
-        logger.info(f"{samplesheetsampledata_instance} already exists! Skipping!")
-
-    return samplesheetsampledata_instance
+        new_samplesheet_data.append(samplesheetsampledata_instance)
+    SampleSheetSampleData.objects.bulk_create(new_samplesheet_data)
+    return new_samplesheet_data
 
 
 def db_create_runsamplesheet(run_instance: Run) -> RunSamplesheet:
@@ -357,38 +541,56 @@ def db_create_runsamplesheet(run_instance: Run) -> RunSamplesheet:
     return runsamplesheet_instance
 
 
-def upload_to_db(sample_object_list: [SampleDataObject], run_data_object: RunDataObject) -> [SampleDataObject]:
-    """ Takes list of fully populated SampleObjects + path to SampleSheet and uploads to the database """
-    updated_sample_object_list = []
-    for sample_object in sample_object_list:
-        # PROJECT
-        # Accomodate EXT samples -> project_instance is None if the sample is EXT
-        #if sample_object.sample_type == "BMH": # Original
-        if sample_object.sample_type == "BMH" or sample_object.sample_type == "EXT":
-            project_instance = db_create_project(sample_object=sample_object)
-        else:
-            project_instance = None
+def upload_to_db(sample_object_list: [SampleDataObject], run_data_object: RunDataObject,
+                 progress_callback=None) -> [Sample]:
+    """
+    Takes list of fully populated SampleObjects + path to SampleSheet and uploads to the database.
+    The reads of new samples are transferred first (see transfer_new_sample_reads()). The run and project level
+    objects are then resolved once and the samples are written with bulk inserts, in a single transaction so a run
+    is either uploaded completely or not at all.
+    :param progress_callback: Called with (completed, total, TransferResult) as each read file is transferred
+    :return: Sample for every item of sample_object_list
+    """
+    if not sample_object_list:
+        return []
+
+    admin_user = User.objects.get(username="admin")
+
+    # READS - copied before the transaction is opened so it isn't held open for the whole transfer
+    transferred_reads = transfer_new_sample_reads(sample_object_list=sample_object_list,
+                                                  progress_callback=progress_callback)
 
-        # RUN
-        run_instance = db_create_run(sample_object=sample_object, run_data_object=run_data_object)
+    with transaction.atomic():
+        # PROJECTS
+        project_instances = db_create_projects(sample_object_list=sample_object_list, admin_user=admin_user)
+
+        # RUN - every sample in the list comes from the same SampleSheet
+        run_instance = db_create_run(sample_object=sample_object_list[0], run_data_object=run_data_object)
 
         # RUN SAMPLESHEET
-        run_samplesheet_instance = db_create_runsamplesheet(run_instance=run_instance)
+        db_create_runsamplesheet(run_instance=run_instance)
 
         # RUN INTEROP
-        run_interop_instance = db_create_run_interop(run_instance=run_instance, run_data_object=run_data_object)
+        db_create_run_interop(run_instance=run_instance, run_data_object=run_data_object)
+
+        # RUN Q-SCORE HISTOGRAM
+        if run_instance.qscore_json is None:
+            db_store_run_qscore_json(run_instance=run_instance)
 
-        # SAMPLE
-        sample_instance = db_create_sample(sample_object=sample_object,
-                                           run_instance=run_instance,
-                                           project_instance=project_instance)
-        updated_sample_object_list.append(sample_instance)
+        # SAMPLES
+        sample_instances, new_samples = db_create_samples(sample_object_list=sample_object_list,
+                                                          run_instance=run_instance,
+                                                          project_instances=project_instances,
+                                                          transferred_reads=transferred_reads)
 
-        # SAMPLE LOG
-        sample_log_instance = db_create_sample_log(sample_object=sample_object, sample_instance=sample_instance)
+        # SAMPLE LOGS
+        db_create_sample_logs(sample_object_list=sample_object_list, sample_instances=sample_instances)
 
         # SAMPLESHEET SAMPLE DATA
-        samplesheetsampledata_instance = db_create_samplesheetsampledata(sample_instance=sample_instance,
-                                                                         run_instance=run_instance)
+        db_create_samplesheetsampledata(sample_instances=sample_instances, run_instance=run_instance)
+
+        # bulk_create skips the signals that maintain the sample search index and the portal statistics
+        index_samples(Sample.objects.filter(pk__in=[sample.pk for sample in new_samples]))
+        transaction.on_commit(refresh_portal_statistics)
 
-    return updated_sample_object_list
+    return sample_instances
@@ -3,7 +3,9 @@ from django.urls import path
 from miseq_portal.miseq_uploader.views import (
     miseq_form_view,
     miseq_uploader_view,
-    run_submitted_view
+    run_submitted_view,
+    run_ingest_job_view,
+    run_ingest_job_status
 )
 
 app_name = "miseq_uploader"
@@ -14,5 +16,7 @@ urlpatterns = [
     # MiSeq Directory Upload
     path("miseq_directory_uploader", view=miseq_form_view, name="miseq_form"),
     path("run_submitted/", view=run_submitted_view, name="run_submitted"),
+    path("ingest/<int:pk>/", view=run_ingest_job_view, name="run_ingest_job"),
+    path("ingest/<int:pk>/status", view=run_ingest_job_status, name="run_ingest_job_status"),
 
 ]
@@ -1,15 +1,16 @@
 import logging
-from pathlib import Path
 
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import Http404
-from django.shortcuts import render, redirect
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.decorators import method_decorator
-from django.views.generic import View, TemplateView
+from django.views.generic import View, TemplateView, DetailView
 
 from miseq_portal.miseq_uploader.forms import UploadMiSeqDirectoryForm
-from miseq_portal.miseq_uploader.upload_to_db import receive_miseq_run_dir
+from miseq_portal.miseq_uploader.models import RunIngestJob
+from miseq_portal.miseq_uploader.tasks import ingest_miseq_run
 
 # logger = logging.getLogger('raven')
 logger = logging.getLogger('django')
@@ -39,9 +40,6 @@ class MiSeqFormView(LoginRequiredMixin, UserPassesTestMixin, View):
     form_class = UploadMiSeqDirectoryForm
     template_name = 'miseq_uploader/upload_miseq_directory.html'
 
-    # success_url = 'miseq_directory_uploaded/'  # TODO: actually make this page
-    success_url = 'run_submitted/'
-
     # Only staff can access this page
     def test_func(self):
         if self.request.user.is_staff:
@@ -57,12 +55,30 @@ class MiSeqFormView(LoginRequiredMixin, UserPassesTestMixin, View):
         form = self.form_class(request.POST, request.FILES)
 
         if form.is_valid():
-            receive_miseq_run_dir(Path(request.POST['miseq_directory']))
-            return redirect(self.success_url)
+            ingest_job = self.submit_ingest_job(miseq_directory=form.cleaned_data['miseq_directory'])
+            return redirect('miseq_uploader:run_ingest_job', pk=ingest_job.pk)
         else:
             logging.warning("Could not submit form!")
             return render(request, self.template_name, {'form': form})
 
+    def submit_ingest_job(self, miseq_directory: str) -> RunIngestJob:
+        """
+        Queues the ingest of a run directory on the ingest_queue, or returns the job already ingesting it. Stale jobs
+        (see RunIngestJob.is_stale) don't block a new submission.
+        The task is only sent once the RunIngestJob has been committed so the worker can always retrieve it.
+        """
+        miseq_directory = miseq_directory.strip()
+        ingest_job = RunIngestJob.objects.active().filter(miseq_directory=miseq_directory).first()
+        if ingest_job is not None:
+            logger.info(f"{miseq_directory} is already being ingested by RunIngestJob {ingest_job.pk}")
+            return ingest_job
+
+        ingest_job = RunIngestJob.objects.create(miseq_directory=miseq_directory, user=self.request.user)
+        transaction.on_commit(lambda: ingest_miseq_run.apply_async(kwargs={'ingest_job_id': ingest_job.pk},
+                                                                   queue='ingest_queue'))
+        logger.info(f"Submitted {miseq_directory} to ingest queue (RunIngestJob {ingest_job.pk})")
+        return ingest_job
+
 
 miseq_form_view = MiSeqFormView.as_view()
 
@@ -73,3 +89,19 @@ class RunSubmittedView(LoginRequiredMixin, TemplateView):
 
 
 run_submitted_view = RunSubmittedView.as_view()
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class RunIngestJobView(LoginRequiredMixin, DetailView):
+    model = RunIngestJob
+    context_object_name = 'ingest_job'
+    template_name = 'miseq_uploader/run_ingest_job.html'
+
+
+run_ingest_job_view = RunIngestJobView.as_view()
+
+
+@staff_member_required
+def run_ingest_job_status(request, pk: int):
+    ingest_job = get_object_or_404(RunIngestJob, pk=pk)
+    return JsonResponse(ingest_job.as_dict())
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MiseqViewerConfig(AppConfig):
     name = 'miseq_portal.miseq_viewer'
     verbose_name = "MiSeq Viewer"
+
+    def ready(self):
+        import miseq_portal.miseq_viewer.signals  # noqa F401
@@ -1,15 +1,21 @@
+import json
 import logging
 from pathlib import Path
 from typing import Optional
 
 import pandas as pd
 from dataclasses import dataclass
+from django.apps import apps
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 
 from config.settings.base import MEDIA_ROOT
 from miseq_portal.core.models import TimeStampedModel
+from miseq_portal.miseq_uploader.samplesheet import load_samplesheet
+from miseq_portal.miseq_viewer.permissions import filter_by_project_permission
 from miseq_portal.users.models import User
 
 logger = logging.getLogger('django')
@@ -116,6 +122,7 @@ class SampleDataObject:
     r2_yield: int = None
     r1_yieldq30: int = None
     r2_yieldq30: int = None
+    lane_stats: list = None  # Per lane metrics from Stats.json, see parse_stats_json.read_stats_json
 
 
 @dataclass
@@ -153,6 +160,44 @@ class MinIONRunDataObject:
     sample_sheet: Path = None
 
 
+def count_subquery(queryset: models.QuerySet, field: str) -> Coalesce:
+    """
+    Builds a correlated COUNT(*) subquery for use in annotate(). Unlike annotate(Count(...)) across several reverse
+    relations, this does not multiply rows through joins.
+    :param queryset: Queryset of the related model, filtered against OuterRef('pk')
+    :param field: Name of the field on the related model that is correlated with the outer query
+    :return: Expression evaluating to the number of related rows (0 when there are none)
+    """
+    counts = queryset.order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class ProjectQuerySet(models.QuerySet):
+    def with_sample_stats(self):
+        """
+        Annotates every project with the following, computed by the database in a single query:
+        annotated_num_miseq_samples, annotated_num_minion_samples, annotated_num_samples (the sum of both) and
+        annotated_last_updated (see Project.last_updated)
+        """
+        # Imported lazily as minion_viewer.models depends on this module
+        minion_sample_model = apps.get_model('minion_viewer', 'MinIONSample')
+        latest_sample = Sample.objects.filter(project_id=OuterRef('pk')).order_by('-created').values('modified')[:1]
+        return self.annotate(
+            annotated_num_miseq_samples=count_subquery(Sample.objects.filter(project_id=OuterRef('pk')),
+                                                       'project_id'),
+            annotated_num_minion_samples=count_subquery(minion_sample_model.objects.filter(project_id=OuterRef('pk')),
+                                                        'project_id'),
+            annotated_last_updated=Coalesce(Subquery(latest_sample, output_field=models.DateTimeField()),
+                                            'modified'),
+        ).annotate(
+            annotated_num_samples=models.F('annotated_num_miseq_samples') + models.F('annotated_num_minion_samples')
+        )
+
+    def for_user(self, user: User):
+        """ Restricts the queryset to the projects the user has been given access to; staff can see every project """
+        return filter_by_project_permission(self, user, project_field='pk')
+
+
 # Create your models here.
 class Project(TimeStampedModel):
     """
@@ -161,9 +206,14 @@ class Project(TimeStampedModel):
     project_id = models.CharField(max_length=256, unique=True)
     project_owner = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    objects = ProjectQuerySet.as_manager()
+
     # TODO: Consider adding flags for viral, prokaryotic, eukaryotic, metagenomic, mixed sample types
 
     def last_updated(self) -> str:
+        # Use the value annotated by ProjectQuerySet.with_sample_stats() when available
+        if hasattr(self, 'annotated_last_updated'):
+            return self.annotated_last_updated
         try:
             """ Finds the most recently created Sample object belonging to this project """
             samples = Sample.objects.filter(project_id=self.id).order_by('-created')
@@ -174,7 +224,10 @@ class Project(TimeStampedModel):
 
     @property
     def num_samples(self):
-        return len(Sample.objects.filter(project_id=self.pk))
+        # Use the value annotated by ProjectQuerySet.with_sample_stats() when available
+        if hasattr(self, 'annotated_num_miseq_samples'):
+            return self.annotated_num_miseq_samples
+        return Sample.objects.filter(project_id=self.pk).count()
 
     def __str__(self):
         return self.project_id
@@ -209,6 +262,14 @@ class UserProjectRelationship(TimeStampedModel):
         verbose_name_plural = 'User Project Relationships'
 
 
+class RunQuerySet(models.QuerySet):
+    def with_sample_stats(self):
+        """ Annotates every run with annotated_num_samples, computed by the database in the same query """
+        return self.annotate(
+            annotated_num_samples=count_subquery(Sample.objects.filter(run_id=OuterRef('pk')), 'run_id')
+        )
+
+
 class Run(TimeStampedModel):
     """
     Stores information relating to a single sequencing run
@@ -226,6 +287,11 @@ class Run(TimeStampedModel):
     )
     run_type = models.CharField(max_length=3, choices=RUN_TYPES, default="BMH")
 
+    # Q-score histogram computed from the InterOp binaries at ingest (see parse_interop.get_qscore_json)
+    qscore_json = models.TextField(blank=True, null=True)
+
+    objects = RunQuerySet.as_manager()
+
     def get_interop_directory(self) -> Path:
         return Path(self.interop_directory_path)
 
@@ -235,7 +301,10 @@ class Run(TimeStampedModel):
 
     @property
     def num_samples(self) -> int:
-        return len(Sample.objects.filter(run_id=self.pk))
+        # Use the value annotated by RunQuerySet.with_sample_stats() when available
+        if hasattr(self, 'annotated_num_samples'):
+            return self.annotated_num_samples
+        return Sample.objects.filter(run_id=self.pk).count()
 
     def __str__(self):
         return str(self.run_id)
@@ -319,9 +388,26 @@ class MergedSampleComponentGroup(models.Model):
 
     @property
     def get_components(self):
-        components = MergedSampleComponent.objects.filter(group_id=self.pk)
+        components = MergedSampleComponent.objects.filter(group_id=self.pk).select_related('component_id')
         return components
 
+    def get_log_data_totals(self) -> dict:
+        """
+        Sums number_reads and sample_yield over the SampleLogData of every component in a single aggregate query.
+        A total is None if any component is missing the value, or is missing SampleLogData altogether.
+        :return: Dictionary of {'number_reads': int or None, 'sample_yield': int or None}
+        """
+        totals = MergedSampleComponent.objects.filter(group_id=self.pk).aggregate(
+            num_components=Count('pk'),
+            # Count() skips NULL values, including those of components without SampleLogData
+            num_number_reads=Count('component_id__samplelogdata__number_reads'),
+            num_sample_yield=Count('component_id__samplelogdata__sample_yield'),
+            number_reads=Sum('component_id__samplelogdata__number_reads'),
+            sample_yield=Sum('component_id__samplelogdata__sample_yield'),
+        )
+        return {field: totals[field] if totals[f'num_{field}'] == totals['num_components'] else None
+                for field in ('number_reads', 'sample_yield')}
+
     def __str__(self):
         return f"{str(self.pk)} - {self.created.date()} - " + ", ".join(
             [component.component_id.sample_id for component in self.get_components])
@@ -369,6 +455,10 @@ class Sample(TimeStampedModel):
     fwd_reads = models.FileField(upload_to=upload_reads, blank=True, max_length=1000)
     rev_reads = models.FileField(upload_to=upload_reads, blank=True, max_length=1000)
 
+    # SHA-256 checksums of the reads, computed while they are transferred during ingest
+    fwd_reads_sha256 = models.CharField(max_length=64, blank=True)
+    rev_reads_sha256 = models.CharField(max_length=64, blank=True)
+
     hide_flag = models.BooleanField(default=False)  # Activate this to hide the sample from view for regular users
     additional_notes = models.TextField(blank=True)
 
@@ -383,12 +473,28 @@ class Sample(TimeStampedModel):
     def sample_year(self):
         return str(self.created.year)
 
+    def update_merged_log_data(self):
+        """
+        Stores the summed number_reads and sample_yield of the components of a merged (MER) sample in its SampleLogData,
+        so they do not have to be recomputed whenever the sample is displayed
+        :return: SampleLogData of the merged sample
+        """
+        totals = self.component_group.get_log_data_totals()
+        log_data, _ = SampleLogData.objects.update_or_create(sample_id=self, defaults=totals)
+        return log_data
+
     def __str__(self):
         return self.sample_id
 
     class Meta:
         verbose_name = 'Sample'
         verbose_name_plural = 'Samples'
+        # Back the ordering and filtering of the sample tables (see SampleTableViewSet); sample_id is already unique
+        indexes = [
+            models.Index(fields=['sample_name']),
+            models.Index(fields=['created']),
+            models.Index(fields=['hide_flag', 'sample_id']),
+        ]
 
 
 class SampleSheetSampleData(TimeStampedModel):
@@ -421,14 +527,7 @@ class SampleSheetSampleData(TimeStampedModel):
         :param samplesheet: Path to SampleSheet.csv
         :return: pandas df of SampleSheet.csv with head section stripped away
         """
-        counter = 1
-        with open(str(samplesheet)) as f:
-            for line in f:
-                if '[Data]' in line:
-                    break
-                else:
-                    counter += 1
-        df = pd.read_csv(samplesheet, sep=",", index_col=False, skiprows=counter)
+        df = load_samplesheet(samplesheet).get_data()
 
         # Force Sample_Name and Sample_Project into str types
         df['Sample_Name'] = df['Sample_Name'].astype(str)
@@ -444,10 +543,15 @@ class SampleSheetSampleData(TimeStampedModel):
         return df
 
     def extract_sample_row_from_samplesheet(self, samplesheet: Path) -> Optional[pd.DataFrame]:
-        """ Given the [Data] section of a SampleSheet as a DataFrame, will filter to row for sample """
-        # Filter df to only our row of interest
-        df = self.read_samplesheet(samplesheet=samplesheet)
+        """ Reads the [Data] section of a SampleSheet and filters it to the row for this sample """
+        return self.extract_sample_row(df=self.read_samplesheet(samplesheet=samplesheet))
 
+    def extract_sample_row(self, df: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """
+        Given the [Data] section of a SampleSheet as a DataFrame, will filter to row for sample. Lets the SampleSheet of
+        a run be read once for all of its samples.
+        """
+        # Filter df to only our row of interest
         if self.sample_id.sample_type != 'BMH':
             sample_id = self.sample_id.sample_name
         else:
@@ -531,11 +635,20 @@ class SampleLogData(TimeStampedModel):
     r2_yield = models.BigIntegerField(blank=True, null=True)
     r2_yieldq30 = models.BigIntegerField(blank=True, null=True)
 
+    # JSON list of the metrics above for each lane the sample was demultiplexed on
+    lane_stats_json = models.TextField(blank=True, null=True)
+
     @property
     def sample_yield_mbp(self):
         if self.sample_yield is not None:
             return float(self.sample_yield / 1000000)
 
+    @property
+    def lane_stats(self) -> list:
+        if self.lane_stats_json:
+            return json.loads(self.lane_stats_json)
+        return []
+
     def __str__(self):
         return str(self.sample_id)
 
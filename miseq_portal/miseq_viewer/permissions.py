@@ -0,0 +1,77 @@
+"""
+Per-user project permissions. The primary keys of the projects a user has been given access to through
+UserProjectRelationship are cached, so restricting a queryset to them costs no extra query. The cache entry of a user is
+dropped by the receivers in miseq_viewer.signals whenever one of their relationships changes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from miseq_portal.users.models import User
+
+PROJECT_PERMISSION_CACHE_KEY = 'miseq_viewer_permitted_projects_{user_pk}'
+
+
+def get_cache_key(user_pk: int) -> str:
+    return PROJECT_PERMISSION_CACHE_KEY.format(user_pk=user_pk)
+
+
+def get_permitted_project_pks(user: User) -> frozenset:
+    """
+    :param user: User to retrieve the permitted projects for
+    :return: Primary keys of every project the user has a UserProjectRelationship with
+    """
+    # Imported here as miseq_viewer.models depends on this module
+    from miseq_portal.miseq_viewer.models import UserProjectRelationship
+    key = get_cache_key(user.pk)
+    project_pks = cache.get(key)
+    if project_pks is None:
+        project_pks = frozenset(UserProjectRelationship.objects.filter(user_id=user, project_id__isnull=False)
+                                .values_list('project_id', flat=True))
+        cache.set(key, project_pks, timeout=settings.PROJECT_PERMISSION_CACHE_TIMEOUT)
+    return project_pks
+
+
+def invalidate_permitted_project_pks(user_pk: int):
+    """
+    Drops the cached project PKs of a user. The entry is dropped again once the current transaction commits, as a
+    concurrent request could otherwise cache the relationships as they were before the commit.
+    """
+    if user_pk is None:
+        return
+    key = get_cache_key(user_pk)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def filter_by_project_permission(queryset, user: User, project_field: str = 'project_id',
+                                 exclude_hidden: bool = False):
+    """
+    Restricts a queryset of objects that belong to a project to the projects the user has access to. Staff can see
+    every object.
+    :param queryset: Queryset to restrict, e.g. of Sample or MinIONSample
+    :param user: User performing the request
+    :param project_field: Name of the field holding the primary key of the project on the queryset's model
+    :param exclude_hidden: Also leave out objects with hide_flag set for non-staff users
+    :return: The restricted queryset
+    """
+    if user.is_staff:
+        return queryset
+    queryset = queryset.filter(**{f'{project_field}__in': get_permitted_project_pks(user)})
+    if exclude_hidden:
+        queryset = queryset.filter(hide_flag=False)
+    return queryset
+
+
+def get_selected_samples(sample_ids: list, user: User) -> list:
+    """
+    Retrieves the samples picked by a user in a single query, leaving out any the user does not have access to
+    :param sample_ids: Sample IDs (e.g. BMH-2019-000001) in the order they were selected
+    :param user: User who made the selection
+    :return: List of Sample objects in the order of sample_ids
+    """
+    from miseq_portal.miseq_viewer.models import Sample
+    queryset = filter_by_project_permission(Sample.objects.filter(sample_id__in=sample_ids), user,
+                                            exclude_hidden=True)
+    samples = {sample.sample_id: sample for sample in queryset}
+    return [samples[sample_id] for sample_id in sample_ids if sample_id in samples]
@@ -0,0 +1,331 @@
+"""
+QA/QC Excel report for a selection of samples, downloaded from the project and run detail pages.
+
+Samples are fetched in batches of QAQC_REPORT_BATCH_SIZE with every related row the report reads (run, project,
+samplesheet data, assembly data, log data, Mash/SendSketch and ConFindr results) joined in the same query. The workbook
+is written with xlsxwriter's constant_memory mode, which flushes every row to disk as soon as the next one starts, so
+memory use does not grow with the size of the selection.
+"""
+import logging
+import os
+import time
+from pathlib import Path
+
+import xlsxwriter
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+
+from miseq_portal.miseq_viewer.models import Sample
+
+logger = logging.getLogger('django')
+
+# Fields common to all 3 sheets
+COLUMNS = ["sample_id", "sample_name", "project_id", "run_id"]
+# [field, source, type]
+ASSEMBLY_COLUMNS = [["i5_index_id", "samplesheet", "str"], ["i7_index_id", "samplesheet", "str"],
+                    ["index", "samplesheet", "str"], ["index2", "samplesheet", "str"],
+                    ["sample_plate", "samplesheet", "str"], ["sample_well", "samplesheet", "str"],
+                    ["total_length", "assembly", "str"], ["mean_coverage", "assembly", "str"],
+                    ["num_contigs", "assembly", "str"], ["n50", "assembly", "str"],
+                    ["gc_percent", "assembly", "str"], ["largest_contig", "assembly", "str"],
+                    ["num_predicted_genes", "assembly", "str"], ["description", "samplesheet", "str"],
+                    ["top_hit", "mash", "str"], ["fwd_reads", "sample", "path"], ["rev_reads", "sample", "path"],
+                    ["number_reads", "log", "str"], ["sample_yield", "log", "str"],
+                    ["assembly", "assembly", "path"], ["created", "sample", "date"]]
+CONFINDR_COLUMNS = ["contam_status", "percent_contam", "percent_contam_std_dev",
+                    "num_contam_snvs", "genus", "bases_examined"]
+
+DESCRIPTION_INDEX = ASSEMBLY_COLUMNS.index(["description", "samplesheet", "str"])
+
+# Cell formats, referred to by name until the row is written to a workbook
+CELL_FORMATS = {'plain': {}, 'orange': {'bg_color': '#FFB66C'}, 'red': {'bg_color': '#FF3838'}}
+
+# Related rows read by the report, fetched with the samples
+QAQC_RELATED_FIELDS = ('run_id', 'project_id', 'samplesheetsampledata', 'sampleassemblydata', 'samplelogdata',
+                       'mashresult', 'sendsketchresult', 'confindrresultassembly')
+
+
+def parse_sample_id_list(sample_list: str) -> [int]:
+    """
+    :param sample_list: Comma separated Sample primary keys as submitted by the QA/QC forms, e.g. "1,2,3,"
+    :return: List of primary keys in the submitted order
+    """
+    return [int(sample_id) for sample_id in sample_list.split(",") if sample_id.strip()]
+
+
+def iter_qaqc_samples(sample_ids: [int], batch_size: int = None):
+    """
+    Yields the requested samples in the requested order with every related row used by the report already fetched.
+    Primary keys that no longer exist are skipped.
+    :param sample_ids: List of Sample primary keys
+    :param batch_size: Number of samples fetched per query. Defaults to settings.QAQC_REPORT_BATCH_SIZE.
+    """
+    batch_size = batch_size or settings.QAQC_REPORT_BATCH_SIZE
+    for start in range(0, len(sample_ids), batch_size):
+        batch = sample_ids[start:start + batch_size]
+        samples = Sample.objects.filter(pk__in=batch).select_related(*QAQC_RELATED_FIELDS).in_bulk()
+        for sample_id in batch:
+            if sample_id in samples:
+                yield samples[sample_id]
+
+
+def related_or_none(sample: Sample, related_name: str):
+    try:
+        return getattr(sample, related_name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def get_top_hit(sample: Sample):
+    """ Top Mash hit, falling back to the top SendSketch hit """
+    mashresult = related_or_none(sample, 'mashresult')
+    if mashresult is not None:
+        return mashresult.top_hit
+    sendsketchresult = related_or_none(sample, 'sendsketchresult')
+    if sendsketchresult is not None:
+        return sendsketchresult.top_taxName
+    return "NA"
+
+
+def build_qaqc_row(sample: Sample) -> dict:
+    """
+    Builds the report values for a sample, along with the highlighting and comments following the lab's QA/QC
+    guidelines
+    :param sample: Sample fetched by iter_qaqc_samples()
+    :return: Dictionary with the following keys: common (COLUMNS values), assembly (ASSEMBLY_COLUMNS values), confindr
+    (CONFINDR_COLUMNS values), style (CELL_FORMATS name for each ASSEMBLY_COLUMNS + CONFINDR_COLUMNS cell), comment
+    (list of comments)
+    """
+    common = [sample.sample_id, sample.sample_name,
+              sample.project_id.project_id if sample.project_id is not None else "NA",
+              sample.run_id.run_id if sample.run_id is not None else "NA"]
+    towrite = ["NA"] * len(ASSEMBLY_COLUMNS)
+    style = ['plain'] * (len(ASSEMBLY_COLUMNS) + len(CONFINDR_COLUMNS))
+    comment = []
+
+    samplesheet_object = related_or_none(sample, 'samplesheetsampledata')
+    assembly_object = related_or_none(sample, 'sampleassemblydata')
+    samplelogdata = related_or_none(sample, 'samplelogdata')
+    mashresult = get_top_hit(sample)
+
+    for colnum, column in enumerate(ASSEMBLY_COLUMNS):
+        if column[1] == "sample":
+            towrite[colnum] = getattr(sample, column[0])
+        elif column[1] == "samplesheet" and samplesheet_object is not None:
+            towrite[colnum] = getattr(samplesheet_object, column[0])
+        elif column[1] == "assembly" and assembly_object is not None:
+            towrite[colnum] = getattr(assembly_object, column[0])
+            # Kelly wants to get rid of the X at the end of the mean_coverage
+            if towrite[colnum]:
+                if column[0] == "mean_coverage":
+                    towrite[colnum] = float(towrite[colnum][:-1].replace(",", ""))
+                    if towrite[colnum] < 30:
+                        comment.append("caution: <30x coverage")
+                        style[colnum] = 'orange'
+                    else:
+                        comment.append("min 30x coverage")
+                elif column[0] == "num_contigs":
+                    if towrite[colnum] > 500:
+                        comment.append("caution: >500 contigs")
+                        style[colnum] = 'red'
+                    elif towrite[colnum] >= 200:
+                        comment.append("caution: 200-500 contigs")
+                        style[colnum] = 'orange'
+                    else:
+                        comment.append("<200 contigs")
+        elif column[1] == "log" and samplelogdata is not None:
+            towrite[colnum] = getattr(samplelogdata, column[0])
+        elif column[1] == "mash":
+            towrite[colnum] = mashresult
+            if towrite[DESCRIPTION_INDEX].startswith("WGS_"):
+                if mashresult == "NA" or not mashresult:
+                    comment.append("genus ND")
+                    style[colnum] = 'orange'
+                else:
+                    sampledesclist = towrite[DESCRIPTION_INDEX].lower().split("_")
+                    mashlist = mashresult.lower().split(" ")
+                    if mashlist[0] != sampledesclist[1]:
+                        comment.append("genus conflict")
+                        style[colnum] = 'red'
+                    else:
+                        comment.append("genus match")
+                        if len(sampledesclist) >= 3:
+                            if len(mashlist) < 2:
+                                comment.append("species ND")
+                                style[colnum] = 'orange'
+                            elif mashlist[1] != sampledesclist[2]:
+                                if mashlist[1] == "sp.":
+                                    comment.append("species ND")
+                                    style[colnum] = 'orange'
+                                else:
+                                    comment.append("species conflict")
+                                    style[colnum] = 'red'
+                            else:
+                                comment.append("species match")
+                                if len(sampledesclist) >= 4:
+                                    if len(mashlist) < 3:
+                                        comment.append("subtype/serovar ND")
+                                        style[colnum] = 'orange'
+                                    elif sampledesclist[3] in mashlist[2:]:
+                                        comment.append("subtype/serovar match")
+                                    else:
+                                        comment.append("subtype/serovar conflict")
+                                        style[colnum] = 'red'
+        else:
+            towrite[colnum] = "Something went wrong"
+        if towrite[colnum] != "NA":
+            if column[2] == "path":
+                try:
+                    towrite[colnum] = towrite[colnum].path
+                except Exception:
+                    towrite[colnum] = "NA"
+            elif column[2] == "date":
+                try:
+                    towrite[colnum] = towrite[colnum].strftime('%Y-%m-%d')
+                except Exception:
+                    towrite[colnum] = "NA"
+
+    # ConFindr fields
+    confindr = ["NA"] * len(CONFINDR_COLUMNS)
+    confindr_object = related_or_none(sample, 'confindrresultassembly')
+    if confindr_object is not None:
+        for colnum, column in enumerate(CONFINDR_COLUMNS):
+            confindr[colnum] = getattr(confindr_object, column)
+            if confindr[colnum] != confindr[colnum]:  # this is a check for NaN
+                confindr[colnum] = "ND"
+
+    genus = confindr[CONFINDR_COLUMNS.index('genus')]
+    num_contam_snvs = confindr[CONFINDR_COLUMNS.index('num_contam_snvs')]
+    percent_contam = confindr[CONFINDR_COLUMNS.index('percent_contam')]
+    snvs_style = CONFINDR_COLUMNS.index('num_contam_snvs') + len(ASSEMBLY_COLUMNS)
+    if ":" in genus:
+        comment.append("gross contamination: multiple organisms")
+        style[CONFINDR_COLUMNS.index('genus') + len(ASSEMBLY_COLUMNS)] = 'red'
+    elif isinstance(num_contam_snvs, int) and not isinstance(percent_contam, str):
+        if percent_contam == 0 and num_contam_snvs < 20:
+            comment.append("no contamination detected")
+        elif percent_contam >= 15:
+            comment.append("contamination suspected: >=15%")
+            style[snvs_style] = 'red'
+            style[CONFINDR_COLUMNS.index('percent_contam') + len(ASSEMBLY_COLUMNS)] = 'red'
+        elif num_contam_snvs < 20:
+            comment.append("possible low level contamination or unresolved repeats")
+        else:
+            comment.append("possible contamination: >= 20 SNVs")
+            style[snvs_style] = 'orange'
+
+    return {'common': common, 'assembly': towrite, 'confindr': confindr, 'style': style, 'comment': comment}
+
+
+def write_qaqc_report(sample_ids: [int], output_path: Path) -> Path:
+    """
+    Writes the QA/QC report for a selection of samples
+    :param sample_ids: List of Sample primary keys, in the order they should appear in the report
+    :param output_path: Path of the .xlsx file to write
+    :return: output_path
+    """
+    workbook = xlsxwriter.Workbook(str(output_path), {'constant_memory': True})
+    assemblysheet = workbook.add_worksheet("Portal Report")
+    confindrsheet = workbook.add_worksheet("Confindr Report")
+    combinedsheet = workbook.add_worksheet("Combined")
+    formats = {name: workbook.add_format(properties) for name, properties in CELL_FORMATS.items()}
+
+    # Write headers
+    for sheet in (assemblysheet, confindrsheet, combinedsheet):
+        sheet.write_row(0, 0, COLUMNS)
+    for sheet in (assemblysheet, combinedsheet):
+        sheet.write_row(0, len(COLUMNS), [column[0] for column in ASSEMBLY_COLUMNS])
+    confindrsheet.write_row(0, len(COLUMNS), CONFINDR_COLUMNS)
+    combinedsheet.write_row(0, len(COLUMNS) + len(ASSEMBLY_COLUMNS), CONFINDR_COLUMNS)
+    combinedsheet.write(0, len(COLUMNS) + len(ASSEMBLY_COLUMNS) + len(CONFINDR_COLUMNS), "comments")
+
+    for rowcount, sample in enumerate(iter_qaqc_samples(sample_ids), start=1):
+        row = build_qaqc_row(sample)
+        style = row['style']
+        if 'red' in style:
+            commentcolour = formats['red']
+        elif 'orange' in style:
+            commentcolour = formats['orange']
+        else:
+            commentcolour = formats['plain']
+
+        for sheet in (assemblysheet, confindrsheet, combinedsheet):
+            sheet.write_row(rowcount, 0, row['common'])
+        # The sample ID in the combined sheet is highlighted with the worst colour of the row
+        combinedsheet.write(rowcount, 0, row['common'][0], commentcolour)
+
+        for colnum, value in enumerate(row['assembly']):
+            assemblysheet.write(rowcount, colnum + len(COLUMNS), value)
+            combinedsheet.write(rowcount, colnum + len(COLUMNS), value, formats[style[colnum]])
+        for colnum, value in enumerate(row['confindr']):
+            confindrsheet.write(rowcount, colnum + len(COLUMNS), value)
+            combinedsheet.write(rowcount, colnum + len(COLUMNS) + len(ASSEMBLY_COLUMNS), value,
+                                formats[style[colnum + len(ASSEMBLY_COLUMNS)]])
+        combinedsheet.write(rowcount, len(CONFINDR_COLUMNS) + len(ASSEMBLY_COLUMNS) + len(COLUMNS),
+                            "; ".join(row['comment']), commentcolour)
+
+    workbook.close()
+    return output_path
+
+
+def get_qaqc_report_dir(user_id: int) -> Path:
+    """ Directory holding the reports built in the background for a user """
+    return Path(settings.MEDIA_ROOT) / 'reports' / 'qaqc' / str(user_id)
+
+
+def register_qaqc_report(user_id: int, token: str) -> Path:
+    """
+    Records that a report was requested by writing a <token>.requested marker; its modification time is the request
+    time used by get_qaqc_report_status() to give up on reports that never arrive
+    :return: Path to the marker
+    """
+    report_dir = get_qaqc_report_dir(user_id)
+    report_dir.mkdir(parents=True, exist_ok=True)
+    requested_path = report_dir / f"{token}.requested"
+    requested_path.touch()
+    return requested_path
+
+
+def get_qaqc_report_status(user_id: int, token: str) -> str:
+    """
+    A report that was never registered, or that is still missing QAQC_REPORT_TIMEOUT seconds after it was requested
+    (e.g. because the worker building it died), is reported as failed.
+    :param user_id: Primary key of the User that requested the report
+    :param token: Token identifying the report, see build_qaqc_report()
+    :return: 'Complete', 'Failed' or 'Working'
+    """
+    report_dir = get_qaqc_report_dir(user_id)
+    if (report_dir / f"{token}.xlsx").exists():
+        return 'Complete'
+    if (report_dir / f"{token}.failed").exists():
+        return 'Failed'
+    try:
+        requested = (report_dir / f"{token}.requested").stat().st_mtime
+    except FileNotFoundError:
+        return 'Failed'
+    if time.time() - requested > settings.QAQC_REPORT_TIMEOUT:
+        logger.warning(f"QA/QC report {token} was not built within {settings.QAQC_REPORT_TIMEOUT} seconds")
+        return 'Failed'
+    return 'Working'
+
+
+def write_qaqc_report_atomic(sample_ids: [int], user_id: int, token: str) -> Path:
+    """
+    Writes a report to the directory of the user under a temporary name and renames it once it is complete, so a
+    partially written report is never served. A failure is recorded in a <token>.failed marker file.
+    :return: Path to the finished report
+    """
+    report_dir = get_qaqc_report_dir(user_id)
+    report_dir.mkdir(parents=True, exist_ok=True)
+    report_path = report_dir / f"{token}.xlsx"
+    tmp_path = report_dir / f".{token}.{os.getpid()}.xlsx.tmp"
+    try:
+        write_qaqc_report(sample_ids, tmp_path)
+        os.replace(str(tmp_path), str(report_path))
+    except Exception:
+        logger.exception(f"Could not build QA/QC report {token}")
+        (report_dir / f"{token}.failed").touch()
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+    return report_path
@@ -27,6 +27,8 @@ class RunSerializer(serializers.ModelSerializer):
 
 class ProjectSerializer(serializers.ModelSerializer):
     project_owner = UserSerializer()
+    num_samples = serializers.ReadOnlyField()
+    last_updated = serializers.ReadOnlyField()
 
     class Meta:
         model = Project
@@ -62,3 +64,37 @@ class SampleSerializer(serializers.ModelSerializer):
         fields = ['id', 'sample_id', 'sample_name', 'project_id', 'run_id',
                   'sample_type', 'fwd_reads', 'rev_reads', 'sendsketchresult', 'mashresult', 'confindrresultassembly'
                   ]
+
+
+class SparseFieldsMixin:
+    """
+    Restricts the serialized fields to those named in the comma-separated ?fields= query parameter,
+    e.g. /api/sample_table/?fields=id,sample_id
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        requested = request.query_params.get('fields')
+        if requested:
+            requested = {field.strip() for field in requested.split(',')}
+            for field_name in set(self.fields) - requested:
+                self.fields.pop(field_name)
+
+
+class SampleTableSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Flat representation of a Sample for the datatables sample pickers. Related values are read from the objects
+    fetched by select_related() in SampleTableViewSet, and their sources double as ORM lookups for server-side
+    ordering and filtering.
+    """
+    project_id = serializers.CharField(source='project_id.project_id', read_only=True, allow_null=True)
+    run_id = serializers.CharField(source='run_id.run_id', read_only=True, allow_null=True)
+    top_hit = serializers.CharField(source='mashresult.top_hit', read_only=True, allow_null=True)
+
+    class Meta:
+        model = Sample
+        fields = ['id', 'sample_id', 'sample_name', 'sample_type', 'sequencing_type', 'project_id', 'run_id',
+                  'top_hit', 'created']
@@ -0,0 +1,111 @@
+"""
+Keeps the cached portal statistics (see miseq_viewer.statistics) up to date as Projects, Runs and Samples are created,
+changed and deleted, and drops the cached project permissions of a user (see miseq_viewer.permissions) when their
+UserProjectRelationships change. Connected in MiseqViewerConfig.ready().
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from miseq_portal.miseq_viewer.models import Project, Run, Sample, UserProjectRelationship
+from miseq_portal.miseq_viewer.permissions import invalidate_permitted_project_pks
+from miseq_portal.miseq_viewer.statistics import schedule_statistics_delta, keys_delta, sample_statistics_keys, \
+    minion_sample_statistics_keys, run_statistics_keys
+
+
+def tracked_fields_changed(update_fields, tracked_fields: tuple) -> bool:
+    return update_fields is None or bool(set(update_fields) & set(tracked_fields))
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, created, **kwargs):
+    if created:
+        schedule_statistics_delta({'number_of_projects': 1})
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    schedule_statistics_delta({'number_of_projects': -1})
+
+
+@receiver(pre_save, sender=Run)
+def run_pre_save(sender, instance, update_fields=None, **kwargs):
+    # Remember the stored run_type so a change of type can be moved between categories in post_save
+    instance._statistics_previous_keys = None
+    if instance.pk is not None and not instance._state.adding and tracked_fields_changed(update_fields, ('run_type',)):
+        previous = Run.objects.filter(pk=instance.pk).values_list('run_type', flat=True).first()
+        if previous is not None:
+            instance._statistics_previous_keys = run_statistics_keys(previous)
+
+
+@receiver(post_save, sender=Run)
+def run_saved(sender, instance, created, **kwargs):
+    keys = run_statistics_keys(instance.run_type)
+    if created:
+        schedule_statistics_delta(keys_delta(added=keys))
+    elif getattr(instance, '_statistics_previous_keys', None) is not None:
+        schedule_statistics_delta(keys_delta(added=keys, removed=instance._statistics_previous_keys))
+
+
+@receiver(post_delete, sender=Run)
+def run_deleted(sender, instance, **kwargs):
+    schedule_statistics_delta(keys_delta(removed=run_statistics_keys(instance.run_type)))
+
+
+@receiver(pre_save, sender=Sample)
+def sample_pre_save(sender, instance, update_fields=None, **kwargs):
+    # Remember the stored sample_type/sequencing_type so a change can be moved between categories in post_save
+    instance._statistics_previous_keys = None
+    if instance.pk is not None and not instance._state.adding and \
+            tracked_fields_changed(update_fields, ('sample_type', 'sequencing_type')):
+        previous = Sample.objects.filter(pk=instance.pk).values('sample_type', 'sequencing_type', 'created').first()
+        if previous is not None:
+            instance._statistics_previous_keys = sample_statistics_keys(**previous)
+
+
+@receiver(post_save, sender=Sample)
+def sample_saved(sender, instance, created, **kwargs):
+    keys = sample_statistics_keys(instance.sample_type, instance.sequencing_type, instance.created)
+    if created:
+        schedule_statistics_delta(keys_delta(added=keys))
+    elif getattr(instance, '_statistics_previous_keys', None) is not None:
+        schedule_statistics_delta(keys_delta(added=keys, removed=instance._statistics_previous_keys))
+
+
+@receiver(post_delete, sender=Sample)
+def sample_deleted(sender, instance, **kwargs):
+    schedule_statistics_delta(keys_delta(removed=sample_statistics_keys(instance.sample_type,
+                                                                        instance.sequencing_type,
+                                                                        instance.created)))
+
+
+@receiver(post_save, sender='minion_viewer.MinIONSample')
+def minion_sample_saved(sender, instance, created, **kwargs):
+    if created:
+        schedule_statistics_delta(keys_delta(added=minion_sample_statistics_keys(instance.created)))
+
+
+@receiver(post_delete, sender='minion_viewer.MinIONSample')
+def minion_sample_deleted(sender, instance, **kwargs):
+    schedule_statistics_delta(keys_delta(removed=minion_sample_statistics_keys(instance.created)))
+
+
+@receiver(pre_save, sender=UserProjectRelationship)
+def user_project_relationship_pre_save(sender, instance, **kwargs):
+    # Remember the stored user so moving a relationship to another user invalidates both of them
+    instance._permission_previous_user_pk = None
+    if instance.pk is not None and not instance._state.adding:
+        instance._permission_previous_user_pk = UserProjectRelationship.objects.filter(
+            pk=instance.pk).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=UserProjectRelationship)
+def user_project_relationship_saved(sender, instance, **kwargs):
+    invalidate_permitted_project_pks(instance.user_id_id)
+    previous_user_pk = getattr(instance, '_permission_previous_user_pk', None)
+    if previous_user_pk != instance.user_id_id:
+        invalidate_permitted_project_pks(previous_user_pk)
+
+
+@receiver(post_delete, sender=UserProjectRelationship)
+def user_project_relationship_deleted(sender, instance, **kwargs):
+    invalidate_permitted_project_pks(instance.user_id_id)
@@ -0,0 +1,162 @@
+"""
+Portal-wide statistics shown on the landing page, served from the Django cache.
+
+The statistics are computed with a handful of aggregate queries the first time they are requested and whenever the
+cached copy expires (PORTAL_STATISTICS_TIMEOUT). In between, the receivers in miseq_viewer.signals apply the change
+caused by every created or deleted Project, Run and Sample to the cached copy, so reading them costs no database work.
+
+Code that writes rows without sending signals (bulk_create, QuerySet.update) must call refresh_portal_statistics()
+once it is done.
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+
+from miseq_portal.miseq_viewer.models import Project, Run, Sample
+
+logger = logging.getLogger('django')
+
+PORTAL_STATISTICS_CACHE_KEY = 'miseq_viewer:portal_statistics'
+
+# Statistics broken down by category; the values are dictionaries of {category: count}
+BREAKDOWN_STATISTICS = ('samples_per_year', 'samples_per_sample_type', 'samples_per_sequencing_type',
+                        'runs_per_run_type')
+
+
+def count_by(queryset, field: str) -> dict:
+    """
+    :param queryset: QuerySet to count
+    :param field: Field or annotation to group the rows by
+    :return: Dictionary of {str(value): number of rows}
+    """
+    rows = queryset.order_by().values(field).annotate(count=Count('pk')).values_list(field, 'count')
+    return {str(value): count for value, count in rows}
+
+
+def merge_counts(*counts: dict) -> dict:
+    merged = {}
+    for count_dict in counts:
+        for key, value in count_dict.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def compute_portal_statistics() -> dict:
+    """
+    Computes the portal statistics from scratch
+    :return: Dictionary of statistics; see BREAKDOWN_STATISTICS for the keys that hold dictionaries
+    """
+    minion_sample_model = apps.get_model('minion_viewer', 'MinIONSample')
+    number_of_miseq_samples = Sample.objects.count()
+    number_of_minion_samples = minion_sample_model.objects.count()
+    return {
+        'number_of_projects': Project.objects.count(),
+        'number_of_runs': Run.objects.count(),
+        'number_of_samples': number_of_miseq_samples + number_of_minion_samples,
+        'number_of_miseq_samples': number_of_miseq_samples,
+        'number_of_minion_samples': number_of_minion_samples,
+        'samples_per_year': merge_counts(
+            count_by(Sample.objects.annotate(year=ExtractYear('created')), 'year'),
+            count_by(minion_sample_model.objects.annotate(year=ExtractYear('created')), 'year')
+        ),
+        'samples_per_sample_type': count_by(Sample.objects.all(), 'sample_type'),
+        'samples_per_sequencing_type': count_by(Sample.objects.all(), 'sequencing_type'),
+        'runs_per_run_type': count_by(Run.objects.all(), 'run_type'),
+        'computed_at': time.time(),
+    }
+
+
+def get_portal_statistics() -> dict:
+    """ Returns the cached portal statistics, computing and caching them if necessary """
+    statistics = cache.get(PORTAL_STATISTICS_CACHE_KEY)
+    if statistics is None:
+        statistics = compute_portal_statistics()
+        cache.set(PORTAL_STATISTICS_CACHE_KEY, statistics, settings.PORTAL_STATISTICS_TIMEOUT)
+    return statistics
+
+
+def refresh_portal_statistics():
+    """ Recomputes the cached portal statistics, e.g. after a bulk ingest that bypassed the model signals """
+    statistics = compute_portal_statistics()
+    cache.set(PORTAL_STATISTICS_CACHE_KEY, statistics, settings.PORTAL_STATISTICS_TIMEOUT)
+    return statistics
+
+
+def invalidate_portal_statistics():
+    """ Discards the cached portal statistics; they are recomputed the next time they are requested """
+    cache.delete(PORTAL_STATISTICS_CACHE_KEY)
+
+
+def apply_statistics_delta(deltas: dict):
+    """
+    Applies changes to the cached portal statistics. Nothing is done if the statistics are not cached, since they will
+    be computed from the database on the next request anyway. The expiry time of the cached copy is left unchanged so
+    that any drift (e.g. from two workers updating the statistics at the same moment) is corrected when it expires.
+    :param deltas: Dictionary of {statistic or (statistic, category): change in count}
+    """
+    statistics = cache.get(PORTAL_STATISTICS_CACHE_KEY)
+    if statistics is None:
+        return
+    for key, delta in deltas.items():
+        if isinstance(key, tuple):
+            statistic, category = key
+            counts = statistics[statistic]
+            counts[category] = counts.get(category, 0) + delta
+            if counts[category] <= 0:
+                del counts[category]
+        else:
+            statistics[key] += delta
+    remaining = settings.PORTAL_STATISTICS_TIMEOUT - (time.time() - statistics['computed_at'])
+    if remaining <= 0:
+        cache.delete(PORTAL_STATISTICS_CACHE_KEY)
+    else:
+        cache.set(PORTAL_STATISTICS_CACHE_KEY, statistics, remaining)
+
+
+def schedule_statistics_delta(deltas: dict):
+    """ Applies deltas once the current transaction commits, so rolled back changes are never counted """
+    if deltas:
+        transaction.on_commit(lambda: apply_statistics_delta(deltas))
+
+
+def sample_statistics_keys(sample_type: str, sequencing_type: str, created) -> list:
+    """ :return: Keys of the statistics a MiSeq Sample with these values is counted in """
+    keys = ['number_of_samples', 'number_of_miseq_samples',
+            ('samples_per_sample_type', str(sample_type)),
+            ('samples_per_sequencing_type', str(sequencing_type))]
+    if created is not None:
+        keys.append(('samples_per_year', str(created.year)))
+    return keys
+
+
+def minion_sample_statistics_keys(created) -> list:
+    """ :return: Keys of the statistics a MinIONSample created at this time is counted in """
+    keys = ['number_of_samples', 'number_of_minion_samples']
+    if created is not None:
+        keys.append(('samples_per_year', str(created.year)))
+    return keys
+
+
+def run_statistics_keys(run_type: str) -> list:
+    """ :return: Keys of the statistics a Run of this type is counted in """
+    return ['number_of_runs', ('runs_per_run_type', str(run_type))]
+
+
+def keys_delta(added: list = None, removed: list = None) -> dict:
+    """
+    :param added: Statistic keys to increment
+    :param removed: Statistic keys to decrement
+    :return: Dictionary of {key: change in count} without the keys that cancel out
+    """
+    deltas = {}
+    for key in added or []:
+        deltas[key] = deltas.get(key, 0) + 1
+    for key in removed or []:
+        deltas[key] = deltas.get(key, 0) - 1
+    return {key: delta for key, delta in deltas.items() if delta != 0}
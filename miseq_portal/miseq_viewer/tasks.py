@@ -0,0 +1,21 @@
+import logging
+
+from celery import shared_task
+
+from miseq_portal.miseq_viewer.qaqc_report import write_qaqc_report_atomic
+
+logger = logging.getLogger('django')
+
+
+@shared_task(serializer='json')
+def build_qaqc_report(sample_ids: [int], user_id: int, token: str):
+    """
+    Builds the QA/QC report for a large selection of samples in the background. The report is written to
+    MEDIA_ROOT/reports/qaqc/<user_id>/<token>.xlsx, where it is picked up by the qaqc_report views.
+    :param sample_ids: List of Sample primary keys
+    :param user_id: Primary key of the User that requested the report
+    :param token: Unique token identifying the report
+    """
+    report_path = write_qaqc_report_atomic(sample_ids=sample_ids, user_id=user_id, token=token)
+    logger.info(f"Built QA/QC report for {len(sample_ids)} samples: {report_path}")
+    return str(report_path)
@@ -119,6 +119,26 @@ class ProjectTest(TestCase):
         assert isinstance(proj, Project)
         assert proj.__str__() == proj.project_id
 
+    @staticmethod
+    def test_project_with_sample_stats():
+        proj = mommy.make(Project)
+        empty_proj = mommy.make(Project)
+        mommy.make(Sample, project_id=proj, _quantity=3)
+        projects = {p.pk: p for p in Project.objects.with_sample_stats()}
+        assert projects[proj.pk].annotated_num_samples == 3
+        assert projects[proj.pk].annotated_num_minion_samples == 0
+        assert projects[proj.pk].annotated_last_updated == proj.last_updated()
+        assert projects[empty_proj.pk].annotated_num_samples == 0
+        assert projects[empty_proj.pk].annotated_last_updated == empty_proj.modified
+
+    @staticmethod
+    def test_project_for_user():
+        user = mommy.make(User, is_staff=False)
+        proj = mommy.make(Project)
+        mommy.make(Project)
+        mommy.make(UserProjectRelationship, project_id=proj, user_id=user)
+        assert list(Project.objects.for_user(user)) == [proj]
+
 
 class UserProjectRelationshipTest(TestCase):
     @staticmethod
@@ -142,6 +162,12 @@ class RunTest(TestCase):
         assert type(self.run.get_interop_directory()) is PosixPath
         assert str(self.run.get_interop_directory()) == self.test_path
 
+    def test_run_with_sample_stats(self):
+        mommy.make(Sample, run_id=self.run, _quantity=2)
+        run = Run.objects.with_sample_stats().get(pk=self.run.pk)
+        assert run.annotated_num_samples == 2
+        assert run.num_samples == self.run.num_samples == 2
+
 
 class RunInterOpDataTest(TestCase):
     @staticmethod
@@ -183,6 +209,26 @@ class SampleTest(TestCase):
                f'{self.mer_sample.sample_type}-{self.mer_sample.sample_year}-{self.mer_sample.pk:06}'
 
 
+class MergedSampleLogDataTest(TestCase):
+    def setUp(self):
+        self.group = mommy.make(MergedSampleComponentGroup)
+        for number_reads, sample_yield in ((100, 1000000), (50, None)):
+            component = mommy.make(Sample)
+            mommy.make(SampleLogData, sample_id=component, number_reads=number_reads, sample_yield=sample_yield)
+            mommy.make(MergedSampleComponent, component_id=component, group_id=self.group)
+
+    def test_get_log_data_totals(self):
+        assert self.group.get_log_data_totals() == {'number_reads': 150, 'sample_yield': None}
+        # A component without SampleLogData makes both totals unknown
+        mommy.make(MergedSampleComponent, component_id=mommy.make(Sample), group_id=self.group)
+        assert self.group.get_log_data_totals() == {'number_reads': None, 'sample_yield': None}
+
+    def test_update_merged_log_data(self):
+        merged_sample = mommy.make(Sample, sample_type='MER', component_group=self.group)
+        merged_sample.update_merged_log_data()
+        assert SampleLogData.objects.get(sample_id=merged_sample).number_reads == 150
+
+
 class MergedSampleComponentTest(TestCase):
     @staticmethod
     def test_merged_sample_component_creation():
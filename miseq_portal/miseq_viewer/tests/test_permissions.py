@@ -0,0 +1,39 @@
+from django.core.cache import cache
+from django.test import TestCase
+from model_mommy import mommy
+
+from miseq_portal.miseq_viewer.models import Project, Sample, UserProjectRelationship
+from miseq_portal.miseq_viewer.permissions import get_permitted_project_pks, filter_by_project_permission, \
+    get_selected_samples
+from miseq_portal.users.models import User
+
+
+class ProjectPermissionTest(TestCase):
+    def setUp(self):
+        self.user = mommy.make(User, is_staff=False)
+        self.project = mommy.make(Project)
+        self.other_project = mommy.make(Project)
+        self.relationship = mommy.make(UserProjectRelationship, project_id=self.project, user_id=self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_permitted_projects_are_cached(self):
+        assert get_permitted_project_pks(self.user) == {self.project.pk}
+        with self.assertNumQueries(1):
+            assert list(Project.objects.for_user(self.user)) == [self.project]
+
+    def test_relationship_changes_invalidate_cache(self):
+        assert get_permitted_project_pks(self.user) == {self.project.pk}
+        mommy.make(UserProjectRelationship, project_id=self.other_project, user_id=self.user)
+        assert get_permitted_project_pks(self.user) == {self.project.pk, self.other_project.pk}
+        self.relationship.delete()
+        assert get_permitted_project_pks(self.user) == {self.other_project.pk}
+
+    def test_sample_filters(self):
+        sample = mommy.make(Sample, sample_id='BMH-2019-000001', project_id=self.project)
+        mommy.make(Sample, sample_id='BMH-2019-000002', project_id=self.project, hide_flag=True)
+        mommy.make(Sample, sample_id='BMH-2019-000003', project_id=self.other_project)
+        assert list(filter_by_project_permission(Sample.objects.all(), self.user, exclude_hidden=True)) == [sample]
+        assert get_selected_samples(['BMH-2019-000003', 'BMH-2019-000002', 'BMH-2019-000001'],
+                                    self.user) == [sample]
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from model_mommy import mommy
+
+from miseq_portal.miseq_viewer.models import Project, Run, Sample
+from miseq_portal.miseq_viewer.qaqc_report import parse_sample_id_list, iter_qaqc_samples, build_qaqc_row, \
+    write_qaqc_report, register_qaqc_report, get_qaqc_report_status, get_qaqc_report_dir
+
+
+def test_parse_sample_id_list():
+    assert parse_sample_id_list("3,1,2,") == [3, 1, 2]
+    assert parse_sample_id_list("") == []
+
+
+class QAQCReportTest(TestCase):
+    def setUp(self):
+        project = mommy.make(Project, project_id='TEST_PROJECT')
+        run = mommy.make(Run, run_id='TEST_RUN')
+        self.samples = mommy.make(Sample, project_id=project, run_id=run, _quantity=5)
+        self.sample_ids = [sample.pk for sample in reversed(self.samples)]
+
+    def test_iter_qaqc_samples_is_batched(self):
+        with self.assertNumQueries(3):
+            samples = list(iter_qaqc_samples(self.sample_ids + [0], batch_size=2))
+        assert [sample.pk for sample in samples] == self.sample_ids
+
+    def test_build_qaqc_row(self):
+        sample = next(iter_qaqc_samples(self.sample_ids[:1]))
+        row = build_qaqc_row(sample)
+        assert row['common'] == [sample.sample_id, sample.sample_name, 'TEST_PROJECT', 'TEST_RUN']
+        assert row['assembly'][-1] == sample.created.strftime('%Y-%m-%d')
+        assert row['confindr'] == ['NA'] * 6
+
+    def test_write_qaqc_report(self):
+        report_path = Path(tempfile.mkdtemp()) / 'qaqc_report.xlsx'
+        write_qaqc_report(self.sample_ids, report_path)
+        assert report_path.stat().st_size > 0
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QAQC_REPORT_TIMEOUT=60)
+class QAQCReportStatusTest(TestCase):
+    def test_working(self):
+        register_qaqc_report(user_id=1, token='working')
+        assert get_qaqc_report_status(user_id=1, token='working') == 'Working'
+
+    def test_complete(self):
+        register_qaqc_report(user_id=1, token='complete')
+        (get_qaqc_report_dir(1) / 'complete.xlsx').touch()
+        assert get_qaqc_report_status(user_id=1, token='complete') == 'Complete'
+
+    def test_failed(self):
+        register_qaqc_report(user_id=1, token='failed')
+        (get_qaqc_report_dir(1) / 'failed.failed').touch()
+        assert get_qaqc_report_status(user_id=1, token='failed') == 'Failed'
+
+    def test_past_deadline_is_failed(self):
+        requested_path = register_qaqc_report(user_id=1, token='expired')
+        requested = time.time() - 61
+        os.utime(str(requested_path), (requested, requested))
+        assert get_qaqc_report_status(user_id=1, token='expired') == 'Failed'
+
+    def test_unknown_token_is_failed(self):
+        assert get_qaqc_report_status(user_id=1, token='unknown') == 'Failed'
@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from model_mommy import mommy
+
+from miseq_portal.miseq_viewer.models import Project, Run, Sample
+from miseq_portal.miseq_viewer.statistics import get_portal_statistics, compute_portal_statistics, keys_delta, \
+    invalidate_portal_statistics
+
+
+def test_keys_delta():
+    delta = keys_delta(added=['number_of_runs', ('runs_per_run_type', 'EXT')],
+                       removed=['number_of_runs', ('runs_per_run_type', 'BMH')])
+    assert delta == {('runs_per_run_type', 'EXT'): 1, ('runs_per_run_type', 'BMH'): -1}
+
+
+# The statistics are updated in transaction.on_commit() callbacks, which never run inside a TestCase
+class PortalStatisticsTest(TransactionTestCase):
+    def setUp(self):
+        invalidate_portal_statistics()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_statistics_follow_changes(self):
+        project = mommy.make(Project)
+        run = mommy.make(Run, run_type='BMH')
+        sample = mommy.make(Sample, project_id=project, run_id=run, sample_type='BMH', sequencing_type='WGS')
+        statistics = get_portal_statistics()
+        assert statistics['number_of_projects'] == 1
+        assert statistics['number_of_runs'] == 1
+        assert statistics['number_of_samples'] == 1
+        assert statistics['samples_per_year'] == {str(sample.created.year): 1}
+
+        mommy.make(Sample, sample_type='EXT', sequencing_type='META')
+        sample.sequencing_type = 'RNA'
+        sample.save()
+        assert get_portal_statistics()['samples_per_sequencing_type'] == {'META': 1, 'RNA': 1}
+
+        # Cascades to the sample on the run
+        run.delete()
+
+        statistics = get_portal_statistics()
+        expected = compute_portal_statistics()
+        for key in ('number_of_projects', 'number_of_runs', 'number_of_samples', 'samples_per_year',
+                    'samples_per_sample_type', 'samples_per_sequencing_type', 'runs_per_run_type'):
+            assert statistics[key] == expected[key]
+        assert statistics['samples_per_sequencing_type'] == {'META': 1}
@@ -0,0 +1,34 @@
+from django.test import TestCase
+from model_mommy import mommy
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from miseq_portal.miseq_viewer.models import Project, Run, Sample
+from miseq_portal.miseq_viewer.views import SampleTableViewSet
+from miseq_portal.users.models import User
+
+
+class SampleTableViewSetTest(TestCase):
+    def setUp(self):
+        self.user = mommy.make(User, is_staff=True)
+        self.project = mommy.make(Project, project_id='TEST_PROJECT')
+        self.run = mommy.make(Run, run_id='TEST_RUN')
+        mommy.make(Sample, project_id=self.project, run_id=self.run, _quantity=10)
+        self.view = SampleTableViewSet.as_view({'get': 'list'})
+
+    def get(self, url: str):
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_sample_table_is_flat(self):
+        with self.assertNumQueries(2):
+            response = self.get('/miseq_viewer/api/sample_table/?format=json')
+            response.render()
+        row = response.data['results'][0]
+        assert row['project_id'] == 'TEST_PROJECT'
+        assert row['run_id'] == 'TEST_RUN'
+        assert row['top_hit'] is None
+
+    def test_sample_table_sparse_fields(self):
+        response = self.get('/miseq_viewer/api/sample_table/?format=json&fields=id,sample_id')
+        assert set(response.data['results'][0]) == {'id', 'sample_id'}
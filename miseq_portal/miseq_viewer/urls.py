@@ -8,7 +8,10 @@ from miseq_portal.miseq_viewer.views import (
     run_detail_view,
     sample_detail_view,
     qaqc_excel,
-    SampleViewSet, RunViewSet, ProjectViewSet
+    qaqc_report_view,
+    qaqc_report_status,
+    qaqc_report_download,
+    SampleViewSet, SampleTableViewSet, RunViewSet, ProjectViewSet
     # samples_api_view
 )
 
@@ -17,6 +20,7 @@ app_name = "miseq_viewer"
 # Django-rest-framework (https://django-rest-framework-datatables.readthedocs.io/en/latest/tutorial.html)
 router = routers.DefaultRouter()
 router.register(r'samples', SampleViewSet, basename='samples-detail')
+router.register(r'sample_table', SampleTableViewSet, basename='sample-table')
 router.register(r'runs', RunViewSet, basename='runs-detail')
 router.register(r'projects', ProjectViewSet, basename='projects-detail')
 
@@ -24,6 +28,11 @@ urlpatterns = [
     path("projects/", view=project_list_view, name="miseq_viewer_projects"),
     path("runs/", view=run_list_view, name="miseq_viewer_runs"),
     path('qaqcexcel/', view=qaqc_excel, name='miseq_viewer_qaqc_excel'),
+    re_path("^qaqcreport/(?P<token>[0-9a-f]{32})$", view=qaqc_report_view, name='miseq_viewer_qaqc_report'),
+    re_path("^qaqcreport/(?P<token>[0-9a-f]{32})/status$", view=qaqc_report_status,
+            name='miseq_viewer_qaqc_report_status'),
+    re_path("^qaqcreport/(?P<token>[0-9a-f]{32})/download$", view=qaqc_report_download,
+            name='miseq_viewer_qaqc_report_download'),
     # path("samples_api/", view=samples_api_view, name="miseq_viewer_samples_api"),
     re_path("^api/", include(router.urls), name="miseq_viewer_api"),
     re_path("^project/(?P<pk>\d+)$", view=project_detail_view, name="miseq_viewer_project_detail"),
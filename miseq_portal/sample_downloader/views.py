@@ -11,7 +11,7 @@ from miseq_portal.analysis.forms import AnalysisToolForm
 from miseq_portal.analysis.models import AnalysisSample, AnalysisGroup, SendsketchResult, MobSuiteAnalysisPlasmid, \
     MobSuiteAnalysisGroup, RGIResult, RGIGroupResult, ConfindrGroupResult, ConfindrResult
 from miseq_portal.analysis.tasks import submit_analysis_job
-from miseq_portal.miseq_viewer.models import Sample, UserProjectRelationship
+from miseq_portal.miseq_viewer.permissions import get_selected_samples
 from miseq_portal.sample_downloader.forms import DownloadToolForm
 
 logger = logging.getLogger('django')
@@ -21,20 +21,12 @@ class DownloaderSampleSelectView(LoginRequiredMixin, TemplateView):
     template_name = "sample_downloader/downloader_sample_select.html"
     success_url = 'sample_downloader/confirm/'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['approved_users'] = UserProjectRelationship.objects.filter(user_id=self.request.user)
-        return context
-
     def post(self, request, *args, **kwargs):
         # Grab sample list from user selection from the analysis_index.html page via AJAX
         sample_id_list = request.POST.getlist('sample_id_list[]')
 
         # Get corresponding Sample objects from user selection
-        sample_object_list = list()
-        for sample_id in sample_id_list:
-            sample_object = Sample.objects.get(sample_id=sample_id)
-            sample_object_list.append(sample_object)
+        sample_object_list = get_selected_samples(sample_id_list, request.user)
 
         # Create new AnalysisGroup
         analysis_group = AnalysisGroup(user=request.user)
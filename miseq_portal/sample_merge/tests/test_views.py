@@ -0,0 +1,32 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from model_mommy import mommy
+
+from miseq_portal.miseq_viewer.models import MergedSampleComponentGroup, Sample
+from miseq_portal.users.models import User
+
+
+@mock.patch('miseq_portal.sample_merge.views.merge_reads')
+class SampleMergeIndexViewTest(TestCase):
+    def setUp(self):
+        self.user = mommy.make(User, is_staff=True)
+        self.samples = [mommy.make(Sample, sample_id=f'BMH-2019-00000{i}') for i in range(1, 3)]
+        self.client.force_login(self.user)
+
+    def merge(self, sample_ids: list):
+        return self.client.post(reverse('sample_merge:sample_merge_index'), {'sample_id_list[]': sample_ids})
+
+    def test_merge(self, merge_reads):
+        response = self.merge(['BMH-2019-000001', 'BMH-2019-000002'])
+        assert response.json()['success']
+        group = MergedSampleComponentGroup.objects.get()
+        assert group.mergedsamplecomponent_set.count() == 2
+        merge_reads.apply_async.assert_called_once()
+
+    def test_selection_must_be_accessible(self, merge_reads):
+        response = self.merge(['BMH-2019-000001', 'BMH-2019-999999'])
+        assert response.status_code == 403
+        assert not MergedSampleComponentGroup.objects.exists()
+        merge_reads.apply_async.assert_not_called()
@@ -7,8 +7,8 @@ from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, TemplateView, DeleteView
 
-from miseq_portal.miseq_viewer.models import Sample, UserProjectRelationship, MergedSampleComponentGroup, \
-    MergedSampleComponent
+from miseq_portal.miseq_viewer.models import Sample, MergedSampleComponentGroup, MergedSampleComponent
+from miseq_portal.miseq_viewer.permissions import get_selected_samples
 from miseq_portal.sample_merge.tasks import merge_reads
 
 logger = logging.getLogger('django')
@@ -29,20 +29,17 @@ class SampleMergeIndexView(LoginRequiredMixin, ListView):
     model = Sample
     context_object_name = 'sample_list'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['approved_users'] = UserProjectRelationship.objects.filter(user_id=self.request.user)
-        return context
-
     def post(self, request, *args, **kwargs):
         # Grab sample list from user selection from the sample_merge_index.html page via AJAX
         sample_id_list = request.POST.getlist('sample_id_list[]')
 
         # Get corresponding Sample objects from user selection
-        sample_object_list = list()
-        for sample_id in sample_id_list:
-            sample_object = Sample.objects.get(sample_id=sample_id)
-            sample_object_list.append(sample_object)
+        sample_object_list = get_selected_samples(sample_id_list, request.user)
+
+        # Merging only the accessible part of a selection would silently produce a different sample
+        if not sample_object_list or len(sample_object_list) != len(set(sample_id_list)):
+            logger.warning(f'User "{request.user}" attempted to merge samples they cannot access: {sample_id_list}')
+            return JsonResponse({'success': False}, status=403)
 
         # Create new MergedSampleComponentGroup
         component_group = MergedSampleComponentGroup(user=request.user)
@@ -59,6 +56,9 @@ class SampleMergeIndexView(LoginRequiredMixin, ListView):
         merged_sample.sample_id = merged_sample.generate_sample_id()
         merged_sample.save()
 
+        # Store the summed read counts and yield of the components on the merged sample
+        merged_sample.update_merged_log_data()
+
         # Queue up job for concatenation with sample_object_list
         sample_object_id_list = [sample_object.id for sample_object in sample_object_list]
         merge_reads.apply_async(args=[],
@@ -84,7 +84,7 @@ class MergeSuccessView(LoginRequiredMixin, TemplateView):
         group_id = self.request.GET.get('group_id')
         merged_sample_id = self.request.GET.get('merged_sample_id')
         group = MergedSampleComponentGroup.objects.get(pk=group_id)
-        group_samples = MergedSampleComponent.objects.filter(group_id=group)
+        group_samples = MergedSampleComponent.objects.filter(group_id=group).select_related('component_id')
         merged_sample = Sample.objects.get(pk=merged_sample_id)
 
         context = {
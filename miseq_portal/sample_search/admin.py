@@ -1,3 +1,13 @@
 from django.contrib import admin
 
+from miseq_portal.sample_search.models import SampleSearchIndex
+
+
+class SampleSearchIndexAdmin(admin.ModelAdmin):
+    list_display = ['sample_id', 'kind', 'project_id', 'run_id', 'top_hit', 'hide_flag']
+    list_filter = ['kind', 'hide_flag']
+    search_fields = ['sample_id']
+
+
 # Register your models here.
+admin.site.register(SampleSearchIndex, SampleSearchIndexAdmin)
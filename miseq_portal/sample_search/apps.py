@@ -1,7 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class SampleSearchConfig(AppConfig):
     name = 'miseq_portal.sample_search'
     verbose_name = 'Sample Search'
 
+    def ready(self):
+        import miseq_portal.sample_search.signals  # noqa F401
+        from miseq_portal.sample_search.signals import sample_search_migrated
+        post_migrate.connect(sample_search_migrated, sender=self)
@@ -0,0 +1,191 @@
+"""
+Maintenance and querying of the sample search index (see SampleSearchIndex).
+
+The index is kept current by the receivers in sample_search.signals. Code that writes samples without sending signals
+(bulk_create, QuerySet.update) must call index_samples() or index_minion_samples() with the affected samples, and
+rebuild_search_index() repopulates the whole index (see the setup_sample_search management command).
+"""
+import logging
+
+from django.apps import apps
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from miseq_portal.miseq_viewer.models import Sample
+from miseq_portal.miseq_viewer.permissions import filter_by_project_permission
+from miseq_portal.sample_search.models import SampleSearchIndex
+from miseq_portal.users.models import User
+
+logger = logging.getLogger('django')
+
+INDEX_BATCH_SIZE = 1000
+
+TRIGRAM_INDEX_NAME = 'sample_search_document_trgm'
+
+
+def build_document(*values) -> str:
+    """ Joins the searchable values of a sample into a single lowercased string """
+    return " ".join(str(value) for value in values if value).lower()
+
+
+def get_minion_sample_model():
+    # Imported lazily as minion_viewer.models imports miseq_viewer.models
+    return apps.get_model('minion_viewer', 'MinIONSample')
+
+
+def sample_index_values(sample: Sample) -> dict:
+    """ :return: SampleSearchIndex field values for a Sample, ideally fetched with select_related """
+    project_id = sample.project_id.project_id if sample.project_id is not None else ''
+    run_id = sample.run_id.run_id if sample.run_id is not None else ''
+    try:
+        top_hit = sample.mashresult.top_hit or ''
+    except ObjectDoesNotExist:
+        top_hit = ''
+    return {
+        'sample_id': sample.sample_id,
+        'sample_name': sample.sample_name,
+        'project_id': project_id,
+        'run_id': run_id,
+        'top_hit': top_hit,
+        'created': sample.created,
+        'project_pk': sample.project_id_id,
+        'run_pk': sample.run_id_id,
+        'hide_flag': sample.hide_flag,
+        'document': build_document(sample.sample_id, sample.sample_name, project_id, run_id, top_hit),
+    }
+
+
+def minion_sample_index_values(sample) -> dict:
+    """ :return: SampleSearchIndex field values for a MinIONSample, ideally fetched with select_related """
+    project_id = sample.project_id.project_id if sample.project_id is not None else ''
+    run_id = sample.run_id.run_id if sample.run_id is not None else ''
+    return {
+        'sample_id': sample.sample_id,
+        'sample_name': sample.sample_name,
+        'project_id': project_id,
+        'run_id': run_id,
+        'top_hit': '',
+        'created': sample.created,
+        'project_pk': sample.project_id_id,
+        'run_pk': sample.run_id_id,
+        'hide_flag': False,
+        'document': build_document(sample.sample_id, sample.sample_name, project_id, run_id),
+    }
+
+
+def index_sample(sample: Sample) -> SampleSearchIndex:
+    entry, _ = SampleSearchIndex.objects.update_or_create(kind='MISEQ', object_pk=sample.pk,
+                                                          defaults=sample_index_values(sample))
+    return entry
+
+
+def index_minion_sample(sample) -> SampleSearchIndex:
+    entry, _ = SampleSearchIndex.objects.update_or_create(kind='MINION', object_pk=sample.pk,
+                                                          defaults=minion_sample_index_values(sample))
+    return entry
+
+
+def remove_from_index(kind: str, object_pk: int):
+    SampleSearchIndex.objects.filter(kind=kind, object_pk=object_pk).delete()
+
+
+def replace_index_entries(kind: str, entries: [SampleSearchIndex]):
+    """ Replaces the index entries of a batch of samples with a delete and a bulk insert """
+    with transaction.atomic():
+        SampleSearchIndex.objects.filter(kind=kind, object_pk__in=[entry.object_pk for entry in entries]).delete()
+        SampleSearchIndex.objects.bulk_create(entries)
+
+
+def index_samples(queryset) -> int:
+    """
+    Re-indexes every Sample of a queryset in batches of INDEX_BATCH_SIZE
+    :return: Number of samples indexed
+    """
+    queryset = queryset.select_related('project_id', 'run_id', 'mashresult').order_by('pk')
+    total = 0
+    batch = []
+    for sample in queryset.iterator(chunk_size=INDEX_BATCH_SIZE):
+        batch.append(SampleSearchIndex(kind='MISEQ', object_pk=sample.pk, **sample_index_values(sample)))
+        if len(batch) == INDEX_BATCH_SIZE:
+            replace_index_entries('MISEQ', batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        replace_index_entries('MISEQ', batch)
+        total += len(batch)
+    return total
+
+
+def index_minion_samples(queryset) -> int:
+    """
+    Re-indexes every MinIONSample of a queryset in batches of INDEX_BATCH_SIZE
+    :return: Number of samples indexed
+    """
+    queryset = queryset.select_related('project_id', 'run_id').order_by('pk')
+    total = 0
+    batch = []
+    for sample in queryset.iterator(chunk_size=INDEX_BATCH_SIZE):
+        batch.append(SampleSearchIndex(kind='MINION', object_pk=sample.pk, **minion_sample_index_values(sample)))
+        if len(batch) == INDEX_BATCH_SIZE:
+            replace_index_entries('MINION', batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        replace_index_entries('MINION', batch)
+        total += len(batch)
+    return total
+
+
+def rebuild_search_index() -> int:
+    """
+    Repopulates the whole index from Sample and MinIONSample
+    :return: Number of samples indexed
+    """
+    with transaction.atomic():
+        SampleSearchIndex.objects.all().delete()
+        total = index_samples(Sample.objects.all())
+        total += index_minion_samples(get_minion_sample_model().objects.all())
+    logger.info(f"Indexed {total} samples for search")
+    return total
+
+
+def create_trigram_index(using: str = DEFAULT_DB_ALIAS):
+    """
+    Enables the pg_trgm extension and creates the GIN index that lets LIKE '%term%' queries on
+    SampleSearchIndex.document use an index. Creating the extension requires sufficient database privileges.
+    """
+    table = SampleSearchIndex._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX_NAME} ON {table} "
+                       f"USING gin (document gin_trgm_ops)")
+
+
+def setup_sample_search(using: str = DEFAULT_DB_ALIAS):
+    """
+    Prepares the database for sample search: creates the trigram extension and index, and populates the index from
+    the existing samples if it is empty. Runs after every migrate (see SampleSearchConfig.ready()) so that a new
+    deployment, and the test database, are searchable without further steps.
+    """
+    if connections[using].vendor != 'postgresql':
+        logger.warning("Sample search requires PostgreSQL, skipping setup of the trigram index")
+        return
+    create_trigram_index(using=using)
+    if not SampleSearchIndex.objects.using(using).exists():
+        rebuild_search_index()
+
+
+def search_samples(search_term: str, user: User):
+    """
+    Finds the samples whose search document contains search_term, ranked by trigram similarity
+    :param search_term: Case-insensitive search term
+    :param user: User performing the search; only samples in the projects they have access to are returned, unless
+    they are staff
+    :return: Queryset of SampleSearchIndex annotated with similarity
+    """
+    search_term = search_term.strip().lower()
+    queryset = SampleSearchIndex.objects.filter(hide_flag=False, document__contains=search_term)
+    queryset = filter_by_project_permission(queryset, user, project_field='project_pk')
+    queryset = queryset.annotate(similarity=TrigramSimilarity('document', search_term))
+    return queryset.order_by('-similarity', 'sample_id')
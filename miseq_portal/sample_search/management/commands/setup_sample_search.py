@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from miseq_portal.sample_search.index import create_trigram_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Enables the pg_trgm extension, creates the trigram GIN index on the sample search documents and ' \
+           'optionally rebuilds the sample search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Repopulate the search index from every Sample and MinIONSample')
+
+    def handle(self, *args, **options):
+        create_trigram_index()
+        self.stdout.write(self.style.SUCCESS('Trigram index is in place'))
+
+        if options['rebuild']:
+            total = rebuild_search_index()
+            self.stdout.write(self.style.SUCCESS(f'DONE! Indexed {total} samples'))
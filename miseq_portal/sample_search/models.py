@@ -1,3 +1,40 @@
 from django.db import models
 
-# Create your models here.
+
+class SampleSearchIndex(models.Model):
+    """
+    Denormalized search document for a single MiSeq Sample or MinIONSample, maintained by the receivers in
+    sample_search.signals. document holds the lowercased sample ID, sample name, project ID, run ID and top hit so a
+    search is a single LIKE against one column, backed by the trigram GIN index created by the setup_sample_search
+    management command.
+    """
+    SAMPLE_KINDS = (
+        ('MISEQ', 'MiSeq'),
+        ('MINION', 'MinION'),
+    )
+    kind = models.CharField(max_length=6, choices=SAMPLE_KINDS)
+    # Primary key of the Sample or MinIONSample
+    object_pk = models.IntegerField()
+
+    # Display fields
+    sample_id = models.CharField(max_length=15)
+    sample_name = models.TextField(blank=True)
+    project_id = models.CharField(max_length=256, blank=True)
+    run_id = models.CharField(max_length=256, blank=True)
+    top_hit = models.CharField(max_length=256, blank=True)
+    created = models.DateTimeField(null=True)
+
+    # Used to restrict results to the projects a user has access to, and to leave out hidden samples
+    project_pk = models.IntegerField(null=True, db_index=True)
+    run_pk = models.IntegerField(null=True, db_index=True)
+    hide_flag = models.BooleanField(default=False)
+
+    document = models.TextField()
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.sample_id}"
+
+    class Meta:
+        verbose_name = 'Sample Search Index'
+        verbose_name_plural = 'Sample Search Index'
+        unique_together = (('kind', 'object_pk'),)
@@ -0,0 +1,87 @@
+"""
+Keeps the sample search index (see sample_search.index) up to date as samples, their Mash results, and the projects
+and runs they belong to are saved and deleted. Connected in SampleSearchConfig.ready().
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from miseq_portal.analysis.models import MashResult
+from miseq_portal.miseq_viewer.models import Project, Run, Sample
+from miseq_portal.sample_search.index import index_sample, index_minion_sample, index_samples, \
+    index_minion_samples, remove_from_index, get_minion_sample_model, setup_sample_search
+
+
+def sample_search_migrated(sender, using: str, **kwargs):
+    """ post_migrate receiver for the sample_search app, connected in SampleSearchConfig.ready() """
+    setup_sample_search(using=using)
+
+
+def stored_value(model, instance, field: str):
+    """ :return: Value of field currently stored in the database for instance, or None for a new instance """
+    if instance.pk is None or instance._state.adding:
+        return None
+    return model.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Sample)
+def sample_saved(sender, instance, **kwargs):
+    index_sample(instance)
+
+
+@receiver(post_delete, sender=Sample)
+def sample_deleted(sender, instance, **kwargs):
+    remove_from_index('MISEQ', instance.pk)
+
+
+@receiver(post_save, sender='minion_viewer.MinIONSample')
+def minion_sample_saved(sender, instance, **kwargs):
+    index_minion_sample(instance)
+
+
+@receiver(post_delete, sender='minion_viewer.MinIONSample')
+def minion_sample_deleted(sender, instance, **kwargs):
+    remove_from_index('MINION', instance.pk)
+
+
+@receiver(post_save, sender=MashResult)
+@receiver(post_delete, sender=MashResult)
+def mash_result_changed(sender, instance, **kwargs):
+    index_samples(Sample.objects.filter(pk=instance.sample_id_id))
+
+
+@receiver(pre_save, sender=Project)
+def project_pre_save(sender, instance, **kwargs):
+    instance._search_previous_project_id = stored_value(Project, instance, 'project_id')
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, created, **kwargs):
+    # Only a rename changes the indexed documents of the project's samples
+    previous = getattr(instance, '_search_previous_project_id', None)
+    if not created and previous is not None and previous != instance.project_id:
+        index_samples(Sample.objects.filter(project_id=instance))
+        index_minion_samples(get_minion_sample_model().objects.filter(project_id=instance))
+
+
+@receiver(pre_save, sender=Run)
+def run_pre_save(sender, instance, **kwargs):
+    instance._search_previous_run_id = stored_value(Run, instance, 'run_id')
+
+
+@receiver(post_save, sender=Run)
+def run_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_search_previous_run_id', None)
+    if not created and previous is not None and previous != instance.run_id:
+        index_samples(Sample.objects.filter(run_id=instance))
+
+
+@receiver(pre_save, sender='minion_viewer.MinIONRun')
+def minion_run_pre_save(sender, instance, **kwargs):
+    instance._search_previous_run_id = stored_value(sender, instance, 'run_id')
+
+
+@receiver(post_save, sender='minion_viewer.MinIONRun')
+def minion_run_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_search_previous_run_id', None)
+    if not created and previous is not None and previous != instance.run_id:
+        index_minion_samples(get_minion_sample_model().objects.filter(run_id=instance))
@@ -1,6 +1,83 @@
 import json
 from django.test import TestCase
 from django.urls import reverse
+from model_mommy import mommy
 
+from miseq_portal.analysis.models import MashResult
+from miseq_portal.miseq_viewer.models import Project, Run, Sample, UserProjectRelationship
+from miseq_portal.sample_search.index import build_document
+from miseq_portal.sample_search.models import SampleSearchIndex
+from miseq_portal.users.models import User
 
 
+def test_build_document():
+    assert build_document('BMH-2019-000001', None, 'Salmonella', '') == 'bmh-2019-000001 salmonella'
+
+
+class SampleSearchAPITest(TestCase):
+    def setUp(self):
+        self.user = mommy.make(User)
+        self.project = mommy.make(Project, project_id='LISTERIA_PROJECT')
+        self.other_project = mommy.make(Project, project_id='OTHER_PROJECT')
+        mommy.make(UserProjectRelationship, project_id=self.project, user_id=self.user, access_level='USER')
+        self.run = mommy.make(Run, run_id='TEST_RUN')
+        self.sample = mommy.make(Sample, sample_id='BMH-2019-000001', project_id=self.project, run_id=self.run)
+        mommy.make(Sample, sample_id='BMH-2019-000002', project_id=self.other_project, run_id=self.run)
+        self.client.force_login(self.user)
+
+    def search(self, term: str) -> dict:
+        response = self.client.get(reverse('sample_search:sample_search_api'), {'q': term})
+        return json.loads(response.content)
+
+    def test_index_follows_signals(self):
+        MashResult.objects.create(sample_id=self.sample, top_hit='Listeria monocytogenes')
+        index_entry = SampleSearchIndex.objects.get(kind='MISEQ', object_pk=self.sample.pk)
+        assert 'listeria monocytogenes' in index_entry.document
+
+        self.run.run_id = 'RENAMED_RUN'
+        self.run.save()
+        assert SampleSearchIndex.objects.get(kind='MISEQ', object_pk=self.sample.pk).run_id == 'RENAMED_RUN'
+
+        self.sample.delete()
+        assert not SampleSearchIndex.objects.filter(kind='MISEQ', object_pk=self.sample.pk).exists()
+
+    def test_search_is_limited_to_user_projects(self):
+        data = self.search('BMH-2019')
+        assert data['count'] == 1
+        result = data['results'][0]
+        assert result['sample_id'] == 'BMH-2019-000001'
+        assert result['sample_url'] == reverse('miseq_viewer:miseq_viewer_sample_detail',
+                                               kwargs={'pk': self.sample.pk})
+
+        self.sample.hide_flag = True
+        self.sample.save()
+        assert self.search('BMH-2019')['count'] == 0
+
+
+class SampleSearchViewAsJSONTest(TestCase):
+    def setUp(self):
+        self.user = mommy.make(User, is_staff=True)
+        self.project = mommy.make(Project, project_id='TEST_PROJECT')
+        self.run = mommy.make(Run, run_id='TEST_RUN')
+        mommy.make(Sample, project_id=self.project, run_id=self.run, sample_type='BMH', _quantity=5)
+        mommy.make(Sample, sample_type='EXT', _quantity=2)
+        mommy.make(Sample, hide_flag=True)
+        self.client.force_login(self.user)
+
+    def get_json(self, **params) -> list:
+        response = self.client.get(reverse('sample_search:sample_search_view_json'), params)
+        assert response.streaming
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_streams_visible_samples(self):
+        samples = self.get_json()
+        assert len(samples) == 7
+        assert samples[0]['project_id'] == 'TEST_PROJECT'
+        assert samples[0]['run_id'] == 'TEST_RUN'
+        assert samples[-1]['project_id'] == ''
+
+    def test_filters_and_slicing(self):
+        assert len(self.get_json(sample_type='EXT')) == 2
+        assert len(self.get_json(run_id='TEST_RUN', offset=1, limit=3)) == 3
+        assert len(self.get_json(offset=6)) == 1
+        assert self.client.get(reverse('sample_search:sample_search_view_json'), {'limit': 'ten'}).status_code == 400
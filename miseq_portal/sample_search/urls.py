@@ -2,11 +2,13 @@ from django.urls import path, re_path
 
 from miseq_portal.sample_search.views import (
     sample_search_view,
-    sample_search_view_json
+    sample_search_view_json,
+    sample_search_api_view
 )
 
 app_name = "sample_search"
 urlpatterns = [
     path("", view=sample_search_view, name="sample_search"),
+    path("api/search", view=sample_search_api_view, name="sample_search_api"),
     re_path("^sample_search_view_json", view=sample_search_view_json, name="sample_search_view_json"),
 ]
@@ -1,81 +1,181 @@
+import json
+
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Q
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.generic import ListView, View
 
-from miseq_portal.miseq_viewer.models import Sample, UserProjectRelationship
-from miseq_portal.minion_viewer.models import MinIONSample
+from miseq_portal.miseq_viewer.models import Sample
+from miseq_portal.miseq_viewer.permissions import filter_by_project_permission
+from miseq_portal.sample_search.index import search_samples
+from miseq_portal.sample_search.models import SampleSearchIndex
 
 
 class SampleSearchViewAsJSON(LoginRequiredMixin, View):
+    """
+    Streams every visible Sample as a JSON array, built from a single values() join and read through a server-side
+    cursor so memory use stays constant regardless of the number of samples.
+    Query parameters:
+        project_id, run_id, sample_type, sequencing_type: exact match filters
+        search_term: case-insensitive match against the sample ID or sample name
+        offset, limit: page through the results, which are ordered by primary key
+    """
+    FIELDS = (
+        'id',
+        'sample_id',
+        'sample_name',
+        'sample_type',
+        'sequencing_type',
+        'created',
+    )
+    FILTERS = {
+        'project_id': 'project_id__project_id',
+        'run_id': 'run_id__run_id',
+        'sample_type': 'sample_type',
+        'sequencing_type': 'sequencing_type',
+    }
+
+    def get_queryset(self):
+        queryset = filter_by_project_permission(Sample.objects.filter(hide_flag=False), self.request.user)
+
+        for parameter, lookup in self.FILTERS.items():
+            value = self.request.GET.get(parameter)
+            if value:
+                queryset = queryset.filter(**{lookup: value})
+
+        search_term = self.request.GET.get('search_term')
+        if search_term:
+            queryset = queryset.filter(Q(sample_id__icontains=search_term) | Q(sample_name__icontains=search_term))
+
+        # The related IDs are renamed in stream_json_array, as values() can't alias them over the foreign key names
+        return queryset.order_by('pk').values(*self.FIELDS, 'project_id__project_id', 'run_id__run_id')
+
+    @staticmethod
+    def get_slice(request) -> (int, int):
+        """ :return: (offset, limit) from the query string; limit is None when the full remainder is requested """
+        try:
+            offset = max(0, int(request.GET.get('offset', 0)))
+            limit = request.GET.get('limit')
+            limit = max(0, int(limit)) if limit is not None else None
+        except ValueError:
+            raise ValueError("offset and limit must be integers")
+        return offset, limit
+
+    @staticmethod
+    def stream_json_array(rows):
+        yield '['
+        for i, row in enumerate(rows):
+            row['project_id'] = row.pop('project_id__project_id') or ''
+            row['run_id'] = row.pop('run_id__run_id') or ''
+            if i:
+                yield ','
+            yield json.dumps(row, cls=DjangoJSONEncoder)
+        yield ']'
+
     def get(self, request):
-        queryset = Sample.objects.filter(hide_flag=False)
-        updated_object_list = []
-        for obj in queryset:
-            # Try to get project ID
-            try:
-                project = obj.project_id.project_id
-            except AttributeError:
-                project = ''
-
-            # Try to get run ID
-            try:
-                run = obj.run_id.run_id
-            except AttributeError:
-                run = ''
-
-            # Create new dict
-            updated_object_list.append({
-                'project_id': project,
-                'run_id': run
-            })
-
-        # Dump to JSON
-        # object_list_json = json.dumps(updated_object_list)
-
-        # serialized_json = serializers.serialize('json', object_list_json)
-        # return HttpResponse(serialized_json, content_type='application/json')
-        response = JsonResponse(updated_object_list, safe=False)
-        return response
+        try:
+            offset, limit = self.get_slice(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        queryset = self.get_queryset()
+        queryset = queryset[offset:offset + limit] if limit is not None else queryset[offset:]
+        rows = queryset.iterator(chunk_size=settings.SAMPLE_SEARCH_STREAM_CHUNK_SIZE)
+        return StreamingHttpResponse(self.stream_json_array(rows), content_type='application/json')
 
 
 sample_search_view_json = SampleSearchViewAsJSON.as_view()
 
 
-# TODO: Refactor to utilize the API + django-rest-framework-datatables
+def get_search_term(request) -> str:
+    return (request.GET.get('search_term') or request.GET.get('q') or '').strip()
+
+
+def get_page_size(request) -> int:
+    try:
+        page_size = int(request.GET.get('page_size', settings.SAMPLE_SEARCH_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.SAMPLE_SEARCH_PAGE_SIZE
+    return max(1, min(page_size, settings.SAMPLE_SEARCH_MAX_PAGE_SIZE))
+
+
+def search_result_urls(entry: SampleSearchIndex) -> dict:
+    """ :return: Detail page URLs for the sample, run and project of a search result """
+    if entry.kind == 'MINION':
+        sample_url = reverse('minion_viewer:minion_sample_detail', kwargs={'pk': entry.object_pk})
+        run_url = reverse('minion_viewer:minion_run_detail', kwargs={'pk': entry.run_pk}) if entry.run_pk else None
+    else:
+        sample_url = reverse('miseq_viewer:miseq_viewer_sample_detail', kwargs={'pk': entry.object_pk})
+        run_url = reverse('miseq_viewer:miseq_viewer_run_detail', kwargs={'pk': entry.run_pk}) if entry.run_pk else None
+    project_url = reverse('miseq_viewer:miseq_viewer_project_detail',
+                          kwargs={'pk': entry.project_pk}) if entry.project_pk else None
+    return {'sample_url': sample_url, 'run_url': run_url, 'project_url': project_url}
+
+
+def search_result_as_dict(entry: SampleSearchIndex) -> dict:
+    return {
+        'kind': entry.kind,
+        'sample_id': entry.sample_id,
+        'sample_name': entry.sample_name,
+        'project_id': entry.project_id,
+        'run_id': entry.run_id,
+        'top_hit': entry.top_hit,
+        'created': entry.created.isoformat() if entry.created else None,
+        'similarity': entry.similarity,
+        **search_result_urls(entry),
+    }
+
+
+class SampleSearchAPIView(LoginRequiredMixin, View):
+    """
+    Ranked, paginated search over MiSeq and MinION samples.
+    Query parameters: q (or search_term), page, page_size
+    """
+
+    def get(self, request):
+        search_term = get_search_term(request)
+        if not search_term:
+            return JsonResponse({'error': 'Please provide a search term with the q parameter'}, status=400)
+
+        paginator = Paginator(search_samples(search_term, request.user), get_page_size(request))
+        page = paginator.get_page(request.GET.get('page'))
+        return JsonResponse({
+            'search_term': search_term,
+            'count': paginator.count,
+            'page': page.number,
+            'num_pages': paginator.num_pages,
+            'results': [search_result_as_dict(entry) for entry in page],
+        })
+
+
+sample_search_api_view = SampleSearchAPIView.as_view()
+
+
 class SampleSearchView(LoginRequiredMixin, ListView):
-    model = Sample
+    """
+    Renders one page of ranked search results for MiSeq and MinION samples from the sample search index
+    """
     template_name = 'sample_search/sample_search.html'
-    context_object_name = 'sample_list'
+    context_object_name = 'search_results'
+
+    def get_paginate_by(self, queryset) -> int:
+        return get_page_size(self.request)
+
+    def get_queryset(self):
+        search_term = get_search_term(self.request)
+        if not search_term:
+            return SampleSearchIndex.objects.none()
+        return search_samples(search_term, self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        search_term = self.request.GET.get('search_term')
-
-        # Queries various fields from Sample as well as the top_hit from MashResult
-        # prefetch_related joins Sample and MashResult on the OneToOne field sample_id
-        sample_list = self.model.objects.prefetch_related('mashresult').filter(
-            Q(sample_id__icontains=search_term) |
-            Q(project_id__project_id__icontains=search_term) |
-            Q(sample_name__icontains=search_term) |
-            Q(run_id__run_id__icontains=search_term) |
-            Q(mashresult__top_hit__icontains=search_term)
-        )
-
-        minion_sample_list = MinIONSample.objects.filter(
-            Q(sample_id__icontains=search_term) |
-            Q(sample_name__icontains=search_term) |
-            Q(project_id__project_id__icontains=search_term) |
-            Q(run_id__run_id__icontains=search_term)
-        )
-
-        # Filter out hidden samples
-        sample_list = sample_list.filter(hide_flag=False)
-
-        context['search_term'] = search_term
-        context['sample_list'] = sample_list
-        context['minion_sample_list'] = minion_sample_list
-        context['approved_users'] = UserProjectRelationship.objects.filter(user_id=self.request.user).order_by('id')
+        context['search_term'] = get_search_term(self.request)
+        for entry in context['search_results']:
+            entry.urls = search_result_urls(entry)
         return context
 
 
@@ -6,7 +6,7 @@ from django.urls import reverse_lazy
 from django.views.generic import TemplateView, CreateView, DetailView, DeleteView
 from rest_framework import viewsets, mixins, filters
 
-from miseq_portal.miseq_viewer.models import Sample
+from miseq_portal.miseq_viewer.permissions import get_selected_samples
 from miseq_portal.sample_workbooks.forms import WorkbookForm
 from miseq_portal.sample_workbooks.models import Workbook, WorkbookSample
 from miseq_portal.sample_workbooks.serializers import WorkbookSerializer, WorkbookSampleSerializer
@@ -56,8 +56,7 @@ class CreateNewWorkbookView(LoginRequiredMixin, CreateView):
         sample_id_list = sample_id_list_raw.split(",")
 
         # Get corresponding Sample objects from user selection
-        for sample_id in sample_id_list:
-            sample_object = Sample.objects.get(sample_id=sample_id)
+        for sample_object in get_selected_samples(sample_id_list, self.request.user):
             workbooksample_object = WorkbookSample.objects.create(sample=sample_object, workbook=form.instance)
             workbooksample_object.save()
 